@@ -1,3 +1,7 @@
 from .randvar import *
 from .randvec import *
 from . import discrete
+from .profiling import profile, ProfileReport
+from .estimate import Estimate
+from .export import export_samples, SampleWriter
+from .discrete.planner import evaluate
@@ -1,5 +1,19 @@
 from .randvar import *
 from .root_randvar import RootDiscreteRandVar
 from .unary_randvar import *
+from .closed_form_randvar import AffineDiscreteRandVar, BinomialSumDiscreteRandVar
+from .binary_randvar import BinaryDiscreteRandVar
+from .order_randvar import MaximumDiscreteRandVar, MinimumDiscreteRandVar, ComparisonDiscreteRandVar
 from .special_randvar import *
+from .truncated_randvar import *
+from .array_randvar import ArrayRootDiscreteRandVar, ColumnDiscreteRandVar
+from .markov_randvar import MarkovChainRandVar, MarkovStateRandVar, MarkovSumRandVar
 from .randvec import *
+from .conditional_randvar import *
+from .serialize import serialize, save, load, SerializedModel
+from .store import GraphStore, NodeHandle
+from .cache import persistent_cache, PersistentCache
+from .sweep import sweep, SweepResult
+from .sensitivity import Sensitivity
+from .approximation import Approximation
+from .planner import evaluate
@@ -0,0 +1,270 @@
+from ..estimate import normal_cdf, normal_pdf, normal_quantile
+from .randvar import ConstantPlusDiscreteRandVar, ConstantTimesDiscreteRandVar, DiscretePlusDiscreteRandVar, \
+    _pmf_arrays
+from .closed_form_randvar import AffineDiscreteRandVar, BinomialSumDiscreteRandVar
+from .special_randvar import BernoulliRandVar, BinomialRandVar
+
+from fractions import Fraction
+import math
+import numpy as np
+
+
+# The Berry-Esseen constant for sums of independent random variables that
+# are not necessarily identically distributed (Shevtsova, 2010)
+BERRY_ESSEEN_CONSTANT = 0.56
+
+METHODS = ['normal', 'edgeworth']
+
+
+class Approximation:
+    '''
+    An approximation of the distribution of a discrete random variable by
+    the central limit theorem. The normal approximation matches the exact
+    mean and variance. The Edgeworth approximation also corrects for the
+    skewness and excess kurtosis, which are found from the cumulants of
+    the random variable.
+
+    The random variable is split into independent summands wherever it is
+    a sum, or an affine map of a sum, of random variables that share no
+    roots. Cumulants and third absolute moments of the summands add up,
+    so only the mass functions of the summands are ever needed, never that
+    of the whole sum. A random variable that cannot be split is a single
+    summand.
+
+    Random variables whose values lie on a lattice a + k * h, such as
+    sums of integer-valued random variables, have a distribution function
+    that jumps at every point of the lattice, which a smooth approximation
+    cannot follow. Both approximations are therefore evaluated halfway
+    between consecutive points of the lattice, at a + (k + 1/2) * h for the
+    largest point a + k * h at most x. This continuity correction is the
+    lattice term of the Edgeworth expansion (Esseen, 1945), and without it
+    the expansion is no more accurate than the normal approximation.
+
+    The error bound is the Berry-Esseen bound on the largest difference
+    between the exact distribution function and the normal one,
+    C * sum of E|X_i - E[X_i]|^3 / sd^3 over the summands. It holds for the
+    normal approximation of cdf() and tail_probability(), and is usually
+    loose for the Edgeworth approximation, which tends to be more accurate.
+    It is capped at 1.
+    '''
+
+    def __init__(self, rv, method='normal'):
+        '''
+        Args:
+            rv: The discrete random variable to approximate
+            method: Either 'normal' or 'edgeworth'
+        '''
+
+        if method not in METHODS:
+            raise ValueError("Approximation must be one of {}".format(', '.join(METHODS)))
+        self.method = method
+
+        summands, shift = _summands(rv, 1)
+        mean, variance = shift, 0
+        third_cumulant = 0
+        fourth_cumulant = 0
+        absolute_moment = 0
+        for summand, scale in summands:
+            moments = _moments(summand)
+            mean += moments[0] * scale
+            variance += moments[1] * scale ** 2
+            third_cumulant += moments[2] * scale ** 3
+            fourth_cumulant += moments[3] * scale ** 4
+            absolute_moment += moments[4] * abs(scale) ** 3
+        # The moments of a split random variable are found from those of the
+        # summands, never by walking down the sum, which may be deep
+        if len(summands) == 1 and summands[0][0] is rv:
+            mean, variance = rv.mean(), rv.variance()
+        self.mean = mean
+        self.standard_deviation = math.sqrt(max(variance, 0))
+        # The lattice of a sum has the sum of the offsets of the lattices of
+        # the summands as an offset, and the gcd of their spans as its span
+        self.lattice_offset = shift
+        self.lattice_span = 0
+        for summand, scale in summands:
+            lattice = _lattice(summand, scale)
+            if lattice is None:
+                self.lattice_span = None
+                break
+            self.lattice_offset += lattice[0]
+            self.lattice_span = _gcd(self.lattice_span, lattice[1])
+        if not self.lattice_span:
+            self.lattice_offset = None
+            self.lattice_span = None
+        else:
+            self.lattice_span = float(self.lattice_span)
+
+        sd = self.standard_deviation
+        if sd > 0:
+            self.skewness = third_cumulant / sd ** 3
+            self.excess_kurtosis = fourth_cumulant / sd ** 4
+            self.error_bound = min(BERRY_ESSEEN_CONSTANT * absolute_moment / sd ** 3, 1.0)
+        else:
+            self.skewness = 0
+            self.excess_kurtosis = 0
+            self.error_bound = 0.0
+
+
+    def cdf(self, x):
+        '''
+        Args:
+            x: The point to evaluate the distribution function at
+
+        Returns:
+            The approximation of P(X <= x)
+        '''
+
+        if self.standard_deviation == 0:
+            return 1.0 if x >= self.mean else 0.0
+        z = (self._halfway(x) - self.mean) / self.standard_deviation
+        return min(max(normal_cdf(z) - self._correction(z), 0.0), 1.0)
+
+
+    def tail_probability(self, x):
+        '''
+        Calculated from the upper tail of the normal distribution rather
+        than as 1 - cdf(x), so that small tail probabilities keep their
+        precision.
+
+        Args:
+            x: The threshold of the tail
+
+        Returns:
+            The approximation of P(X > x)
+        '''
+
+        if self.standard_deviation == 0:
+            return 0.0 if x >= self.mean else 1.0
+        z = (self._halfway(x) - self.mean) / self.standard_deviation
+        return min(max(normal_cdf(-z) + self._correction(z), 0.0), 1.0)
+
+
+    def quantile(self, q):
+        '''
+        The Edgeworth quantile is found by the Cornish-Fisher expansion.
+        Unlike the exact quantile, the approximation need not be a value in
+        the support, though on a lattice it is the smallest point of the
+        lattice at which the approximate cdf() reaches {q}.
+
+        Args:
+            q: A probability strictly between 0 and 1
+
+        Returns:
+            The approximation of the {q}-quantile
+        '''
+
+        if not 0 < q < 1:
+            raise ValueError("Approximate quantiles are only defined strictly between 0 and 1")
+        z = normal_quantile(q)
+        if self.method == 'edgeworth':
+            g1, g2 = self.skewness, self.excess_kurtosis
+            z += (z * z - 1) * g1 / 6 + (z ** 3 - 3 * z) * g2 / 24 - (2 * z ** 3 - 5 * z) * g1 * g1 / 36
+        x = self.mean + self.standard_deviation * z
+        if self.lattice_span is None:
+            return x
+        # Undo the continuity correction of cdf()
+        k = math.ceil((x - self.lattice_offset) / self.lattice_span - 0.5 - 1e-9)
+        return self.lattice_offset + k * self.lattice_span
+
+
+    def _halfway(self, x):
+        '''Moves a point halfway between the largest point of the lattice
+        that is at most x and the next'''
+
+        if self.lattice_span is None:
+            return x
+        k = math.floor((x - self.lattice_offset) / self.lattice_span + 1e-9)
+        return self.lattice_offset + (k + 0.5) * self.lattice_span
+
+
+    def _correction(self, z):
+        '''Returns the amount that the Edgeworth expansion subtracts from
+        the normal distribution function at z'''
+
+        if self.method == 'normal':
+            return 0
+        g1, g2 = self.skewness, self.excess_kurtosis
+        # The Hermite polynomials He_2, He_3 and He_5
+        he2 = z * z - 1
+        he3 = z ** 3 - 3 * z
+        he5 = z ** 5 - 10 * z ** 3 + 15 * z
+        return normal_pdf(z) * (g1 / 6 * he2 + g2 / 24 * he3 + g1 * g1 / 72 * he5)
+
+
+def _summands(rv, scale):
+    '''Splits a random variable into independent summands, returned as a
+    list of (summand, scale) pairs along with the sum of the constant
+    shifts, which do not affect the shape of the distribution'''
+
+    summands = []
+    shift = 0
+    stack = [(rv, scale)]
+    while len(stack) > 0:
+        rv, scale = stack.pop()
+        if isinstance(rv, ConstantPlusDiscreteRandVar):
+            shift += scale * rv.c
+            stack.append((rv.rv, scale))
+        elif isinstance(rv, ConstantTimesDiscreteRandVar):
+            stack.append((rv.rv, scale * rv.c))
+        elif isinstance(rv, AffineDiscreteRandVar):
+            shift += scale * rv.shift
+            stack.append((rv.rv, scale * rv.scale))
+        elif isinstance(rv, BinomialSumDiscreteRandVar):
+            summands.extend((term, scale) for term in rv.terms)
+        elif isinstance(rv, DiscretePlusDiscreteRandVar) and rv.rv1.root_mask() & rv.rv2.root_mask() == 0:
+            stack.append((rv.rv2, scale))
+            stack.append((rv.rv1, scale))
+        else:
+            summands.append((rv, scale))
+    return summands, shift
+
+
+def _moments(rv):
+    '''Returns the first four cumulants and the third absolute central
+    moment of a random variable'''
+
+    if type(rv) in (BernoulliRandVar, BinomialRandVar):
+        # A Binomial random variable is a sum of independent Bernoulli trials,
+        # so the Berry-Esseen bound applies to every trial
+        n = getattr(rv, 'trials', 1)
+        p = rv.success_rate
+        q = 1 - p
+        return n * p, n * p * q, n * p * q * (q - p), n * p * q * (1 - 6 * p * q), n * p * q * (p * p + q * q)
+    values, probabilities = _pmf_arrays(rv.pmf())
+    mean = probabilities @ values
+    deviations = values - mean
+    m2 = probabilities @ deviations ** 2
+    m3 = probabilities @ deviations ** 3
+    m4 = probabilities @ deviations ** 4
+    return mean.item(), m2.item(), m3.item(), (m4 - 3 * m2 * m2).item(), \
+        (probabilities @ abs(deviations) ** 3).item()
+
+
+def _lattice(rv, scale):
+    '''Returns a point and the span of the smallest lattice that the values
+    of a scaled random variable lie on, with a span of 0 for a constant,
+    or None if its values are not integers or the scale is irrational'''
+
+    if type(rv) in (BernoulliRandVar, BinomialRandVar):
+        n = getattr(rv, 'trials', 1)
+        p = rv.success_rate
+        point, span = (n, 0) if p == 1 else (0, 0 if p == 0 else 1)
+    else:
+        values, probabilities = _pmf_arrays(rv.pmf())
+        values = values[probabilities > 0]
+        if not np.array_equal(values, np.round(values)):
+            return None
+        point = values[0].item()
+        span = np.gcd.reduce(np.diff(values).astype(np.int64)).item()
+    # Spans are combined as fractions, so that scales such as 0.5 keep a lattice
+    fraction = Fraction(scale).limit_denominator(1 << 20)
+    if abs(fraction - scale) > 1e-12 * abs(scale):
+        return None
+    return point * scale, abs(fraction) * span
+
+
+def _gcd(a, b):
+    '''Returns the greatest common divisor of two fractions'''
+
+    numerator = math.gcd(a.numerator * b.denominator, b.numerator * a.denominator)
+    return Fraction(numerator, a.denominator * b.denominator)
@@ -0,0 +1,172 @@
+from .root_randvar import RootDiscreteRandVar
+from .unary_randvar import UnaryDiscreteRandVar
+
+import numpy as np
+
+
+# The number of bytes of an array read at once by the chunked calculations
+CHUNK_BYTES = 1 << 24
+
+
+class ArrayRootDiscreteRandVar(RootDiscreteRandVar):
+    '''
+    An array root is a root whose values are the indices 0, 1, ..., n - 1
+    of a vector of n probabilities, such as the scenarios of a scenario
+    set. The probabilities stay in the array they were given in, which may
+    be a memory-mapped file, and are never copied into Python objects
+    unless a mass function dictionary is explicitly asked for.
+    '''
+
+    __slots__ = ('probabilities', 'saved_cdf')
+
+
+    def __init__(self, probabilities):
+        '''
+        Args:
+            probabilities: A 1D array of the probability of every index,
+            summing to 1
+        '''
+
+        RootDiscreteRandVar.__init__(self, None, self._probability)
+        self.probabilities = probabilities
+        self.saved_cdf = None
+
+
+    @property
+    def sample_space(self):
+        return range(len(self.probabilities))
+
+
+    @sample_space.setter
+    def sample_space(self, sample_space):
+        if sample_space is not None:
+            raise ValueError("The support of an array random variable follows from its probabilities")
+
+
+    def support(self):
+        if self.saved_support is None:
+            self.saved_support = (np.arange(len(self.probabilities)), np.asarray(self.probabilities))
+        return self.saved_support
+
+
+    def _clear_caches(self):
+        RootDiscreteRandVar._clear_caches(self)
+        self.saved_cdf = None
+
+
+    def _probability(self, x):
+        return self.probabilities[x].item()
+
+
+    def _cdf(self):
+        # The cumulative probabilities are cached for inverse transform sampling
+        if self.saved_cdf is None:
+            self.saved_cdf = np.cumsum(self.probabilities, dtype=np.float64)
+        return self.saved_cdf
+
+
+    def _new_sample(self):
+        return self._new_sample_batch(None, None).item()
+
+
+    def _new_sample_batch(self, size, batch):
+        cdf = self._cdf()
+        indices = np.searchsorted(cdf, np.random.random(size) * cdf[-1], side='right')
+        return np.minimum(indices, len(cdf) - 1)
+
+
+    def _new_mean(self, fixed_means):
+        return _weighted_sum(self.probabilities, lambda start, end : np.arange(start, end)).item()
+
+
+    def _new_variance(self):
+        mean = self.mean()
+        return _weighted_sum(self.probabilities, lambda start, end : (np.arange(start, end) - mean) ** 2).item()
+
+
+    def _new_pmf(self, fixed_means):
+        return dict(enumerate(np.asarray(self.probabilities).tolist()))
+
+
+class ColumnDiscreteRandVar(UnaryDiscreteRandVar):
+    '''
+    A column of a matrix of values, indexed by an array root: given a root
+    R over the rows of the matrix, this is the random variable taking the
+    value in the given column of row R. The matrix stays in the array it
+    was given in, which may be a memory-mapped file. Means and variances
+    are calculated with numpy straight from the array, a chunk of rows at
+    a time, and covariances with other columns of the same matrix likewise.
+    '''
+
+    __slots__ = ('values', 'column')
+
+
+    def __init__(self, root, values, column):
+        '''
+        Args:
+            root: The ArrayRootDiscreteRandVar over the rows of the matrix
+            values: A 2D array with one row per index of the root
+            column: The index of the column
+        '''
+
+        self.values = values
+        self.column = column
+        UnaryDiscreteRandVar.__init__(self, root, self._column_values, True)
+
+
+    def _column_values(self, rows):
+        return self.values[rows, self.column]
+
+
+    def _new_mean(self, fixed_means):
+        if self.rv in fixed_means:
+            return self.values[fixed_means[self.rv], self.column].item()
+        return _weighted_sum(self.rv.probabilities, self._column).item()
+
+
+    def _new_variance(self):
+        mean = self.mean()
+        return _weighted_sum(self.rv.probabilities, lambda start, end : (self._column(start, end) - mean) ** 2).item()
+
+
+    def _new_covariance(self, rv):
+        if not isinstance(rv, ColumnDiscreteRandVar) or rv.rv is not self.rv:
+            return UnaryDiscreteRandVar._new_covariance(self, rv)
+        mean1, mean2 = self.mean(), rv.mean()
+        return _weighted_sum(self.rv.probabilities,
+                             lambda start, end : (self._column(start, end) - mean1) *
+                                                 (rv._column(start, end) - mean2)).item()
+
+
+    def _new_pmf(self, fixed_means):
+        if self.rv in fixed_means:
+            return {self.values[fixed_means[self.rv], self.column].item(): 1}
+        # Equal values are grouped together, summing their probabilities
+        outputs, inverse = np.unique(np.asarray(self.values[:, self.column]), return_inverse=True)
+        grouped = np.bincount(inverse.ravel(), weights=np.asarray(self.rv.probabilities), minlength=len(outputs))
+        return dict(zip(outputs.tolist(), grouped.tolist()))
+
+
+    def _column(self, start, end):
+        return np.asarray(self.values[start:end, self.column], dtype=np.float64)
+
+
+def _chunk_rows(array):
+    '''Returns the number of rows of an array that fit in one chunk'''
+
+    row_bytes = array.itemsize * int(np.prod(array.shape[1:], dtype=np.int64))
+    return max(1, CHUNK_BYTES // max(1, row_bytes))
+
+
+def _weighted_sum(probabilities, terms, rows=None):
+    '''Calculates the sum of probabilities[i] * terms[i] over every i, where
+    terms(start, end) returns the terms of a chunk of rows. Only one chunk
+    is ever read into memory at a time'''
+
+    rows = _chunk_rows(probabilities) if rows is None else rows
+    total = 0
+    for start in range(0, len(probabilities), rows):
+        end = min(start + rows, len(probabilities))
+        weights = np.asarray(probabilities[start:end], dtype=np.float64)
+        total = total + np.tensordot(weights, terms(start, end), axes=(0, 0))
+    return np.asarray(total)
@@ -0,0 +1,125 @@
+from .randvar import DiscreteRandVar, _root_combinations, _pmf_arrays, _broadcast, _shared_roots
+
+import numpy as np
+
+
+class BinaryDiscreteRandVar(DiscreteRandVar):
+    '''
+    Given two random variables and a function of two arguments, this
+    returns the new random variable that is the result of applying the
+    function to the outputs of the original random variables. That is,
+    given discrete random variables X and Y and a function f, this is
+    the random variable f(X, Y).
+
+    The function f must be well-defined for every pair of values in the
+    supports of X and Y. When X and Y are independent, the distribution
+    is found by evaluating f over the outer grid of their supports, with
+    the outer product of their probabilities as the weights. When X and
+    Y share roots, the shared roots are enumerated so that, within every
+    combination, X and Y are independent again.
+
+    If f is vectorized, meaning that it can be applied to whole numpy
+    arrays at once with broadcasting, it is applied to the entire grid
+    and to entire batches of samples instead of once per pair of values.
+    Numpy ufuncs are always treated as vectorized.
+    '''
+
+    __slots__ = ('rv1', 'rv2', 'func', 'vectorized')
+
+
+    def __init__(self, rv1, rv2, func, vectorized=False):
+        DiscreteRandVar.__init__(self)
+        self.rv1 = rv1
+        self.rv2 = rv2
+        self.func = func
+        self.vectorized = vectorized or isinstance(func, np.ufunc)
+
+        self._add_parents(rv1, rv2)
+
+
+    def _new_sample(self):
+        return self.func(self.rv1.sample(), self.rv2.sample())
+
+
+    def _new_sample_batch(self, size, batch):
+        samples1 = self.rv1.sample_batch(size, batch)
+        samples2 = self.rv2.sample_batch(size, batch)
+        if self.vectorized:
+            return np.asarray(self.func(samples1, samples2))
+        # The function is only called once per distinct pair of values
+        pairs, inverse = np.unique(np.stack([samples1, samples2], axis=1), axis=0, return_inverse=True)
+        return np.asarray([self.func(x, y) for x, y in pairs.tolist()])[inverse.ravel()]
+
+
+    def _new_mean(self, fixed_means):
+        # E[f(X, Y)] is the sum of f(x, y)P(X = x)P(Y = y) over the grid
+        # within every combination of the shared roots
+        mean = 0
+        for weight, grid, probabilities in self._grids(fixed_means):
+            mean = mean + weight * np.tensordot(probabilities, grid, axes=([0, 1], [0, 1]))
+        return mean.item() if np.ndim(mean) == 0 else mean
+
+
+    def _new_variance(self):
+        values, probabilities = _pmf_arrays(self.pmf())
+        mean = np.tensordot(probabilities, values, axes=(0, 0))
+        variance = np.tensordot(probabilities, values * values, axes=(0, 0)) - mean * mean
+        return variance.item() if np.ndim(variance) == 0 else variance
+
+
+    def _new_pmf(self, fixed_means):
+        pmf = {}
+        for weight, grid, probabilities in self._grids(fixed_means):
+            # Group equal outputs together, summing their probabilities
+            outputs, inverse = np.unique(grid, return_inverse=True)
+            grouped = np.zeros((len(outputs),) + probabilities.shape[2:])
+            np.add.at(grouped, inverse.ravel(), probabilities.reshape((-1,) + probabilities.shape[2:]))
+            grouped = weight * grouped
+            rows = list(grouped) if grouped.ndim > 1 else grouped.tolist()
+            for x, p in zip(outputs.tolist(), rows):
+                pmf[x] = pmf.get(x, 0) + p
+        return pmf
+
+
+    def _grids(self, fixed_means):
+        '''Generates the weight of every combination of the shared roots,
+        along with the outer grid of outputs and their probabilities'''
+
+        shared_roots = _shared_roots(self.rv1, self.rv2)
+        for weight, fixes in _root_combinations(shared_roots, fixed_means):
+            values1, probabilities1 = _pmf_arrays(self.rv1.pmf(fixes))
+            values2, probabilities2 = _pmf_arrays(self.rv2.pmf(fixes))
+            probabilities1, probabilities2 = _broadcast(probabilities1, probabilities2)
+            if self.vectorized:
+                grid = np.asarray(self.func(values1[:, None], values2[None, :]))
+            else:
+                grid = np.asarray([[self.func(x, y) for y in values2.tolist()] for x in values1.tolist()])
+            yield weight, grid, probabilities1[:, None] * probabilities2[None, :]
+
+
+class BoundFunction:
+    '''
+    A function of two arguments with one of them bound to a constant, such
+    as x / 2 or 2 / x. Whole numpy arrays can be passed in at once if the
+    function is vectorized.
+    '''
+
+    def __init__(self, func, c, left=False):
+        '''
+        Args:
+            func: The function of two arguments
+            c: The constant
+            left: True to pass the constant as the first argument, or False
+            to pass it as the second
+        '''
+
+        self.func = func
+        self.c = c
+        self.left = left
+
+
+    def __call__(self, x):
+        result = self.func(self.c, x) if self.left else self.func(x, self.c)
+        if isinstance(result, np.generic):
+            return result.item()
+        return result
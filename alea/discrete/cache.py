@@ -0,0 +1,328 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import io
+import sqlite3
+import time
+import numpy as np
+
+
+# The persistent cache in use in the current context. Every thread and
+# every asyncio task has its own, so caches activated in one do not leak
+# into another. When no cache is active, this is None and random
+# variables only cache their results in memory
+_current = ContextVar('persistent_cache', default=None)
+
+# The kinds of results of the parents that calculating each kind of result
+# may read. Variances are calculated from means
+_DEPENDENCIES = {'mean': ('mean',), 'variance': ('mean', 'variance'), 'pmf': ('pmf',)}
+
+# The most hashes looked up by one query, below the limit of sqlite on
+# the number of parameters of a statement
+_BATCH_SIZE = 500
+
+
+class PersistentCache:
+    '''
+    A cache of means, variances and mass functions that outlives the
+    process, stored in a sqlite database. Results are keyed by the
+    structural hash of the random variable they belong to, so a model
+    built again in a later job, or a sub-model shared between different
+    models, is looked up rather than recalculated.
+
+    The total size of the stored results is bounded. Once it exceeds
+    max_bytes, the least recently used results are evicted until it fits.
+    '''
+
+    def __init__(self, path, max_bytes=1 << 30):
+        '''
+        Args:
+            path: The path of the database file, created if it does not exist
+            max_bytes: The largest total size of the stored results, in bytes
+        '''
+
+        if max_bytes <= 0:
+            raise ValueError("The size of a cache must be positive")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (hash TEXT, kind TEXT, value BLOB, '
+                                'size INTEGER, accessed REAL, PRIMARY KEY (hash, kind))')
+        self.connection.commit()
+        # The access times of results looked up but not yet written
+        self.accessed = {}
+
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+    def size(self):
+        '''
+        Returns:
+            The total size of the stored results, in bytes
+        '''
+
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+
+    def get(self, key, kind):
+        '''
+        Args:
+            key: The structural hash of a random variable
+            kind: The kind of result, one of 'mean', 'variance' or 'pmf'
+
+        Returns:
+            The stored result, or None if there is none
+        '''
+
+        return self.get_many([key], [kind]).get((key, kind))
+
+
+    def get_many(self, keys, kinds):
+        '''
+        Looks up the results of many random variables at once. The access
+        times of the results found are recorded in memory and written along
+        with the next results stored, or by flush().
+
+        Args:
+            keys: The structural hashes of the random variables
+            kinds: The kinds of results to look up
+
+        Returns:
+            A dictionary mapping pairs of a hash and a kind to the stored results
+        '''
+
+        keys = list(keys)
+        kinds = list(kinds)
+        found = {}
+        for start in range(0, len(keys), _BATCH_SIZE):
+            chunk = keys[start:start + _BATCH_SIZE]
+            query = 'SELECT hash, kind, value FROM results WHERE hash IN ({}) AND kind IN ({})'.format(
+                ', '.join('?' * len(chunk)), ', '.join('?' * len(kinds)))
+            for key, kind, blob in self.connection.execute(query, chunk + kinds):
+                found[(key, kind)] = _decode(kind, blob)
+        now = time.time()
+        for entry in found:
+            self.accessed[entry] = now
+        return found
+
+
+    def put(self, key, kind, value):
+        '''
+        Stores a result, evicting the least recently used results if the
+        cache grows beyond its size. Results that cannot be stored as numeric
+        arrays, such as mass functions over arbitrary objects, are skipped.
+
+        Args:
+            key: The structural hash of a random variable
+            kind: The kind of result, one of 'mean', 'variance' or 'pmf'
+            value: The result
+        '''
+
+        self.put_many([(key, kind, value)])
+
+
+    def put_many(self, results):
+        '''
+        Stores many results in one transaction, as put() does, along with
+        the access times of the results looked up since the last write.
+
+        Args:
+            results: A list of triples of a structural hash, a kind and a result
+        '''
+
+        now = time.time()
+        rows = []
+        for key, kind, value in results:
+            blob = _encode(kind, value)
+            if blob is not None and len(blob) <= self.max_bytes:
+                rows.append((key, kind, blob, len(blob), now))
+        self._write_accessed()
+        self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', rows)
+        excess = self.size() - self.max_bytes
+        if excess > 0:
+            evicted = []
+            for key, kind, size in self.connection.execute('SELECT hash, kind, size FROM results ORDER BY accessed'):
+                if excess <= 0:
+                    break
+                evicted.append((key, kind))
+                excess -= size
+            self.connection.executemany('DELETE FROM results WHERE hash = ? AND kind = ?', evicted)
+        self.connection.commit()
+
+
+    def flush(self):
+        '''Writes the access times of the results looked up since the last write'''
+
+        if len(self.accessed) > 0:
+            self._write_accessed()
+            self.connection.commit()
+
+
+    def clear(self):
+        '''Removes every stored result'''
+
+        self.connection.execute('DELETE FROM results')
+        self.connection.commit()
+
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+    def _write_accessed(self):
+        self.connection.executemany('UPDATE results SET accessed = ? WHERE hash = ? AND kind = ?',
+                                    [(accessed, key, kind) for (key, kind), accessed in self.accessed.items()])
+        self.accessed = {}
+
+
+def active():
+    '''
+    Returns:
+        The persistent cache in use in the current thread or asyncio task,
+        or None if there is none
+    '''
+
+    return _current.get()
+
+
+@contextmanager
+def persistent_cache(cache, max_bytes=1 << 30):
+    '''
+    Looks up and stores the means, variances and mass functions of every
+    random variable evaluated inside the with block in a persistent cache.
+    Roots are not cached, since their results are cheap, and neither are
+    results conditioned on fixed means or calculated during parameter
+    sweeps.
+
+    Only the results requested from outside of the cache are looked up.
+    The stored results of the whole graph behind such a result are loaded
+    with one query, and the rest of the graph is then evaluated with the
+    cache suspended, so evaluating it adds no lookups and no stack frames.
+    Every random variable needs its structural hash, but hashes are built
+    from the cached hashes of the parents, so each is only calculated once.
+
+    The cache is only active in the thread or asyncio task that entered
+    the with block, and blocks may be nested: the innermost cache is used,
+    and the outer one is restored on exit.
+
+    Args:
+        cache: A PersistentCache, or the path of the database file to open one
+        max_bytes: The largest total size of the stored results, in bytes,
+        when a path is given
+
+    Yields:
+        The PersistentCache in use
+    '''
+
+    opened = not isinstance(cache, PersistentCache)
+    if opened:
+        cache = PersistentCache(cache, max_bytes)
+    token = _current.set(cache)
+    try:
+        yield cache
+    finally:
+        _current.reset(token)
+        if opened:
+            cache.close()
+        else:
+            cache.flush()
+
+
+def evaluate(rv, kind, calculate):
+    '''
+    Calculates a result of a random variable through the current cache.
+    The random variable and its ancestors are hashed, and the stored
+    results of the ancestors whose results are missing are loaded at once.
+    If the result itself is not stored, it is calculated with the cache
+    suspended, and every result calculated along the way is stored.
+
+    Args:
+        rv: A discrete random variable that is not a root
+        kind: The kind of result, one of 'mean', 'variance' or 'pmf'
+        calculate: A function that calculates the result without the cache
+
+    Returns:
+        The result
+    '''
+
+    active = _current.get()
+    token = _current.set(None)
+    try:
+        try:
+            key = rv.structural_hash()
+        except (ValueError, TypeError):
+            # Random variables that cannot be serialized, or whose
+            # parameters are being swept, are not cached
+            return calculate()
+        kinds = _DEPENDENCIES[kind]
+        missing = [(node, k) for node in _hashed_ancestors(rv, kinds) for k in kinds
+                   if getattr(node, 'saved_' + k) is None]
+        stored = active.get_many({node.saved_hash for node, _ in missing}, kinds)
+        for node, k in missing:
+            if (node.saved_hash, k) in stored:
+                setattr(node, 'saved_' + k, stored[(node.saved_hash, k)])
+        if (key, kind) in stored:
+            return stored[(key, kind)]
+        result = calculate()
+        calculated = []
+        for node, k in missing:
+            value = result if node is rv and k == kind else getattr(node, 'saved_' + k)
+            if value is not None and (node.saved_hash, k) not in stored:
+                calculated.append((node.saved_hash, k, value))
+        active.put_many(calculated)
+        return result
+    finally:
+        _current.reset(token)
+
+
+def _hashed_ancestors(rv, kinds):
+    '''Returns the random variable and its ancestors that have a cached hash,
+    are not roots and may be needed for the kinds of results, since the
+    ancestors of a random variable whose results are cached are not'''
+
+    nodes = []
+    visited = {rv}
+    stack = [rv]
+    while len(stack) > 0:
+        node = stack.pop()
+        if node is not rv and all(getattr(node, 'saved_' + k) is not None for k in kinds):
+            continue
+        if node.saved_hash is not None:
+            nodes.append(node)
+        for parent in node.parents:
+            if parent._parents and parent not in visited:
+                visited.add(parent)
+                stack.append(parent)
+    return nodes
+
+
+def _encode(kind, value):
+    '''Returns the bytes of a result, or None if it cannot be stored'''
+
+    try:
+        if kind == 'pmf':
+            arrays = [np.array(list(value.keys())), np.array(list(value.values()))]
+        else:
+            arrays = [np.array(value)]
+    except ValueError:
+        return None
+    # Arrays of objects and the arrays of parameter sweeps are not stored
+    dimensions = 1 if kind == 'pmf' else 0
+    if any(array.dtype == object for array in arrays) or arrays[-1].ndim != dimensions:
+        return None
+    buffer = io.BytesIO()
+    for array in arrays:
+        np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _decode(kind, blob):
+    buffer = io.BytesIO(blob)
+    if kind == 'pmf':
+        keys = np.load(buffer, allow_pickle=False)
+        probabilities = np.load(buffer, allow_pickle=False)
+        return dict(zip(keys.tolist(), probabilities.tolist()))
+    return np.load(buffer, allow_pickle=False).item()
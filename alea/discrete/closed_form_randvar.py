@@ -0,0 +1,231 @@
+from .randvar import DiscreteRandVar, _add_gradients
+
+import numpy as np
+
+
+class AffineDiscreteRandVar(DiscreteRandVar):
+    '''
+    Given a random variable X and two constants a and b, this
+    is the random variable aX + b. Chains of additions and
+    multiplications by constants collapse into a single affine
+    random variable, so their moments, mass function and samples
+    are found in one step from X.
+    '''
+
+    __slots__ = ('rv', 'scale', 'shift')
+
+
+    def __init__(self, rv, scale, shift):
+        DiscreteRandVar.__init__(self)
+        self.rv = rv
+        self.scale = scale
+        self.shift = shift
+
+        self._add_parents(rv)
+
+
+    def _new_sample(self):
+        return self.scale * self.rv.sample() + self.shift
+
+
+    def _new_sample_batch(self, size, batch):
+        return self.scale * self.rv.sample_batch(size, batch) + self.shift
+
+
+    def _new_mean(self, fixed_means):
+        return self.scale * self.rv.mean(fixed_means) + self.shift
+
+
+    def _new_variance(self):
+        return self.scale * self.scale * self.rv.variance()
+
+
+    def _new_pmf(self, fixed_means):
+        pmf = {}
+        for x, p in self.rv.pmf(fixed_means).items():
+            value = self.scale * x + self.shift
+            pmf[value] = pmf.get(value, 0) + p
+        return pmf
+
+
+    def _new_mean_gradient(self, fixed_means):
+        return _add_gradients(self.rv.mean_gradient(fixed_means), self.scale)
+
+
+    def _new_variance_gradient(self):
+        return _add_gradients(self.rv.variance_gradient(), self.scale * self.scale)
+
+
+class BinomialSumDiscreteRandVar(DiscreteRandVar):
+    '''
+    The sum of independent Bernoulli and Binomial random variables. When
+    every term has the same success rate, which is what the rewrites that
+    build this random variable require, the sum follows a Binomial
+    distribution whose number of trials is the total over the terms.
+    Its moments and mass function then have closed forms, however many
+    terms there are.
+
+    A sum is built from two operands, each a Bernoulli, a Binomial or
+    another sum, which are its parents, so the sum stays dependent on
+    each of its terms. Sums built one term at a time, as in S = S + X,
+    share a single list of terms that each sum only reads a prefix of,
+    so adding a term takes constant time. If the success rates of the
+    terms are later changed to differ, the mass function falls back to
+    convolving the terms.
+    '''
+
+    __slots__ = ('rv1', 'rv2', '_terms', '_count', '_saved_parameters')
+
+
+    def __init__(self, rv1, rv2):
+        '''
+        Args:
+            rv1: A Bernoulli, Binomial or Binomial sum random variable
+            rv2: A Bernoulli, Binomial or Binomial sum random variable
+            independent of {rv1}
+        '''
+
+        DiscreteRandVar.__init__(self)
+        self.rv1 = rv1
+        self.rv2 = rv2
+        self._saved_parameters = None
+
+        # The list of terms of the first operand is extended in place when
+        # no other sum has extended it yet, and copied otherwise
+        if isinstance(rv1, BinomialSumDiscreteRandVar) and len(rv1._terms) == rv1._count:
+            self._terms = rv1._terms
+        else:
+            self._terms = _terms(rv1)
+        self._terms.extend(_terms(rv2))
+        self._count = len(self._terms)
+
+        self._add_parents(rv1, rv2)
+
+
+    @property
+    def terms(self):
+        '''The Bernoulli and Binomial random variables that are summed'''
+        return self._terms[:self._count]
+
+
+    def _binomial_parameters(self):
+        '''Returns the total number of trials and the success rate of the
+        terms, or None if their success rates differ or are not scalars.
+        The result is cached until a term changes'''
+
+        if self._saved_parameters is None:
+            operands = (self.rv1, self.rv2)
+            # After a term changes, the sums it feeds have all been cleared,
+            # so the terms are read directly rather than through each sum
+            if any(isinstance(rv, BinomialSumDiscreteRandVar) and rv._saved_parameters is None for rv in operands):
+                operands = self.terms
+            parameters = [_parameters(rv) for rv in operands]
+            if all(parameters) and all(rate == parameters[0][1] for _, rate in parameters):
+                self._saved_parameters = (sum(trials for trials, _ in parameters), parameters[0][1])
+            else:
+                self._saved_parameters = ()
+        return self._saved_parameters or None
+
+
+    def _clear_caches(self):
+        DiscreteRandVar._clear_caches(self)
+        self._saved_parameters = None
+
+
+    def _new_sample(self):
+        return sum(term.sample() for term in self.terms)
+
+
+    def _new_sample_batch(self, size, batch):
+        # Every term is sampled, so that batches stay consistent with the
+        # terms when they are sampled jointly with the sum
+        return sum(term.sample_batch(size, batch) for term in self.terms)
+
+
+    def _new_mean(self, fixed_means):
+        parameters = self._binomial_parameters()
+        if parameters is not None and len(fixed_means) == 0:
+            trials, rate = parameters
+            return trials * rate
+        return sum(term.mean(fixed_means) for term in self.terms)
+
+
+    def _new_variance(self):
+        parameters = self._binomial_parameters()
+        if parameters is not None:
+            trials, rate = parameters
+            return trials * rate * (1 - rate)
+        # The terms are independent, so their variances add up
+        return sum(term.variance() for term in self.terms)
+
+
+    def _new_pmf(self, fixed_means):
+        parameters = self._binomial_parameters()
+        if parameters is not None and len(fixed_means) == 0:
+            return dict(enumerate(_binomial_pmf(*parameters).tolist()))
+        fixed = sum(fixed_means[term] for term in self.terms if term in fixed_means)
+        terms = [term for term in self.terms if term not in fixed_means]
+        rates = [term.success_rate for term in terms]
+        if all(np.array_equal(rate, rates[0]) for rate in rates):
+            trials = sum(_trials(term) for term in terms)
+            probabilities = _binomial_pmf(trials, rates[0]) if len(terms) > 0 else np.ones(1)
+            rows = list(probabilities) if probabilities.ndim > 1 else probabilities.tolist()
+            return {fixed + k: p for k, p in enumerate(rows)}
+        pmf = {fixed: 1}
+        for term in terms:
+            convolved = {}
+            for x, p in pmf.items():
+                for y, q in term.pmf().items():
+                    convolved[x + y] = convolved.get(x + y, 0) + p * q
+            pmf = convolved
+        return pmf
+
+
+    def _new_mean_gradient(self, fixed_means):
+        gradient = {}
+        for term in self.terms:
+            gradient = _add_gradients(gradient, 1, term.mean_gradient(fixed_means), 1)
+        return gradient
+
+
+    def _new_variance_gradient(self):
+        gradient = {}
+        for term in self.terms:
+            gradient = _add_gradients(gradient, 1, term.variance_gradient(), 1)
+        return gradient
+
+
+def _terms(rv):
+    # A new list, which the sum being built may extend
+    return rv.terms if isinstance(rv, BinomialSumDiscreteRandVar) else [rv]
+
+
+def _parameters(rv):
+    '''Returns the number of trials and the success rate of a term or a
+    sum, or None if its success rate is not a scalar'''
+
+    if isinstance(rv, BinomialSumDiscreteRandVar):
+        return rv._binomial_parameters()
+    if not isinstance(rv.success_rate, (int, float)):
+        return None
+    return _trials(rv), rv.success_rate
+
+
+def _trials(term):
+    # Bernoulli random variables are Binomial random variables with one trial
+    return getattr(term, 'trials', 1)
+
+
+def _binomial_pmf(n, p):
+    '''Calculates the Binomial probabilities of 0, 1, ..., n successes in
+    log space. The success rate may be an array, as it is during parameter
+    sweeps, in which case the first axis of the result follows the values'''
+
+    k = np.arange(n + 1).reshape((-1,) + (1,) * np.ndim(p))
+    log_factorials = np.concatenate([[0], np.cumsum(np.log(np.arange(1, n + 1)))])
+    log_choose = (log_factorials[n] - log_factorials - log_factorials[::-1]).reshape(k.shape)
+    # The terms with a zero exponent are left out, so p = 0 and p = 1 work
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_successes = np.where(k > 0, k * np.log(p), 0)
+        log_failures = np.where(k < n, (n - k) * np.log1p(-np.asarray(p, dtype=np.float64)), 0)
+    return np.exp(log_choose + log_successes + log_failures)
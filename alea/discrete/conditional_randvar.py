@@ -0,0 +1,201 @@
+from ..randvar import _mask_roots
+from .randvar import DiscreteRandVar, _root_combinations, _shared_roots
+
+import numpy as np
+
+
+# The key under which a batch keeps the conditioned samples of every event
+_CONDITIONED = object()
+
+
+class ConditionalDiscreteRandVar(DiscreteRandVar):
+    '''
+    A conditional discrete random variable is the distribution of a
+    random variable X given that an event E occurred. The event is
+    itself a discrete random variable that outputs 1 when it occurs and
+    0 otherwise, typically built from comparisons such as Y > 0.
+
+    The conditional mass function is calculated exactly. Only the roots
+    shared by X and E are enumerated; within every combination of those
+    roots, X and E are independent, so the probability of E is found by
+    taking its mean and the remaining roots of E are never enumerated.
+
+    X and E are the parents of the conditional, so changing a root of
+    either one recalculates it. Conditioning reweights the roots of E,
+    which therefore take different values in the conditioned space than
+    outside it: the conditional only shares the other roots of X with the
+    rest of the graph. Conditionals on the same event live in the same
+    conditioned space, so their covariances are exact and their batches
+    are sampled jointly. Other combinations of them, such as the mass
+    function of their sum, treat the roots of the event as independent.
+    Within a batch, the roots shared with E are drawn from their
+    distribution given the event, restricted and renormalized, so rare
+    events are no more expensive to sample than likely ones.
+    '''
+
+    __slots__ = ('rv', 'event', 'saved_event_probability')
+
+
+    def __init__(self, rv, event):
+        '''
+        Args:
+            rv: The discrete random variable to condition
+            event: A discrete random variable taking the values 0 and 1
+        '''
+
+        if not isinstance(event, DiscreteRandVar):
+            raise ValueError("Event must be a discrete randvar")
+        if not set(event.pmf()) <= {0, 1}:
+            raise ValueError("Event must only take the values 0 and 1")
+
+        DiscreteRandVar.__init__(self)
+        self.rv = rv
+        self.event = event
+        self.saved_event_probability = None
+
+        self._add_parents(rv, event)
+        # Impossible events are reported as the conditional is built
+        self.pmf()
+
+
+    @property
+    def event_probability(self):
+        '''The probability that the event occurs'''
+
+        if self.saved_event_probability is None:
+            _, self.saved_event_probability = self._condition({})
+        return self.saved_event_probability
+
+
+    def root_mask(self):
+        # The roots of the event are reweighted by the conditioning, so
+        # they are not shared with the random variables outside of it
+        if self.saved_root_mask is None:
+            self.saved_root_mask = self.rv.root_mask() & ~self.event.root_mask()
+        return self.saved_root_mask
+
+
+    def resample(self):
+        DiscreteRandVar.resample(self)
+        # Without roots outside of the event, nothing else leads here
+        if self.root_mask() == 0:
+            self.saved_sample = self._new_sample()
+
+
+    def _clear_caches(self):
+        DiscreteRandVar._clear_caches(self)
+        self.saved_event_probability = None
+
+
+    def _condition(self, fixed_means):
+        '''Calculates the mass function of X given the event and the fixed
+        roots outside of it, along with the probability of the event'''
+
+        # Fixed roots of the event belong to the unconditioned space
+        mask = self.event.root_mask()
+        fixes = {rv: x for rv, x in fixed_means.items() if rv.root_mask() & mask == 0}
+        pmf = {}
+        event_probability = 0
+        for weight, combination in _root_combinations(_shared_roots(self.rv, self.event), fixes):
+            # By the law of total probability,
+            # P(X = x, E) = sum over s of P(s) P(E | s) P(X = x | s)
+            probability = weight * self.event.mean(combination)
+            if probability == 0:
+                continue
+            event_probability += probability
+            for x, p in self.rv.pmf(combination).items():
+                pmf[x] = pmf.get(x, 0) + probability * p
+        if event_probability <= 0:
+            raise ValueError("Cannot condition on an event with zero probability")
+        return {x: p / event_probability for x, p in pmf.items() if p > 0}, event_probability
+
+
+    def _new_pmf(self, fixed_means):
+        pmf, event_probability = self._condition(fixed_means)
+        if len(fixed_means) == 0:
+            self.saved_event_probability = event_probability
+        return pmf
+
+
+    def _new_mean(self, fixed_means):
+        return sum(x * p for x, p in self.pmf(fixed_means).items())
+
+
+    def _new_variance(self):
+        mean = self.mean()
+        return sum((x - mean) ** 2 * p for x, p in self.pmf().items())
+
+
+    def _new_covariance(self, rv):
+        if not isinstance(rv, ConditionalDiscreteRandVar) or rv.event is not self.event:
+            return DiscreteRandVar._new_covariance(self, rv)
+        # Once the roots shared by any two of X, Y and E are fixed, the
+        # three are independent, so
+        # E[XY | E] = sum over s of P(s) P(E | s) E[X | s] E[Y | s] / P(E)
+        mask1, mask2, mask = self.rv.root_mask(), rv.rv.root_mask(), self.event.root_mask()
+        roots = _mask_roots(mask1 & mask2 | mask1 & mask | mask2 & mask)
+        total = 0
+        for weight, fixes in _root_combinations(roots, {}):
+            probability = weight * self.event.mean(fixes)
+            if probability != 0:
+                total += probability * self.rv.mean(fixes) * rv.rv.mean(fixes)
+        return total / self.event_probability - self.mean() * rv.mean()
+
+
+    def _new_sample(self):
+        # The roots outside of the event keep their current samples
+        space = {rrv: np.array([rrv.sample()]) for rrv in self.roots()}
+        _draw_given(self.rv, self.event, space, 1)
+        return self.rv.sample_batch(1, space).tolist()[0]
+
+
+    def _new_sample_batch(self, size, batch):
+        # Every event has its own batch of conditioned samples, shared by
+        # all of the random variables conditioned on it
+        spaces = batch.setdefault(_CONDITIONED, {})
+        if self.event not in spaces:
+            spaces[self.event] = {}
+        space = spaces[self.event]
+        for rrv in self.roots():
+            space[rrv] = rrv.sample_batch(size, batch)
+        _draw_given(self.rv, self.event, space, size)
+        return self.rv.sample_batch(size, space)
+
+
+def _draw_given(rv, event, space, size):
+    '''
+    Draws the roots shared by a random variable and an event that are not
+    yet in {space}, a batch of samples given the event. Roots of the event
+    drawn earlier for other random variables are kept, and the new roots
+    are drawn from their distribution given both the event and those
+    samples. Only combinations in which the event can occur are drawn.
+    '''
+
+    mask = event.root_mask()
+    drawn = [rrv for rrv in space if rrv.root_mask() & mask and not rrv._parents]
+    needed = [rrv for rrv in _shared_roots(rv, event) if rrv not in space]
+    if len(needed) == 0:
+        return
+    roots = drawn + needed
+    combinations = list(_root_combinations(roots, {}))
+    values = [[fixes[rrv] for rrv in roots] for _, fixes in combinations]
+    weights = np.array([weight * event.mean(fixes) for weight, fixes in combinations])
+
+    # Group the combinations by the values of the roots already drawn
+    groups = {}
+    for i, row in enumerate(values):
+        groups.setdefault(tuple(row[:len(drawn)]), []).append(i)
+    if len(drawn) > 0:
+        keys, inverse = np.unique(np.column_stack([space[rrv] for rrv in drawn]), axis=0, return_inverse=True)
+        keys = [tuple(key) for key in keys.tolist()]
+    else:
+        keys, inverse = [()], np.zeros(size, dtype=np.int64)
+
+    choices = np.empty(size, dtype=np.int64)
+    for j, key in enumerate(keys):
+        rows = np.flatnonzero(inverse.reshape(-1) == j)
+        group = np.array(groups[key])
+        probabilities = weights[group] / weights[group].sum()
+        choices[rows] = np.random.choice(group, size=len(rows), p=probabilities)
+    for k, rrv in enumerate(needed):
+        space[rrv] = np.array([row[len(drawn) + k] for row in values])[choices]
@@ -0,0 +1,388 @@
+from ..randvec import RandVec
+from .randvar import DiscreteRandVar
+from .root_randvar import RootDiscreteRandVar
+
+import numpy as np
+
+
+class MarkovChainRandVar(RootDiscreteRandVar):
+    '''
+    A Markov chain random variable models a process that moves between a
+    finite set of numerical states over a number of steps. The state at
+    the first step follows an initial distribution, and the state at every
+    later step only depends on the state before it, through a matrix of
+    transition probabilities.
+
+    The chain is a root whose value is its whole path. Batches of the
+    chain are matrices of the indices of the states, with one row per
+    sample and one column per step, and its mass function maps the index
+    of every path, in which the state at every step is a digit in base
+    len(states) with the first step the most significant, to its
+    probability. A path has no mean or variance of its own: its states,
+    and functionals of it such as the sum of its states, are random
+    variables built from it with state() and sum(). Their distributions
+    are calculated exactly from powers of the transition matrix, in a
+    number of matrix products that grows with the number of steps rather
+    than with the number of paths, and all steps of a path are sampled
+    together.
+
+    Anything that needs the support of the chain, such as random variables
+    that combine several of its states or sums other than through
+    covariance(), inverse transform sampling and serialization, enumerates
+    the paths, which is only possible for short chains. Longer chains
+    raise a ValueError instead.
+    '''
+
+    __slots__ = ('states', 'initial', 'transitions', 'steps', 'saved_marginals')
+
+    # The largest number of paths that may be enumerated
+    MAX_PATHS = 10 ** 6
+
+
+    def __init__(self, states, initial, transitions, steps):
+        '''
+        Args:
+            states: A list of the m numerical values of the states
+            initial: A list of the m probabilities of the states at the first step
+            transitions: An m-by-m matrix, whose (i, j)th entry is the
+            probability of moving from state i to state j in one step
+            steps: The number of steps of a path, including the first
+        '''
+
+        RootDiscreteRandVar.__init__(self, None, self._path_probability)
+        states = np.asarray(states)
+        initial = np.asarray(initial, dtype=np.float64)
+        transitions = np.asarray(transitions, dtype=np.float64)
+        m = len(states)
+        if states.ndim != 1 or initial.shape != (m,) or transitions.shape != (m, m):
+            raise ValueError("There must be one initial probability and one row and column of transitions per state")
+        if (initial < 0).any() or abs(initial.sum() - 1) > 1e-9:
+            raise ValueError("Initial probabilities must form a probability distribution")
+        if (transitions < 0).any() or (np.abs(transitions.sum(axis=1) - 1) > 1e-9).any():
+            raise ValueError("Every row of transitions must form a probability distribution")
+        if steps < 1:
+            raise ValueError("A Markov chain must have at least one step")
+        self.states = states
+        self.initial = initial
+        self.transitions = transitions
+        self.steps = steps
+        self.saved_marginals = None
+
+
+    @property
+    def sample_space(self):
+        return range(len(self.states) ** self.steps)
+
+
+    @sample_space.setter
+    def sample_space(self, sample_space):
+        if sample_space is not None:
+            raise ValueError("The paths of a Markov chain follow from its states and steps")
+
+
+    def support(self):
+        if self.saved_support is None:
+            paths = len(self.states) ** self.steps
+            if paths > self.MAX_PATHS:
+                raise ValueError("A chain with {} paths is too long to enumerate".format(paths))
+            probabilities = self.initial
+            for t in range(1, self.steps):
+                # Every path is extended by one state, moving from its last state
+                last = np.arange(len(probabilities)) % len(self.states)
+                probabilities = (probabilities[:, np.newaxis] * self.transitions[last]).ravel()
+            self.saved_support = (np.arange(paths), probabilities)
+        return self.saved_support
+
+
+    def marginal(self, step):
+        '''
+        Args:
+            step: A step of the chain, starting from 0
+
+        Returns:
+            The probabilities of the states at the step, which are the
+            initial probabilities times the {step}th power of the
+            transition matrix
+        '''
+
+        if not 0 <= step < self.steps:
+            raise ValueError("Step must be between 0 and {}".format(self.steps - 1))
+        if self.saved_marginals is not None:
+            return self.saved_marginals[step]
+        return self.initial @ np.linalg.matrix_power(self.transitions, step)
+
+
+    def marginals(self):
+        '''
+        Returns:
+            A matrix whose rows are the probabilities of the states at every
+            step. Like the mean, it is cached upon calculation
+        '''
+
+        if self.saved_marginals is None:
+            marginals = np.empty((self.steps, len(self.states)))
+            marginals[0] = self.initial
+            for t in range(1, self.steps):
+                marginals[t] = marginals[t - 1] @ self.transitions
+            self.saved_marginals = marginals
+        return self.saved_marginals
+
+
+    def state(self, step):
+        '''
+        Args:
+            step: A step of the chain, starting from 0
+
+        Returns:
+            The random variable of the state at the step
+        '''
+
+        if not 0 <= step < self.steps:
+            raise ValueError("Step must be between 0 and {}".format(self.steps - 1))
+        return MarkovStateRandVar(self, step)
+
+
+    def path(self):
+        '''
+        Returns:
+            The random vector of the states at every step
+        '''
+
+        return RandVec([MarkovStateRandVar(self, t) for t in range(self.steps)])
+
+
+    def sum(self):
+        '''
+        Returns:
+            The random variable of the sum of the states over every step
+        '''
+
+        return MarkovSumRandVar(self)
+
+
+    def sample_paths(self, size):
+        '''
+        Generates {size} independent paths of the chain at once.
+
+        Args:
+            size: The number of paths to generate
+
+        Returns:
+            The values of the states as a {size}-by-steps numpy array
+        '''
+
+        return self.states[self._sample_states(size)]
+
+
+    def _clear_caches(self):
+        RootDiscreteRandVar._clear_caches(self)
+        self.saved_marginals = None
+
+
+    def _path_probability(self, path):
+        states = self._path_states(np.asarray([path]))[0]
+        probability = self.initial[states[0]]
+        for i, j in zip(states[:-1], states[1:]):
+            probability *= self.transitions[i][j]
+        return probability.item()
+
+
+    def _path_state(self, paths, step):
+        '''Returns the indices of the states at a step of the paths with the given indices'''
+
+        return np.asarray(paths // len(self.states) ** (self.steps - 1 - step) % len(self.states)).astype(np.int64)
+
+
+    def _path_states(self, paths):
+        '''Returns the indices of the states at every step of the paths with
+        the given indices, as a matrix with one column per step'''
+
+        m = len(self.states)
+        states = np.empty((len(paths), self.steps), dtype=np.int64)
+        for t in range(self.steps - 1, -1, -1):
+            states[:, t] = paths % m
+            paths = paths // m
+        return states
+
+
+    def _sample_states(self, size):
+        '''Returns the indices of the states of {size} independent paths, as
+        a matrix with one column per step'''
+
+        # Every step moves all of the paths at once by inverting the
+        # cumulative transition probabilities of their current states
+        cdf = np.cumsum(self.transitions, axis=1)
+        states = np.empty((size, self.steps), dtype=np.int64)
+        states[:, 0] = np.searchsorted(np.cumsum(self.initial), np.random.random(size), side='right')
+        for t in range(1, self.steps):
+            u = np.random.random((size, 1))
+            states[:, t] = (u >= cdf[states[:, t - 1]]).sum(axis=1)
+        return np.minimum(states, len(self.states) - 1)
+
+
+    def _inverse_cdf(self, u):
+        # Paths are found by their indices, and batches hold their states
+        return self._path_states(RootDiscreteRandVar._inverse_cdf(self, u))
+
+
+    def _tilted_sample_batch(self, theta, size):
+        paths, log_ratios = RootDiscreteRandVar._tilted_sample_batch(self, theta, size)
+        return self._path_states(paths), log_ratios
+
+
+    def _controls(self, samples):
+        # The values of the states at every step, centered on their marginal means
+        return self.states[samples] - self.marginals() @ self.states
+
+
+    def _new_sample(self):
+        return self._sample_states(1)[0]
+
+
+    def _new_sample_batch(self, size, batch):
+        return self._sample_states(size)
+
+
+    def _new_pmf(self, fixed_means):
+        values, probabilities = self.support()
+        return dict(zip(values.tolist(), probabilities.tolist()))
+
+
+    def _new_mean(self, fixed_means):
+        raise ValueError("A Markov chain has no mean, take that of its states or of its sum instead")
+
+
+    def _new_variance(self):
+        raise ValueError("A Markov chain has no variance, take that of its states or of its sum instead")
+
+
+class MarkovStateRandVar(DiscreteRandVar):
+    '''
+    The state of a Markov chain at one of its steps. Its distribution is
+    the marginal distribution of the chain at the step, and its covariance
+    with the state at another step follows from the transition matrix.
+    '''
+
+    __slots__ = ('chain', 'step')
+
+
+    def __init__(self, chain, step):
+        DiscreteRandVar.__init__(self)
+        self.chain = chain
+        self.step = step
+
+        self._add_parents(chain)
+
+
+    def _new_sample(self):
+        return self.chain.states[self.chain.sample()[self.step]].item()
+
+
+    def _new_sample_batch(self, size, batch):
+        return self.chain.states[self.chain.sample_batch(size, batch)[:, self.step]]
+
+
+    def _new_mean(self, fixed_means):
+        if self.chain in fixed_means:
+            return self.chain.states[self.chain._path_state(fixed_means[self.chain], self.step)].item()
+        return np.dot(self.chain.marginal(self.step), self.chain.states).item()
+
+
+    def _new_variance(self):
+        mean = self.mean()
+        return np.dot(self.chain.marginal(self.step), (self.chain.states - mean) ** 2).item()
+
+
+    def _new_covariance(self, rv):
+        if not isinstance(rv, MarkovStateRandVar) or rv.chain is not self.chain:
+            return DiscreteRandVar._new_covariance(self, rv)
+        # E[X_t X_u] = sum over i, j of P(X_t = i) (P^(u - t))_ij s_i s_j for t <= u
+        first, second = (self, rv) if self.step <= rv.step else (rv, self)
+        states = self.chain.states
+        forward = np.linalg.matrix_power(self.chain.transitions, second.step - first.step) @ states
+        product = np.dot(self.chain.marginal(first.step) * states, forward)
+        return product.item() - self.mean() * rv.mean()
+
+
+    def _new_pmf(self, fixed_means):
+        if self.chain in fixed_means:
+            return {self.mean(fixed_means): 1}
+        pmf = {}
+        for x, p in zip(self.chain.states.tolist(), self.chain.marginal(self.step).tolist()):
+            pmf[x] = pmf.get(x, 0) + p
+        return pmf
+
+
+class MarkovSumRandVar(DiscreteRandVar):
+    '''
+    The sum of the states of a Markov chain over all of its steps. The mean
+    and variance are found from the marginals of the chain and one backward
+    pass over the transition matrix, and the mass function by tracking the
+    distribution of the partial sums within every state.
+    '''
+
+    __slots__ = ('chain',)
+
+
+    def __init__(self, chain):
+        DiscreteRandVar.__init__(self)
+        self.chain = chain
+
+        self._add_parents(chain)
+
+
+    def _new_sample(self):
+        return self.chain.states[self.chain.sample()].sum().item()
+
+
+    def _new_sample_batch(self, size, batch):
+        return self.chain.states[self.chain.sample_batch(size, batch)].sum(axis=1)
+
+
+    def _new_mean(self, fixed_means):
+        chain = self.chain
+        if chain in fixed_means:
+            path = fixed_means[chain]
+            return sum(chain.states[chain._path_state(path, t)].item() for t in range(chain.steps))
+        return (chain.marginals() @ chain.states).sum().item()
+
+
+    def _new_variance(self):
+        # Var[S] = sum over t of E[X_t^2] + 2 sum over t < u of E[X_t X_u] - E[S]^2.
+        # The inner sum over u of E[X_u | X_t = i] is found backwards in time:
+        # g_t = P(s + g_(t + 1)), starting from g_(T - 1) = 0
+        chain = self.chain
+        states = chain.states.astype(np.float64)
+        marginals = chain.marginals()
+        ahead = np.zeros(len(states))
+        second_moment = 0
+        for t in range(chain.steps - 1, -1, -1):
+            second_moment += np.dot(marginals[t], states * (states + 2 * ahead))
+            ahead = chain.transitions @ (states + ahead)
+        mean = self.mean()
+        return (second_moment - mean * mean).item()
+
+
+    def _new_pmf(self, fixed_means):
+        chain = self.chain
+        if chain in fixed_means:
+            return {self.mean(fixed_means): 1}
+        states = chain.states.tolist()
+        transitions = chain.transitions.tolist()
+        # The distribution of the partial sum, for every current state
+        partial = [{x: p} for x, p in zip(states, chain.initial.tolist())]
+        for t in range(1, chain.steps):
+            following = [{} for _ in states]
+            for i, sums in enumerate(partial):
+                for j, x in enumerate(states):
+                    q = transitions[i][j]
+                    if q == 0:
+                        continue
+                    for total, p in sums.items():
+                        following[j][total + x] = following[j].get(total + x, 0) + p * q
+            partial = following
+        pmf = {}
+        for sums in partial:
+            for total, p in sums.items():
+                pmf[total] = pmf.get(total, 0) + p
+        return pmf
@@ -0,0 +1,259 @@
+from abc import abstractmethod
+
+from .randvar import DiscreteRandVar, _root_combinations, _pmf_arrays, _broadcast, _shared_roots
+
+import operator
+import numpy as np
+
+
+class OrderDiscreteRandVar(DiscreteRandVar):
+    '''
+    The base class of random variables that only depend on how the outputs
+    of two discrete random variables X and Y are ordered, such as max(X, Y),
+    min(X, Y) and X < Y.
+
+    Rather than pairing up every value of X with every value of Y, the mass
+    function is found from the cumulative distribution functions of X and
+    Y. When X and Y are independent, this only needs their supports in
+    sorted order, so it takes O(n log n) time. When X and Y share roots,
+    the shared roots are enumerated so that, within every combination,
+    X and Y are independent again.
+    '''
+
+    __slots__ = ('rv1', 'rv2')
+
+
+    def __init__(self, rv1, rv2):
+        DiscreteRandVar.__init__(self)
+        self.rv1 = rv1
+        self.rv2 = rv2
+
+        self._add_parents(rv1, rv2)
+
+
+    def _new_sample(self):
+        return self._apply(self.rv1.sample(), self.rv2.sample())
+
+
+    def _new_sample_batch(self, size, batch):
+        return self._apply_batch(self.rv1.sample_batch(size, batch), self.rv2.sample_batch(size, batch))
+
+
+    def _new_mean(self, fixed_means):
+        values, probabilities = _pmf_arrays(self.pmf(fixed_means))
+        mean = np.tensordot(probabilities, values, axes=(0, 0))
+        return mean.item() if np.ndim(mean) == 0 else mean
+
+
+    def _new_variance(self):
+        values, probabilities = _pmf_arrays(self.pmf())
+        mean = np.tensordot(probabilities, values, axes=(0, 0))
+        variance = np.tensordot(probabilities, values * values, axes=(0, 0)) - mean * mean
+        return variance.item() if np.ndim(variance) == 0 else variance
+
+
+    def _new_pmf(self, fixed_means):
+        shared_roots = _shared_roots(self.rv1, self.rv2)
+        pmf = {}
+        for weight, fixes in _root_combinations(shared_roots, fixed_means):
+            values1, probabilities1 = _pmf_arrays(self.rv1.pmf(fixes))
+            values2, probabilities2 = _pmf_arrays(self.rv2.pmf(fixes))
+            probabilities1, probabilities2 = _broadcast(probabilities1, probabilities2)
+            values, probabilities = self._independent_pmf(values1, probabilities1, values2, probabilities2)
+            probabilities = weight * probabilities
+            rows = list(probabilities) if probabilities.ndim > 1 else probabilities.tolist()
+            for x, p in zip(values.tolist(), rows):
+                pmf[x] = pmf.get(x, 0) + p
+        return pmf
+
+
+    @abstractmethod
+    def _apply(self, x, y):
+        '''Implemented by subclasses, combines a single sample of each operand'''
+
+        pass
+
+
+    @abstractmethod
+    def _apply_batch(self, x, y):
+        '''Implemented by subclasses, combines a batch of samples of each operand'''
+
+        pass
+
+
+    @abstractmethod
+    def _independent_pmf(self, values1, probabilities1, values2, probabilities2):
+        '''Implemented by subclasses, calculates the sorted values and
+        probabilities of the result for independent operands, given their
+        sorted values and probabilities'''
+
+        pass
+
+
+class MaximumDiscreteRandVar(OrderDiscreteRandVar):
+    '''
+    Given two discrete random variables X and Y, this is the
+    random variable max(X, Y). For independent X and Y,
+    P(max(X, Y) <= t) = P(X <= t)P(Y <= t).
+    '''
+
+    __slots__ = ()
+
+
+    def _apply(self, x, y):
+        return max(x, y)
+
+
+    def _apply_batch(self, x, y):
+        return np.maximum(x, y)
+
+
+    def _independent_pmf(self, values1, probabilities1, values2, probabilities2):
+        # The maximum can never be below the larger of the two minimums
+        values = np.union1d(values1, values2)
+        values = values[values >= max(values1[0], values2[0])]
+        cdf = _cdf(values1, probabilities1, values, 'right') * _cdf(values2, probabilities2, values, 'right')
+        return values, np.diff(cdf, axis=0, prepend=np.zeros((1,) + cdf.shape[1:]))
+
+
+class MinimumDiscreteRandVar(OrderDiscreteRandVar):
+    '''
+    Given two discrete random variables X and Y, this is the
+    random variable min(X, Y). For independent X and Y,
+    P(min(X, Y) > t) = P(X > t)P(Y > t).
+    '''
+
+    __slots__ = ()
+
+
+    def _apply(self, x, y):
+        return min(x, y)
+
+
+    def _apply_batch(self, x, y):
+        return np.minimum(x, y)
+
+
+    def _independent_pmf(self, values1, probabilities1, values2, probabilities2):
+        # The minimum can never be above the smaller of the two maximums
+        values = np.union1d(values1, values2)
+        values = values[values <= min(values1[-1], values2[-1])]
+        survival1 = 1 - _cdf(values1, probabilities1, values, 'right')
+        survival2 = 1 - _cdf(values2, probabilities2, values, 'right')
+        cdf = 1 - survival1 * survival2
+        return values, np.diff(cdf, axis=0, prepend=np.zeros((1,) + cdf.shape[1:]))
+
+
+class ComparisonDiscreteRandVar(OrderDiscreteRandVar):
+    '''
+    Given two discrete random variables X and Y and one of the
+    comparisons <, <=, > and >=, this is the indicator random
+    variable that outputs 1 when the comparison holds and 0
+    otherwise. For independent X and Y, P(X < Y) is the sum of
+    P(Y = y)P(X < y) over the support of Y.
+    '''
+
+    __slots__ = ('op',)
+
+
+    OPERATORS = [operator.lt, operator.le, operator.gt, operator.ge]
+
+
+    def __init__(self, rv1, rv2, op):
+        '''
+        Args:
+            rv1: The left operand
+            rv2: The right operand
+            op: One of operator.lt, operator.le, operator.gt and operator.ge
+        '''
+
+        if op not in ComparisonDiscreteRandVar.OPERATORS:
+            raise ValueError("Comparison must be one of <, <=, > and >=")
+        OrderDiscreteRandVar.__init__(self, rv1, rv2)
+        self.op = op
+
+
+    def _apply(self, x, y):
+        return 1 if self.op(x, y) else 0
+
+
+    def _apply_batch(self, x, y):
+        return self.op(x, y).astype(np.int64)
+
+
+    def _independent_pmf(self, values1, probabilities1, values2, probabilities2):
+        # X > Y is Y < X and X >= Y is Y <= X
+        if self.op is operator.gt or self.op is operator.ge:
+            values1, probabilities1, values2, probabilities2 = values2, probabilities2, values1, probabilities1
+        side = 'left' if self.op is operator.lt or self.op is operator.gt else 'right'
+        cdf = _cdf(values1, probabilities1, values2, side)
+        probability = (cdf * probabilities2).sum(axis=0)
+        return np.asarray([0, 1]), np.stack([1 - probability, probability])
+
+
+class ThresholdFunction:
+    '''
+    The function that compares its input to a constant, returning 1 when
+    the comparison holds and 0 otherwise. Whole numpy arrays can be passed
+    in at once.
+    '''
+
+    def __init__(self, op, c):
+        self.op = op
+        self.c = c
+
+
+    def __call__(self, x):
+        result = self.op(x, self.c)
+        if isinstance(result, np.ndarray):
+            return result.astype(np.int64)
+        return 1 if result else 0
+
+
+class ClipFunction:
+    '''
+    The function that returns the larger (or smaller) of its input and a
+    constant. Whole numpy arrays can be passed in at once.
+    '''
+
+    def __init__(self, c, upper):
+        '''
+        Args:
+            c: The constant
+            upper: True to return the smaller of the input and the constant,
+            capping the input, or False to return the larger, flooring it
+        '''
+
+        self.c = c
+        self.upper = upper
+
+
+    def __call__(self, x):
+        if isinstance(x, np.ndarray):
+            return np.minimum(x, self.c) if self.upper else np.maximum(x, self.c)
+        return min(x, self.c) if self.upper else max(x, self.c)
+
+
+class MembershipFunction:
+    '''
+    The function that returns 1 when its input belongs to a set of values
+    and 0 otherwise. Whole numpy arrays can be passed in at once.
+    '''
+
+    def __init__(self, values):
+        self.values = set(values)
+
+
+    def __call__(self, x):
+        if isinstance(x, np.ndarray):
+            return np.isin(x, list(self.values)).astype(np.int64)
+        return 1 if x in self.values else 0
+
+
+def _cdf(values, probabilities, points, side):
+    '''Evaluates P(X <= t) at every point t if side is 'right', or P(X < t)
+    if side is 'left', given the sorted values and probabilities of X'''
+
+    cumulative = np.cumsum(probabilities, axis=0)
+    cumulative = np.concatenate([np.zeros((1,) + cumulative.shape[1:]), cumulative])
+    return cumulative[np.searchsorted(values, points, side=side)]
@@ -0,0 +1,251 @@
+from .. import profiling
+from ..randvar import _mask_roots
+from .randvar import DiscreteRandVar, ConstantPlusDiscreteRandVar, DiscretePlusDiscreteRandVar, \
+    ConstantTimesDiscreteRandVar, DiscreteTimesDiscreteRandVar
+from .root_randvar import RootDiscreteRandVar
+from .unary_randvar import UnaryDiscreteRandVar
+from .binary_randvar import BinaryDiscreteRandVar
+from .order_randvar import MaximumDiscreteRandVar, MinimumDiscreteRandVar, ComparisonDiscreteRandVar
+from .closed_form_randvar import AffineDiscreteRandVar, BinomialSumDiscreteRandVar
+
+import functools
+import operator
+import numpy as np
+
+
+# The largest number of roots that a group of queries may span, since every
+# root becomes an axis of the grid
+MAX_AXES = 32
+
+# The largest number of grid cells that any single query may cover
+MAX_CELLS = 1 << 22
+
+
+def evaluate(queries):
+    '''
+    Answers many queries about discrete random variables together. A query
+    is either the bound method X.mean or X.variance of a random variable X,
+    or a pair (X, Y) of random variables for their covariance:
+
+        mean, variance, covariance = evaluate([X.mean, Y.variance, (X, Z)])
+
+    Answering every query on its own enumerates the combinations of the
+    shared roots of every product and transformation again and again. The
+    planner instead groups the queries by the roots they depend on, so that
+    queries on disjoint roots are handled separately. The roots of a group
+    become the axes of a grid, and every random variable involved is
+    evaluated once over the axes of its own roots, with numpy broadcasting.
+    Subexpressions shared between queries are evaluated only once. Means,
+    variances and covariances are then weighted sums over the grid, and
+    are cached on the random variables as if they had been queried one by
+    one.
+
+    Groups whose grids would be too large, or that contain random variables
+    that cannot be evaluated on a grid, fall back to answering each query
+    on its own.
+
+    Args:
+        queries: A list of queries
+
+    Returns:
+        A list of the answers, in the order of the queries
+    '''
+
+    parsed = [_parse(query) for query in queries]
+    answers = [None] * len(parsed)
+    for group in _groups(parsed):
+        try:
+            grid = _Grid([_mask(parsed[i][1]) for i in group])
+            for i in group:
+                answers[i] = grid.answer(*parsed[i])
+        except _Unsupported:
+            for i in group:
+                answers[i] = _answer(*parsed[i])
+    return answers
+
+
+class _Unsupported(Exception):
+    '''Raised when a group of queries cannot be evaluated on a grid'''
+
+
+class _Grid:
+    '''
+    The joint grid of the roots of a group of random variables, where every
+    root is an axis. Values of random variables are arrays that broadcast
+    over the grid and only extend along the axes of their own roots.
+    '''
+
+    def __init__(self, masks):
+        '''
+        Args:
+            masks: The root masks of the queries of the group
+        '''
+
+        mask = 0
+        for query_mask in masks:
+            mask |= query_mask
+        roots = _mask_roots(mask)
+        if len(roots) > MAX_AXES or not all(isinstance(rrv, RootDiscreteRandVar) for rrv in roots):
+            raise _Unsupported()
+        # The values of a query, and of every random variable it is built
+        # from, only extend along the axes of the roots of the query
+        try:
+            sizes = {rrv: len(rrv.support()[0]) for rrv in roots}
+        except ValueError:
+            # Some roots, such as long Markov chains, are too large to enumerate
+            raise _Unsupported()
+        for query_mask in masks:
+            if functools.reduce(operator.mul, [sizes[rrv] for rrv in _mask_roots(query_mask)], 1) > MAX_CELLS:
+                raise _Unsupported()
+
+        self.weights = []
+        self.values = {}
+        for axis, rrv in enumerate(roots):
+            values, probabilities = rrv.support()
+            if probabilities.ndim > 1:
+                # Parameter sweeps have a probability array per value
+                raise _Unsupported()
+            shape = [1] * len(roots)
+            shape[axis] = len(values)
+            self.weights.append(probabilities)
+            self.values[rrv] = values.reshape(shape)
+
+
+    def answer(self, kind, rvs):
+        if kind == 'mean':
+            rv, = rvs
+            if rv.saved_mean is None:
+                rv.saved_mean = self._expectation(self.value(rv))
+            return rv.saved_mean
+        elif kind == 'variance':
+            rv, = rvs
+            if rv.saved_variance is None:
+                deviations = self.value(rv) - self.answer('mean', rvs)
+                rv.saved_variance = self._expectation(deviations * deviations)
+            return rv.saved_variance
+        rv1, rv2 = rvs
+        covariance = None if rv1._covariances is None else rv1._covariances.get(rv2)
+        if covariance is None:
+            deviations1 = self.value(rv1) - self.answer('mean', (rv1,))
+            deviations2 = self.value(rv2) - self.answer('mean', (rv2,))
+            covariance = self._expectation(deviations1 * deviations2)
+            rv1._save_covariance(rv2, covariance)
+        return covariance
+
+
+    def value(self, rv):
+        '''Evaluates a random variable over the axes of its roots, reusing
+        the values of subexpressions that were already evaluated'''
+
+        # Nodes are evaluated parents first, without recursion, so that
+        # deep graphs do not exceed the recursion limit
+        stack = [rv]
+        while len(stack) > 0:
+            node = stack[-1]
+            if node in self.values:
+                stack.pop()
+                continue
+            missing = [parent for parent in node.parents if parent not in self.values]
+            if len(missing) > 0:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            self.values[node] = self._evaluate(node)
+        return self.values[rv]
+
+
+    def _evaluate(self, rv):
+        values = self.values
+        if isinstance(rv, ConstantPlusDiscreteRandVar):
+            return values[rv.rv] + rv.c
+        elif isinstance(rv, ConstantTimesDiscreteRandVar):
+            return values[rv.rv] * rv.c
+        elif isinstance(rv, AffineDiscreteRandVar):
+            return values[rv.rv] * rv.scale + rv.shift
+        elif isinstance(rv, (DiscretePlusDiscreteRandVar, BinomialSumDiscreteRandVar)):
+            return values[rv.rv1] + values[rv.rv2]
+        elif isinstance(rv, DiscreteTimesDiscreteRandVar):
+            return values[rv.rv1] * values[rv.rv2]
+        elif isinstance(rv, MaximumDiscreteRandVar):
+            return np.maximum(values[rv.rv1], values[rv.rv2])
+        elif isinstance(rv, MinimumDiscreteRandVar):
+            return np.minimum(values[rv.rv1], values[rv.rv2])
+        elif isinstance(rv, ComparisonDiscreteRandVar):
+            return rv.op(values[rv.rv1], values[rv.rv2]).astype(np.int64)
+        elif isinstance(rv, UnaryDiscreteRandVar):
+            x = values[rv.rv]
+            if rv.vectorized:
+                return np.asarray(rv.func(x))
+            # The function is only called once per distinct value
+            distinct, inverse = np.unique(x, return_inverse=True)
+            return np.asarray([rv.func(value) for value in distinct.tolist()])[inverse].reshape(x.shape)
+        elif isinstance(rv, BinaryDiscreteRandVar):
+            x, y = values[rv.rv1], values[rv.rv2]
+            if rv.vectorized:
+                return np.asarray(rv.func(x, y))
+            x, y = np.broadcast_arrays(x, y)
+            return np.asarray([rv.func(a, b) for a, b in zip(x.ravel().tolist(), y.ravel().tolist())]).reshape(x.shape)
+        raise _Unsupported()
+
+
+    def _expectation(self, values):
+        '''Sums the values weighted by the probabilities of the roots along
+        every axis they extend over'''
+
+        if profiling.current is not None:
+            profiling.current.enumerate(int(np.size(values)))
+        result = values
+        for axis in range(np.ndim(values) - 1, -1, -1):
+            if result.shape[axis] > 1:
+                result = np.tensordot(result, self.weights[axis], axes=([axis], [0]))
+            else:
+                result = result.sum(axis=axis)
+        return result.item()
+
+
+def _parse(query):
+    '''Returns the kind of a query and the random variables it is about'''
+
+    if isinstance(query, tuple) and len(query) == 2 and all(isinstance(rv, DiscreteRandVar) for rv in query):
+        return 'covariance', query
+    rv = getattr(query, '__self__', None)
+    name = getattr(query, '__name__', None)
+    if isinstance(rv, DiscreteRandVar) and name in ('mean', 'variance'):
+        return name, (rv,)
+    raise ValueError("A query must be X.mean, X.variance or a pair of random variables (X, Y)")
+
+
+def _answer(kind, rvs):
+    '''Answers a query on its own'''
+
+    if kind == 'mean':
+        return rvs[0].mean()
+    elif kind == 'variance':
+        return rvs[0].variance()
+    return rvs[0].covariance(rvs[1])
+
+
+def _groups(parsed):
+    '''Groups the queries whose random variables share roots, directly or
+    through other queries, returning the indices of every group'''
+
+    groups = []
+    for i, (kind, rvs) in enumerate(parsed):
+        mask = _mask(rvs)
+        indices = [i]
+        remaining = []
+        for group_mask, group in groups:
+            if group_mask & mask:
+                mask |= group_mask
+                indices = group + indices
+            else:
+                remaining.append((group_mask, group))
+        groups = remaining + [(mask, sorted(indices))]
+    return [group for _, group in groups]
+
+
+def _mask(rvs):
+    mask = 0
+    for rv in rvs:
+        mask |= rv.root_mask()
+    return mask
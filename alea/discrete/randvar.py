@@ -1,7 +1,12 @@
-from ..randvar import RandVar
+from ..randvar import RandVar, _shared_roots
+from .. import profiling
+from . import cache
 
+import functools
 import itertools
+import operator
 import copy
+import numpy as np
 
 
 class DiscreteRandVar(RandVar):
@@ -16,6 +21,304 @@ class DiscreteRandVar(RandVar):
         subtractions, and arbitrary transformations.
     '''
 
+    __slots__ = ('saved_pmf', 'saved_mean_gradient', 'saved_variance_gradient', 'saved_hash')
+
+
+    def __init__(self):
+        RandVar.__init__(self)
+        self.saved_pmf = None
+        self.saved_mean_gradient = None
+        self.saved_variance_gradient = None
+        self.saved_hash = None
+
+
+    def pmf(self, fixed_means={}):
+        '''
+        Returns the theoretical probability mass function as a dictionary
+        mapping every value in the support to its probability. Like the
+        mean, the mass function is cached upon calculation.
+
+        The {fixed_means} dictionary behaves exactly as it does for the
+        mean: every root random variable in it is treated as if it always
+        takes the preset value. The result is then the mass function
+        conditioned on those roots.
+
+        Args:
+            fixed_means: A dictionary mapping random variables to preset means
+
+        Returns:
+            A dictionary mapping every value in the support to its probability
+        '''
+
+        if self in fixed_means:
+            return {fixed_means[self]: 1}
+        if len(fixed_means) > 0:
+            return self._calculation('_new_pmf')(fixed_means)
+        if profiling.current is not None:
+            profiling.current.cache('pmf', self.saved_pmf is not None)
+        if self.saved_pmf is None:
+            self.saved_pmf = self._calculation('_new_pmf')(fixed_means)
+        return self.saved_pmf
+
+
+    def cdf(self, x, approx=None):
+        '''
+        Returns the theoretical cumulative distribution function at a point,
+        which is the probability that this random variable is at most {x}.
+
+        Args:
+            x: The point to evaluate the distribution function at
+            approx: None for the exact result, or 'normal' or 'edgeworth'
+            to approximate it, as in approximation()
+
+        Returns:
+            P(X <= x)
+        '''
+
+        if approx is not None:
+            return self.approximation(approx).cdf(x)
+        return sum(p for value, p in self.pmf().items() if value <= x)
+
+
+    def tail_probability(self, x, approx=None):
+        '''
+        Returns the probability that this random variable exceeds {x}. This
+        is summed directly rather than calculated as 1 - cdf(x), so that
+        small tail probabilities keep their precision.
+
+        Args:
+            x: The threshold of the tail
+            approx: None for the exact result, or 'normal' or 'edgeworth'
+            to approximate it, as in approximation()
+
+        Returns:
+            P(X > x)
+        '''
+
+        if approx is not None:
+            return self.approximation(approx).tail_probability(x)
+        return sum(p for value, p in self.pmf().items() if value > x)
+
+
+    def quantile(self, q, approx=None):
+        '''
+        Returns the theoretical quantile function at a probability, which is
+        the smallest value x in the support such that P(X <= x) >= q.
+
+        Args:
+            q: A probability between 0 and 1
+            approx: None for the exact result, or 'normal' or 'edgeworth'
+            to approximate it, as in approximation()
+
+        Returns:
+            The {q}-quantile of the random variable
+        '''
+
+        if approx is not None:
+            return self.approximation(approx).quantile(q)
+        values, probabilities = _pmf_arrays(self.pmf())
+        cdf = np.cumsum(probabilities, axis=0)
+        # Allow for rounding errors in the cumulative sums
+        indices = np.argmax(cdf >= q - 1e-12, axis=0)
+        quantile = values[indices]
+        return quantile.item() if np.ndim(quantile) == 0 else quantile
+
+
+    def approximation(self, method='normal'):
+        '''
+        Approximates the distribution of this random variable by the central
+        limit theorem, which is accurate for sums of many small, independent
+        or weakly dependent terms. The exact mean and variance are used, and
+        with the 'edgeworth' method, the skewness and excess kurtosis as
+        well. Only the mass functions of the independent summands of a sum
+        are calculated, never that of the sum itself, so approximations are
+        far cheaper than exact distribution functions.
+
+        Args:
+            method: Either 'normal' or 'edgeworth'
+
+        Returns:
+            The Approximation, which includes a Berry-Esseen bound on the
+            error of the normal distribution function
+        '''
+
+        from .approximation import Approximation
+        return Approximation(self, method)
+
+
+    def mean_gradient(self, fixed_means={}):
+        '''
+        Returns the derivatives of the theoretical mean with respect to the
+        probabilities of every root. The probability P(R = x) of every value
+        x of every root R is treated as an independent coordinate, so the
+        derivative with respect to it equals E[X | R = x]. Derivatives are
+        propagated alongside the calculation of the mean (forward mode), so
+        all of them are found in a single pass over the graph. Like the
+        mean, the result is cached upon calculation.
+
+        Args:
+            fixed_means: A dictionary mapping random variables to preset
+            means, as in mean(). Fixed roots have no derivatives
+
+        Returns:
+            A dictionary mapping every root to a numpy array of derivatives,
+            ordered like the values of root.support()
+        '''
+
+        if self in fixed_means:
+            return {}
+        if len(fixed_means) > 0:
+            return self._calculation('_new_mean_gradient')(fixed_means)
+        if self.saved_mean_gradient is None:
+            self.saved_mean_gradient = self._calculation('_new_mean_gradient')(fixed_means)
+        return self.saved_mean_gradient
+
+
+    def variance_gradient(self):
+        '''
+        Returns the derivatives of the theoretical variance with respect to
+        the probabilities of every root, in the same form as mean_gradient().
+        Derivatives are propagated through the same decomposition that the
+        variance is calculated with: sums add the derivatives of the
+        variances of their operands and of their covariance, which vanishes
+        for operands without shared roots, and constant factors scale them.
+        Like the variance, the result is cached upon calculation.
+
+        The probabilities of every root sum to 1, so the derivatives with
+        respect to them are only determined up to a constant per root,
+        which depends on the decomposition. The constant cancels from every
+        change that keeps the probabilities summing to 1, such as a change
+        of the parameters of the root.
+
+        Returns:
+            A dictionary mapping every root to a numpy array of derivatives,
+            ordered like the values of root.support()
+        '''
+
+        if self.saved_variance_gradient is None:
+            self.saved_variance_gradient = self._calculation('_new_variance_gradient')()
+        return self.saved_variance_gradient
+
+
+    def sensitivities(self):
+        '''
+        Returns the sensitivities of the theoretical mean and variance to
+        every root: the derivatives with respect to the probabilities of the
+        root, and the derivatives with respect to every parameter of the
+        root that has one, such as the success rate of a Binomial random
+        variable. Everything is found from a single pass over the graph for
+        the mean and one for the variance.
+
+        Returns:
+            A dictionary mapping every root to its Sensitivity
+        '''
+
+        from .sensitivity import Sensitivity
+        mean_gradient = self.mean_gradient()
+        variance_gradient = self.variance_gradient()
+        return {rrv: Sensitivity(rrv, mean_gradient[rrv], variance_gradient[rrv]) for rrv in self.roots()}
+
+
+    def given(self, event):
+        '''
+        Conditions this random variable on an event. An event is a discrete
+        random variable that only takes the values 0 and 1, such as the
+        result of a comparison (Y > 0) or a combination of comparisons
+        using &, | and ~.
+
+        The conditional distribution is computed exactly rather than by
+        rejection sampling, so rare events cost no more than likely ones.
+        The result depends on this random variable and on the event, and
+        is recalculated when either changes. It shares the roots of this
+        random variable that the event does not depend on with the rest
+        of the graph, and conditionals on the same event are dependent
+        on each other through it.
+
+        Args:
+            event: A discrete random variable taking the values 0 and 1
+
+        Returns:
+            The conditional random variable
+        '''
+
+        from .conditional_randvar import ConditionalDiscreteRandVar
+        return ConditionalDiscreteRandVar(self, event)
+
+
+    def structural_hash(self):
+        '''
+        Returns a hash of the structure of this random variable: the types,
+        constants and root mass functions of it and every random variable
+        it depends on, and how they are connected. Two random variables
+        with the same hash have the same distribution, even if they were
+        built separately or in different processes, which makes the hash a
+        key for caches that outlive the process. Like the mean, the hash is
+        cached upon calculation.
+
+        Returns:
+            The hash as a hexadecimal string
+        '''
+
+        if self.saved_hash is None:
+            from .serialize import structural_hash
+            structural_hash(self)
+        return self.saved_hash
+
+
+    def _clear_caches(self):
+        RandVar._clear_caches(self)
+        self.saved_pmf = None
+        self.saved_mean_gradient = None
+        self.saved_variance_gradient = None
+        self.saved_hash = None
+
+
+    def _calculation(self, method):
+        if cache.active() is None:
+            return RandVar._calculation(self, method)
+        return functools.partial(self._evaluate, method)
+
+
+    def _evaluate(self, method, *args):
+        # With a persistent cache active, results are looked up by the
+        # structural hash before they are calculated
+        if cache.active() is None or method not in _CACHED_METHODS or not self._parents:
+            return RandVar._evaluate(self, method, *args)
+        if method != '_new_variance' and len(args[0]) > 0:
+            return RandVar._evaluate(self, method, *args)
+        return cache.evaluate(self, _CACHED_METHODS[method], lambda: RandVar._evaluate(self, method, *args))
+
+
+    def _new_pmf(self, fixed_means):
+        # Once every root is fixed, the random variable collapses to a
+        # single value, so enumerating the roots yields the distribution
+        pmf = {}
+        for weight, fixes in _root_combinations(list(self.roots()), fixed_means):
+            value = self.mean(fixes)
+            pmf[value] = pmf.get(value, 0) + weight
+        return pmf
+
+
+    def _new_mean_gradient(self, fixed_means):
+        # By default, enumerate the roots like the mass function does. The
+        # mean is the sum of P(combination) * value over all combinations,
+        # and P(combination) is the product of the probabilities of the
+        # roots, so the derivative with respect to one root's probability
+        # is the product of the others
+        roots = [rrv for rrv in self.roots() if rrv not in fixed_means]
+        gradient = _zero_gradient(roots)
+        for fixes, partials in _root_partials(roots, fixed_means):
+            value = self.mean(fixes)
+            for rrv, partial in zip(roots, partials):
+                gradient[rrv][_support_index(rrv, fixes[rrv])] += partial * value
+        return gradient
+
+
+    def _new_variance_gradient(self):
+        # By default, differentiate Var[X] = E[X^2] - E[X]^2
+        return _add_gradients((self ** 2).mean_gradient(), 1, self.mean_gradient(), -2 * self.mean())
+
+
     def _new_variance(self):
         # Variance is equal to E[X^2] - E[X]E[X]
         return (self ** 2).mean() - self.mean() ** 2
@@ -27,24 +330,204 @@ class DiscreteRandVar(RandVar):
 
 
     def __add__(self, obj):
+        # Sums with closed-form distributions are rewritten as they are built
+        from .rewrite import rewrite_affine, rewrite_plus
         if isinstance(obj, int) or isinstance(obj, float):
-            return ConstantPlusDiscreteRandVar(self, obj)
+            rewritten = rewrite_affine(self, 1, obj)
+            return ConstantPlusDiscreteRandVar(self, obj) if rewritten is None else rewritten
         elif isinstance(obj, DiscreteRandVar):
-            return DiscretePlusDiscreteRandVar(self, obj)
+            rewritten = rewrite_plus(self, obj)
+            return DiscretePlusDiscreteRandVar(self, obj) if rewritten is None else rewritten
         else:
             raise ValueError("Right operand must be constant or randvar")
 
 
     def __mul__(self, obj):
+        from .rewrite import rewrite_affine
         if isinstance(obj, int) or isinstance(obj, float):
-            return ConstantTimesDiscreteRandVar(self, obj)
+            rewritten = rewrite_affine(self, obj, 0)
+            return ConstantTimesDiscreteRandVar(self, obj) if rewritten is None else rewritten
         elif isinstance(obj, DiscreteRandVar):
             return DiscreteTimesDiscreteRandVar(self, obj)
         else:
             raise ValueError("Right operand must be constant or randvar")
 
 
+    def __radd__(self, obj):
+        return self + obj
+
+
+    def __rmul__(self, obj):
+        return self * obj
+
+
+    def __rsub__(self, obj):
+        return self * -1 + obj
+
+
+    def __truediv__(self, obj):
+        if isinstance(obj, int) or isinstance(obj, float):
+            return self * (1 / obj)
+        return self._binary(obj, np.true_divide)
+
+
+    def __rtruediv__(self, obj):
+        return self._binary(obj, np.true_divide, True)
+
+
+    def __floordiv__(self, obj):
+        return self._binary(obj, np.floor_divide)
+
+
+    def __rfloordiv__(self, obj):
+        return self._binary(obj, np.floor_divide, True)
+
+
+    def __mod__(self, obj):
+        return self._binary(obj, np.mod)
+
+
+    def __rmod__(self, obj):
+        return self._binary(obj, np.mod, True)
+
+
+    def __rpow__(self, obj):
+        return self._binary(obj, np.power, True)
+
+
+    def __lt__(self, obj):
+        return self._compare(obj, operator.lt)
+
+
+    def __le__(self, obj):
+        return self._compare(obj, operator.le)
+
+
+    def __gt__(self, obj):
+        return self._compare(obj, operator.gt)
+
+
+    def __ge__(self, obj):
+        return self._compare(obj, operator.ge)
+
+
+    def __and__(self, event):
+        # Both indicators must be one for the intersection to occur
+        return self * event
+
+
+    def __or__(self, event):
+        # Inclusion-exclusion on indicators: 1{A or B} = 1{A} + 1{B} - 1{A}1{B}
+        return self + event - self * event
+
+
+    def __invert__(self):
+        return self * -1 + 1
+
+
+    def maximum(self, obj):
+        '''
+        Returns the larger of this random variable and another random
+        variable or a constant. With a constant c, this floors the random
+        variable at c.
+
+        Args:
+            obj: A discrete random variable or a constant
+
+        Returns:
+            The random variable max(X, obj)
+        '''
+
+        from .unary_randvar import UnaryDiscreteRandVar
+        from .order_randvar import MaximumDiscreteRandVar, ClipFunction
+        if isinstance(obj, int) or isinstance(obj, float):
+            return UnaryDiscreteRandVar(self, ClipFunction(obj, False), True)
+        elif isinstance(obj, DiscreteRandVar):
+            return MaximumDiscreteRandVar(self, obj)
+        else:
+            raise ValueError("Right operand must be constant or randvar")
+
+
+    def minimum(self, obj):
+        '''
+        Returns the smaller of this random variable and another random
+        variable or a constant. With a constant c, this caps the random
+        variable at c.
+
+        Args:
+            obj: A discrete random variable or a constant
+
+        Returns:
+            The random variable min(X, obj)
+        '''
+
+        from .unary_randvar import UnaryDiscreteRandVar
+        from .order_randvar import MinimumDiscreteRandVar, ClipFunction
+        if isinstance(obj, int) or isinstance(obj, float):
+            return UnaryDiscreteRandVar(self, ClipFunction(obj, True), True)
+        elif isinstance(obj, DiscreteRandVar):
+            return MinimumDiscreteRandVar(self, obj)
+        else:
+            raise ValueError("Right operand must be constant or randvar")
+
+
+    def indicator(self, event, vectorized=False):
+        '''
+        Returns the indicator random variable of an event on the outputs of
+        this random variable, which outputs 1 when the event occurs and 0
+        otherwise.
+
+        Args:
+            event: Either a collection of values, in which case the event is
+            that this random variable takes one of them, or a function that
+            returns whether the event occurs for a given value
+            vectorized: Whether the function can be applied to a whole numpy
+            array of values at once
+
+        Returns:
+            The indicator random variable
+        '''
+
+        from .unary_randvar import UnaryDiscreteRandVar
+        from .order_randvar import MembershipFunction
+        if callable(event):
+            if vectorized:
+                return UnaryDiscreteRandVar(self, lambda x : np.asarray(event(x)).astype(np.int64), True)
+            return UnaryDiscreteRandVar(self, lambda x : 1 if event(x) else 0)
+        return UnaryDiscreteRandVar(self, MembershipFunction(event), True)
+
+
+    def _compare(self, obj, op):
+        # Comparisons produce indicator random variables, which output 1
+        # when the comparison holds and 0 otherwise
+        from .unary_randvar import UnaryDiscreteRandVar
+        from .order_randvar import ComparisonDiscreteRandVar, ThresholdFunction
+        if isinstance(obj, int) or isinstance(obj, float):
+            return UnaryDiscreteRandVar(self, ThresholdFunction(op, obj), True)
+        elif isinstance(obj, DiscreteRandVar):
+            return ComparisonDiscreteRandVar(self, obj, op)
+        else:
+            raise ValueError("Right operand must be constant or randvar")
+
+
+    def _binary(self, obj, func, left=False):
+        # Applies a vectorized function of two arguments, where a constant
+        # operand is bound to the function instead. If left is True, obj
+        # is the left operand
+        from .unary_randvar import UnaryDiscreteRandVar
+        from .binary_randvar import BinaryDiscreteRandVar, BoundFunction
+        if isinstance(obj, int) or isinstance(obj, float):
+            return UnaryDiscreteRandVar(self, BoundFunction(func, obj, left), True)
+        elif isinstance(obj, DiscreteRandVar):
+            return BinaryDiscreteRandVar(obj, self, func) if left else BinaryDiscreteRandVar(self, obj, func)
+        else:
+            raise ValueError("Operand must be constant or randvar")
+
+
     def __pow__(self, num):
+        # A random exponent requires the general binary node
+        if isinstance(num, DiscreteRandVar):
+            return self._binary(num, np.power)
         # For now, perform exponentiation by squaring, reducing
         # exponentiation to logarithmic time
         if not isinstance(num, int):
@@ -61,110 +544,157 @@ class DiscreteRandVar(RandVar):
 
 class ConstantPlusDiscreteRandVar(DiscreteRandVar):
 
+    __slots__ = ('rv', 'c')
+
+
     def __init__(self, rv, c):
         DiscreteRandVar.__init__(self)
         self.rv = rv
         self.c = c
 
-        rv.children.add(self)
-        self.parents.add(rv)
-
-
-    def _new_roots(self):
-        return self.rv.roots()
+        self._add_parents(rv)
 
 
     def _new_sample(self):
         return self.rv.sample() + self.c
 
 
+    def _new_sample_batch(self, size, batch):
+        return self.rv.sample_batch(size, batch) + self.c
+
+
     def _new_mean(self, fixed_means):
         return self.rv.mean(fixed_means) + self.c
 
 
+    def _new_pmf(self, fixed_means):
+        pmf = {}
+        for x, p in self.rv.pmf(fixed_means).items():
+            pmf[x + self.c] = pmf.get(x + self.c, 0) + p
+        return pmf
+
+
+    def _new_mean_gradient(self, fixed_means):
+        return self.rv.mean_gradient(fixed_means)
+
+
     def _new_variance(self):
         return self.rv.variance()
 
 
+    def _new_variance_gradient(self):
+        return self.rv.variance_gradient()
+
+
 class DiscretePlusDiscreteRandVar(DiscreteRandVar):
 
+    __slots__ = ('rv1', 'rv2')
+
+
     def __init__(self, rv1, rv2):
         DiscreteRandVar.__init__(self)
         self.rv1 = rv1
         self.rv2 = rv2
 
-        rv1.children.add(self)
-        rv2.children.add(self)
-        self.parents.add(rv1)
-        self.parents.add(rv2)
-
-
-    def _new_roots(self):
-        return self.rv1.roots().union(self.rv2.roots())
+        self._add_parents(rv1, rv2)
 
 
     def _new_sample(self):
         return self.rv1.sample() + self.rv2.sample()
 
 
+    def _new_sample_batch(self, size, batch):
+        return self.rv1.sample_batch(size, batch) + self.rv2.sample_batch(size, batch)
+
+
     def _new_mean(self, fixed_means):
         return self.rv1.mean(fixed_means) + self.rv2.mean(fixed_means)
 
 
+    def _new_pmf(self, fixed_means):
+        return _binary_pmf(self.rv1, self.rv2, fixed_means, operator.add)
+
+
+    def _new_mean_gradient(self, fixed_means):
+        return _add_gradients(self.rv1.mean_gradient(fixed_means), 1, self.rv2.mean_gradient(fixed_means), 1)
+
+
     def _new_variance(self):
         return self.rv1.variance() + self.rv2.variance() + 2 * self.rv1.covariance(self.rv2)
 
 
+    def _new_variance_gradient(self):
+        gradient = _add_gradients(self.rv1.variance_gradient(), 1, self.rv2.variance_gradient(), 1)
+        return _add_gradients(gradient, 1, _covariance_gradient(self.rv1, self.rv2), 2)
+
+
 class ConstantTimesDiscreteRandVar(DiscreteRandVar):
 
+    __slots__ = ('rv', 'c')
+
+
     def __init__(self, rv, c):
         DiscreteRandVar.__init__(self)
         self.rv = rv
         self.c = c
 
-        rv.children.add(self)
-        self.parents.add(rv)
-
-
-    def _new_roots(self):
-        return self.rv.roots()
+        self._add_parents(rv)
 
 
     def _new_sample(self):
         return self.rv.sample() * self.c
 
 
+    def _new_sample_batch(self, size, batch):
+        return self.rv.sample_batch(size, batch) * self.c
+
+
     def _new_mean(self, fixed_means):
         return self.rv.mean(fixed_means) * self.c
 
 
+    def _new_pmf(self, fixed_means):
+        pmf = {}
+        for x, p in self.rv.pmf(fixed_means).items():
+            pmf[x * self.c] = pmf.get(x * self.c, 0) + p
+        return pmf
+
+
+    def _new_mean_gradient(self, fixed_means):
+        return _add_gradients(self.rv.mean_gradient(fixed_means), self.c)
+
+
     def _new_variance(self):
         return self.rv.variance() * self.c * self.c
 
 
+    def _new_variance_gradient(self):
+        return _add_gradients(self.rv.variance_gradient(), self.c * self.c)
+
+
 class DiscreteTimesDiscreteRandVar(DiscreteRandVar):
 
+    __slots__ = ('rv1', 'rv2')
+
+
     def __init__(self, rv1, rv2):
         DiscreteRandVar.__init__(self)
         self.rv1 = rv1
         self.rv2 = rv2
 
-        rv1.children.add(self)
-        rv2.children.add(self)
-        self.parents.add(rv1)
-        self.parents.add(rv2)
-
-
-    def _new_roots(self):
-        return self.rv1.roots().union(self.rv2.roots())
+        self._add_parents(rv1, rv2)
 
 
     def _new_sample(self):
         return self.rv1.sample() * self.rv2.sample()
 
 
+    def _new_sample_batch(self, size, batch):
+        return self.rv1.sample_batch(size, batch) * self.rv2.sample_batch(size, batch)
+
+
     def _new_mean(self, fixed_means):
-        shared_roots = list(self.rv1.roots().intersection(self.rv2.roots()))
+        shared_roots = _shared_roots(self.rv1, self.rv2)
 
         # If X and Y do not share any roots, then they are independent
         # This implies that E[XY] = E[X]E[Y], which is a quick calculation
@@ -176,21 +706,170 @@ class DiscreteTimesDiscreteRandVar(DiscreteRandVar):
         # one root discrete variable acting as a probabilistic generation.
 
         # If we generate every possible combination that the shared roots can take, we 
-        # can make X and Y 'independent' again
-        srv_supports = []
-        for srv in shared_roots:
-            if srv in fixed_means:
-                srv_space = [(fixed_means[srv], 1)]
-            else:
-                srv_space = [(x, srv.mass_function(x)) for x in srv.sample_space]
-            srv_supports.append(srv_space)
-        # Then, we use the law of total probability to calculate mean
+        # can make X and Y 'independent' again. Then, we use the law of total
+        # probability to calculate mean
         mean = 0
-        for combination in itertools.product(*srv_supports):
-            weight = 1
-            fixes = copy.copy(fixed_means)
-            for (srv, (fix, prob)) in zip(shared_roots, combination):
-                weight *= prob
-                fixes[srv] = fix
+        for weight, fixes in _root_combinations(shared_roots, fixed_means):
             mean += weight * self.rv1.mean(fixes) * self.rv2.mean(fixes)
         return mean
+
+
+    def _new_pmf(self, fixed_means):
+        return _binary_pmf(self.rv1, self.rv2, fixed_means, operator.mul)
+
+
+    def _new_mean_gradient(self, fixed_means):
+        shared_roots = [rrv for rrv in _shared_roots(self.rv1, self.rv2)
+                        if rrv not in fixed_means]
+
+        # Product rule for independent X and Y: d(E[X]E[Y]) = E[Y]dE[X] + E[X]dE[Y]
+        if len(shared_roots) == 0:
+            return _add_gradients(self.rv1.mean_gradient(fixed_means), self.rv2.mean(fixed_means),
+                                  self.rv2.mean_gradient(fixed_means), self.rv1.mean(fixed_means))
+
+        # Otherwise, differentiate the law of total probability used by the mean.
+        # Within every combination of the shared roots, X and Y are independent
+        gradient = _zero_gradient(shared_roots)
+        for fixes, partials in _root_partials(shared_roots, fixed_means):
+            mean1 = self.rv1.mean(fixes)
+            mean2 = self.rv2.mean(fixes)
+            weight = partials[0] * shared_roots[0].pmf()[fixes[shared_roots[0]]]
+            for rrv, partial in zip(shared_roots, partials):
+                gradient[rrv][_support_index(rrv, fixes[rrv])] += partial * mean1 * mean2
+            gradient = _add_gradients(gradient, 1, self.rv1.mean_gradient(fixes), weight * mean2)
+            gradient = _add_gradients(gradient, 1, self.rv2.mean_gradient(fixes), weight * mean1)
+        return gradient
+
+
+# The calculations that persistent caches store, and the kinds of results they return
+_CACHED_METHODS = {'_new_mean': 'mean', '_new_variance': 'variance', '_new_pmf': 'pmf'}
+
+
+def _root_combinations(roots, fixed_means):
+    '''
+    Generates every combination of values that the given roots can take,
+    along with the probability of that combination. Each combination is
+    yielded as a copy of {fixed_means} extended with the roots' values, so
+    that it can be passed straight back into mean() or pmf(). Roots that
+    are already fixed only take their preset value.
+    '''
+
+    supports = []
+    for rrv in roots:
+        if rrv in fixed_means:
+            supports.append([(fixed_means[rrv], 1)])
+        else:
+            supports.append(list(rrv.pmf().items()))
+    if profiling.current is not None:
+        count = 1
+        for support in supports:
+            count *= len(support)
+        profiling.current.enumerate(count)
+    for combination in itertools.product(*supports):
+        weight = 1
+        fixes = copy.copy(fixed_means)
+        for (rrv, (fix, prob)) in zip(roots, combination):
+            weight *= prob
+            fixes[rrv] = fix
+        yield weight, fixes
+
+
+def _root_partials(roots, fixed_means):
+    '''
+    Generates every combination of values that the given roots can take,
+    like _root_combinations(). Along with each combination, yields the
+    partial derivatives of its probability with respect to the probability
+    of each root's value, which are the products of the other probabilities.
+    '''
+
+    for _, fixes in _root_combinations(roots, fixed_means):
+        probabilities = [rrv.pmf()[fixes[rrv]] for rrv in roots]
+        partials = []
+        for i in range(len(roots)):
+            partial = 1
+            for j, p in enumerate(probabilities):
+                if i != j:
+                    partial *= p
+            partials.append(partial)
+        yield fixes, partials
+
+
+def _covariance_gradient(rv1, rv2):
+    '''Calculates the derivatives of Cov[X, Y] = E[XY] - E[X]E[Y]. Random
+    variables without shared roots have a covariance of zero for every
+    probability of their roots, so its derivatives are zero as well'''
+
+    if rv1.root_mask() & rv2.root_mask() == 0:
+        return {}
+    gradient = _add_gradients((rv1 * rv2).mean_gradient(), 1, rv1.mean_gradient(), -rv2.mean())
+    return _add_gradients(gradient, 1, rv2.mean_gradient(), -rv1.mean())
+
+
+def _support_index(rrv, x):
+    '''Finds the position of a value in the support of a root'''
+
+    values, _ = rrv.support()
+    return int(np.searchsorted(values, x))
+
+
+def _zero_gradient(roots):
+    return {rrv: np.zeros(len(rrv.support()[0])) for rrv in roots}
+
+
+def _add_gradients(gradient1, scale1, gradient2=None, scale2=0):
+    '''Calculates scale1 * gradient1 + scale2 * gradient2, where missing
+    roots have derivatives of zero'''
+
+    result = {rrv: scale1 * derivatives for rrv, derivatives in gradient1.items()}
+    if gradient2 is not None:
+        for rrv, derivatives in gradient2.items():
+            if rrv in result:
+                result[rrv] = result[rrv] + scale2 * derivatives
+            else:
+                result[rrv] = scale2 * derivatives
+    return result
+
+
+def _pmf_arrays(pmf):
+    '''
+    Converts a mass function into an array of values, sorted in increasing
+    order, and an array of their probabilities. Probabilities may themselves
+    be arrays, as they are during parameter sweeps, in which case the first
+    axis of the probability array follows the values.
+    '''
+
+    values = np.asarray(list(pmf.keys()))
+    probabilities = np.asarray(np.broadcast_arrays(*pmf.values()), dtype=np.float64)
+    order = np.argsort(values, kind='stable')
+    return values[order], probabilities[order]
+
+
+def _broadcast(probabilities1, probabilities2):
+    '''Broadcasts the probabilities of two mass functions against each
+    other along every axis but the first, which follows the values. Only
+    one of them may have arrays for probabilities during a parameter sweep'''
+
+    shape = np.broadcast_shapes(probabilities1.shape[1:], probabilities2.shape[1:])
+    result = []
+    for probabilities in [probabilities1, probabilities2]:
+        expanded = probabilities.reshape(probabilities.shape + (1,) * (len(shape) - probabilities.ndim + 1))
+        result.append(np.broadcast_to(expanded, probabilities.shape[:1] + shape))
+    return result
+
+
+def _binary_pmf(rv1, rv2, fixed_means, op):
+    '''
+    Calculates the mass function of op(X, Y). The roots shared by X and Y
+    are enumerated so that, within every combination, X and Y are
+    independent and their mass functions can simply be combined.
+    '''
+
+    shared_roots = _shared_roots(rv1, rv2)
+    pmf = {}
+    for weight, fixes in _root_combinations(shared_roots, fixed_means):
+        pmf2 = rv2.pmf(fixes)
+        for x, p in rv1.pmf(fixes).items():
+            for y, q in pmf2.items():
+                value = op(x, y)
+                pmf[value] = pmf.get(value, 0) + weight * p * q
+    return pmf
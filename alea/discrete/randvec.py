@@ -1,6 +1,12 @@
 from ..randvec import RandVec
+from .. import profiling
+from . import cache
 from .root_randvar import RootDiscreteRandVar
 from .unary_randvar import UnaryDiscreteRandVar
+from .array_randvar import ArrayRootDiscreteRandVar, ColumnDiscreteRandVar, _chunk_rows, _weighted_sum
+
+import numpy as np
+
 
 class DiscreteRandVec(RandVec):
     '''
@@ -46,3 +52,123 @@ class DiscreteRandVec(RandVec):
 
     def resample(self):
         self.root.resample()
+
+
+    @staticmethod
+    def from_arrays(values, probabilities):
+        '''
+        Builds a discrete random vector from a matrix of values, with one
+        row per vector in the support, and a vector of their probabilities.
+        Either may be given as the path of a .npy file, which is memory
+        mapped rather than read. The arrays are used as they are, without
+        copying them into Python objects, so supports far too large for
+        sets of tuples are fine.
+
+        Args:
+            values: An n-by-k array, or the path of a .npy file holding one
+            probabilities: A length n array of probabilities summing to 1,
+            or the path of a .npy file holding one
+
+        Returns:
+            The ArrayDiscreteRandVec
+        '''
+
+        if isinstance(values, str):
+            values = np.load(values, mmap_mode='r')
+        if isinstance(probabilities, str):
+            probabilities = np.load(probabilities, mmap_mode='r')
+        return ArrayDiscreteRandVec(values, probabilities)
+
+
+class ArrayDiscreteRandVec(DiscreteRandVec):
+    '''
+    A discrete random vector whose joint distribution is held in numpy
+    arrays, which may be memory mapped: an n-by-k matrix of values and a
+    length n vector of probabilities. Its random variables are the columns
+    of the matrix, all indexed by a single root over the rows. The mean
+    vector and covariance matrix are calculated a chunk of rows at a time,
+    in one pass over the matrix each, and cached on the random variables.
+    Like covariances between any random variables, the covariance matrix
+    is never stored in a persistent cache.
+    '''
+
+    def __init__(self, values, probabilities):
+        '''
+        Args:
+            values: An n-by-k array with one row per vector in the support
+            probabilities: A length n array of probabilities summing to 1
+        '''
+
+        if np.ndim(values) != 2 or np.ndim(probabilities) != 1:
+            raise ValueError("Values must be a matrix and probabilities must be a vector")
+        if len(values) != len(probabilities) or len(values) == 0:
+            raise ValueError("There must be one probability for every row of values")
+        self.values = values
+        self.root = ArrayRootDiscreteRandVar(probabilities)
+        RandVec.__init__(self, [ColumnDiscreteRandVar(self.root, values, i) for i in range(values.shape[1])])
+
+
+    def sample_batch(self, size, batch=None):
+        if batch is None:
+            batch = {}
+        # Whole rows are read at once rather than one column at a time
+        samples = np.asarray(self.values[self.root.sample_batch(size, batch)])
+        for i, x in enumerate(self.randvars):
+            batch.setdefault(x, samples[:, i])
+        return samples
+
+
+    def mean(self, fixed_means={}):
+        if len(fixed_means) > 0 or cache.active() is not None:
+            # With a persistent cache active, the means of the columns are
+            # looked up and stored one column at a time
+            return DiscreteRandVec.mean(self, fixed_means)
+        if profiling.current is not None:
+            for x in self.randvars:
+                profiling.current.cache('mean', x.saved_mean is not None)
+        if any(x.saved_mean is None for x in self.randvars):
+            for x, m in zip(self.randvars, self._evaluate('_new_mean').tolist()):
+                x.saved_mean = m
+        return [x.saved_mean for x in self.randvars]
+
+
+    def cross_covariance(self, othervec):
+        if othervec is not self:
+            return DiscreteRandVec.cross_covariance(self, othervec)
+        covariance = self._evaluate('_new_covariance')
+        for i, x in enumerate(self.randvars):
+            x.saved_variance = covariance[i][i].item()
+            for j in range(i + 1, len(self.randvars)):
+                x._save_covariance(self.randvars[j], covariance[i][j].item())
+        return covariance
+
+
+    def _evaluate(self, method):
+        '''Calls one of the calculations over the whole matrix, recording the
+        call while a profile is active, as RandVar._evaluate() does'''
+
+        if profiling.current is None:
+            return getattr(self, method)()
+        return profiling.current.call(self, method)
+
+
+    def _new_mean(self):
+        return _weighted_sum(self.root.probabilities, self._rows, _chunk_rows(self.values))
+
+
+    def _new_covariance(self):
+        mean = np.asarray(self.mean())
+        probabilities = self.root.probabilities
+        rows = _chunk_rows(self.values)
+        k = len(self.randvars)
+        covariance = np.zeros((k, k))
+        for start in range(0, len(probabilities), rows):
+            end = min(start + rows, len(probabilities))
+            centered = self._rows(start, end) - mean
+            weights = np.asarray(probabilities[start:end], dtype=np.float64)
+            covariance += centered.T @ (centered * weights[:, np.newaxis])
+        return covariance
+
+
+    def _rows(self, start, end):
+        return np.asarray(self.values[start:end], dtype=np.float64)
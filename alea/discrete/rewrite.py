@@ -0,0 +1,79 @@
+from .randvar import ConstantPlusDiscreteRandVar, ConstantTimesDiscreteRandVar
+from .special_randvar import BernoulliRandVar, BinomialRandVar
+from .closed_form_randvar import AffineDiscreteRandVar, BinomialSumDiscreteRandVar, _parameters
+
+
+def rewrite_affine(rv, scale, shift):
+    '''
+    Rewrites scale * rv + shift as a single affine random variable when rv
+    is itself the result of additions or multiplications by constants.
+
+    Args:
+        rv: A discrete random variable
+        scale: The constant to multiply by
+        shift: The constant to add afterwards
+
+    Returns:
+        The rewritten random variable, or None if there is no rewrite
+    '''
+
+    if not isinstance(rv, (ConstantPlusDiscreteRandVar, ConstantTimesDiscreteRandVar, AffineDiscreteRandVar)):
+        return None
+    base, inner_scale, inner_shift = _affine_parts(rv)
+    return AffineDiscreteRandVar(base, scale * inner_scale, scale * inner_shift + shift)
+
+
+def rewrite_plus(rv1, rv2):
+    '''
+    Rewrites rv1 + rv2 as a Binomial sum, or as an affine map of one, when
+    both are affine maps with the same scale of independent Bernoulli,
+    Binomial or Binomial sum random variables with the same success rate.
+    This collapses portfolios of identical contracts, such as
+    X1 * 1150 - 150 + X2 * 1150 - 150, into one random variable. The
+    rewritten random variable keeps the same roots, so its dependence on
+    other random variables is unchanged.
+
+    Args:
+        rv1: A discrete random variable
+        rv2: A discrete random variable
+
+    Returns:
+        The rewritten random variable, or None if there is no rewrite
+    '''
+
+    base1, scale1, shift1 = _affine_parts(rv1)
+    base2, scale2, shift2 = _affine_parts(rv2)
+    if not _is_binomial(base1) or not _is_binomial(base2) or scale1 != scale2:
+        return None
+    # The parameters of sums are cached, so checking them takes constant time
+    parameters1 = _parameters(base1)
+    parameters2 = _parameters(base2)
+    if parameters1 is None or parameters2 is None or parameters1[1] != parameters2[1]:
+        return None
+    # Terms that share roots are dependent, so their sum is not Binomial
+    if base1.root_mask() & base2.root_mask():
+        return None
+
+    total = BinomialSumDiscreteRandVar(base1, base2)
+    if scale1 == 1 and shift1 + shift2 == 0:
+        return total
+    return AffineDiscreteRandVar(total, scale1, shift1 + shift2)
+
+
+def _affine_parts(rv):
+    '''Splits a random variable into X, a and b such that it equals aX + b'''
+
+    if isinstance(rv, ConstantPlusDiscreteRandVar):
+        return rv.rv, 1, rv.c
+    elif isinstance(rv, ConstantTimesDiscreteRandVar):
+        return rv.rv, rv.c, 0
+    elif isinstance(rv, AffineDiscreteRandVar):
+        return rv.rv, rv.scale, rv.shift
+    return rv, 1, 0
+
+
+def _is_binomial(rv):
+    '''Checks if a random variable is a Bernoulli, a Binomial or a sum of
+    them. Subclasses of Bernoulli and Binomial are left alone'''
+
+    return type(rv) is BernoulliRandVar or type(rv) is BinomialRandVar or isinstance(rv, BinomialSumDiscreteRandVar)
@@ -1,4 +1,4 @@
-from .randvar import DiscreteRandVar
+from .randvar import DiscreteRandVar, _pmf_arrays
 
 from functools import lru_cache
 
@@ -18,6 +18,9 @@ class RootDiscreteRandVar(DiscreteRandVar):
     random variables.
     '''
 
+    __slots__ = ('sample_space', 'mass_function', 'sample_list', 'saved_support')
+
+
     def __init__(self, sample_space, mass_function):
         '''
         The support/sample space is a set of numbers
@@ -40,10 +43,94 @@ class RootDiscreteRandVar(DiscreteRandVar):
         self.sample_space = copy.copy(sample_space)
         self.mass_function = mass_function
         self.sample_list = None
+        self.saved_support = None
+
+
+    def update(self, sample_space=None, mass_function=None):
+        '''
+        Changes the distribution of this root in place. Every cached result
+        that depends on this root is discarded, while the caches of random
+        variables that do not depend on it are kept.
+
+        Args:
+            sample_space: The new support, or None to keep the current one
+            mass_function: The new mass function, or None to keep the
+            current one
+        '''
+
+        if sample_space is not None:
+            self.sample_space = copy.copy(sample_space)
+        if mass_function is not None:
+            self.mass_function = mass_function
+        self.invalidate()
+
+
+    def support(self):
+        '''
+        Returns the support and the probability of every value in it as
+        numpy arrays, sorted by value. These arrays are used for vectorized
+        sampling and are cached upon calculation.
+
+        Returns:
+            A tuple of the sorted values and their probabilities
+        '''
+
+        if self.saved_support is None:
+            self.saved_support = _pmf_arrays(self.pmf())
+        return self.saved_support
+
+
+    def _clear_caches(self):
+        DiscreteRandVar._clear_caches(self)
+        self.sample_list = None
+        self.saved_support = None
 
 
-    def _new_roots(self):
-        return {self}
+    def _inverse_cdf(self, u):
+        # Maps uniforms on [0, 1) to values of the random variable, such
+        # that every value is hit by an interval as wide as its probability
+        values, probabilities = self.support()
+        cdf = np.cumsum(probabilities)
+        indices = np.searchsorted(cdf, u, side='right')
+        return values[np.minimum(indices, len(values) - 1)]
+
+
+    def _tilt(self, theta):
+        # Exponential tilting reweights every value x by exp(theta * x).
+        # The exponents are shifted by their maximum to avoid overflow
+        values, probabilities = self.support()
+        exponents = theta * values.astype(np.float64)
+        exponents -= exponents[probabilities > 0].max()
+        tilted = probabilities * np.exp(exponents)
+        return tilted / tilted.sum()
+
+
+    def _tilted_mean(self, theta):
+        values, _ = self.support()
+        return np.dot(self._tilt(theta), values).item()
+
+
+    def _tilted_sample_batch(self, theta, size):
+        # Samples from the tilted distribution, returning the samples along
+        # with the logarithms of their likelihood ratios p(x) / q(x)
+        values, probabilities = self.support()
+        if theta == 0:
+            return self._inverse_cdf(np.random.random(size)), np.zeros(size)
+        tilted = self._tilt(theta)
+        indices = np.searchsorted(np.cumsum(tilted), np.random.random(size), side='right')
+        indices = np.minimum(indices, len(values) - 1)
+        with np.errstate(divide='ignore'):
+            log_ratios = np.log(probabilities) - np.log(tilted)
+        return values[indices], log_ratios[indices]
+
+
+    def _parameter_derivatives(self):
+        '''Returns a dictionary mapping the name of every parameter of this
+        root to the derivatives of its probabilities with respect to that
+        parameter, ordered like the values of support(). An arbitrary root
+        has no parameters'''
+
+        return {}
 
 
     def _new_sample(self):
@@ -51,10 +138,13 @@ class RootDiscreteRandVar(DiscreteRandVar):
         # variable's probability distribution. This, in turn, assumes 
         # that this random variable does not have any parents and thus
         # represents an independent, real-world event
-        if self.sample_list is None:
-            self.sample_list = list(self.sample_space)
-        probabilities = [self.mass_function(x) for x in self.sample_list]
-        return np.random.choice(self.sample_list, 1, p=probabilities)[0]
+        values, probabilities = self.support()
+        return np.random.choice(values, p=probabilities)
+
+
+    def _new_sample_batch(self, size, batch):
+        values, probabilities = self.support()
+        return np.random.choice(values, size, p=probabilities)
 
 
     def _new_mean(self, fixed_means):
@@ -65,6 +155,22 @@ class RootDiscreteRandVar(DiscreteRandVar):
         return mean
 
 
+    def _new_pmf(self, fixed_means):
+        return {x: self.mass_function(x) for x in self.sample_space}
+
+
+    def _new_mean_gradient(self, fixed_means):
+        # The mean is the sum of x * P(X = x)
+        values, _ = self.support()
+        return {self: values.astype(np.float64)}
+
+
+    def _new_variance_gradient(self):
+        # The variance is the sum of x^2 * P(X = x) minus the squared mean
+        values = self.support()[0].astype(np.float64)
+        return {self: values * (values - 2 * self.mean())}
+
+
     def _new_variance(self):
         variance = 0
         for x in self.sample_space:
@@ -0,0 +1,57 @@
+class Sensitivity:
+    '''
+    The sensitivities of the mean and variance of a discrete random
+    variable to one of its roots. Derivatives with respect to the
+    probabilities of the root are ordered like the values of
+    root.support(), and treat every probability as an independent
+    coordinate. Derivatives with respect to the parameters of the root,
+    such as the success rate of a Binomial random variable, follow from
+    them by the chain rule.
+    '''
+
+    def __init__(self, root, mean, variance):
+        '''
+        Args:
+            root: The root random variable
+            mean: The derivatives of the mean with respect to the
+            probabilities of the root
+            variance: The derivatives of the variance with respect to the
+            probabilities of the root
+        '''
+
+        self.root = root
+        self.mean = mean
+        self.variance = variance
+        self.parameters = {}
+        for name, derivatives in root._parameter_derivatives().items():
+            self.parameters[name] = (float(mean @ derivatives), float(variance @ derivatives))
+
+
+    def mean_parameter(self, name):
+        '''
+        Args:
+            name: The name of a parameter of the root, such as 'success_rate'
+
+        Returns:
+            The derivative of the mean with respect to the parameter
+        '''
+
+        return self._parameter(name)[0]
+
+
+    def variance_parameter(self, name):
+        '''
+        Args:
+            name: The name of a parameter of the root, such as 'success_rate'
+
+        Returns:
+            The derivative of the variance with respect to the parameter
+        '''
+
+        return self._parameter(name)[1]
+
+
+    def _parameter(self, name):
+        if name not in self.parameters:
+            raise ValueError("The root has no parameter named {}".format(name))
+        return self.parameters[name]
@@ -0,0 +1,562 @@
+from ..randvec import RandVec
+from .randvar import ConstantPlusDiscreteRandVar, DiscretePlusDiscreteRandVar, ConstantTimesDiscreteRandVar, \
+    DiscreteTimesDiscreteRandVar
+from .root_randvar import RootDiscreteRandVar
+from .special_randvar import BernoulliRandVar, BinomialRandVar, UniformDiscreteRandVar
+from .truncated_randvar import PoissonRandVar, GeometricRandVar, NegativeBinomialRandVar
+from .unary_randvar import UnaryDiscreteRandVar
+from .array_randvar import ArrayRootDiscreteRandVar, ColumnDiscreteRandVar
+from .binary_randvar import BinaryDiscreteRandVar
+from .closed_form_randvar import AffineDiscreteRandVar, BinomialSumDiscreteRandVar
+from .order_randvar import OrderDiscreteRandVar, MaximumDiscreteRandVar, MinimumDiscreteRandVar, \
+    ComparisonDiscreteRandVar
+
+import numpy as np
+import hashlib
+import gc
+
+
+# Op codes of the serialized graph
+ROOT = 0
+BERNOULLI = 1
+BINOMIAL = 2
+UNIFORM = 3
+CONSTANT_PLUS = 4
+PLUS = 5
+CONSTANT_TIMES = 6
+TIMES = 7
+UNARY = 8
+MAXIMUM = 9
+MINIMUM = 10
+COMPARISON = 11
+BINARY = 12
+POISSON = 13
+GEOMETRIC = 14
+NEGATIVE_BINOMIAL = 15
+AFFINE = 16
+BINOMIAL_SUM = 17
+
+
+class TableFunction:
+    '''
+    A function defined by a lookup table. Serialized models use table
+    functions in place of the mass functions of roots and the functions
+    of unary random variables, since unlike lambdas they can be pickled.
+    '''
+
+    def __init__(self, keys, values, second_keys=None):
+        '''
+        Args:
+            keys: The inputs of the function
+            values: The outputs of the function
+            second_keys: The second inputs of the function, if it takes two
+        '''
+
+        if second_keys is None:
+            self.table = dict(zip(keys.tolist(), values.tolist()))
+        else:
+            self.table = dict(zip(zip(keys.tolist(), second_keys.tolist()), values.tolist()))
+
+
+    def __call__(self, *x):
+        return self.table[x[0] if len(x) == 1 else x]
+
+
+class SerializedModel:
+    '''
+    A compact, picklable representation of a graph of discrete random
+    variables. The graph is stored as parallel numpy arrays in topological
+    order: every node has an op code, up to two operand indices into the
+    earlier nodes and up to three constants. Roots with arbitrary mass
+    functions, unary random variables and binary random variables are
+    stored as lookup tables, so no Python functions need to be pickled.
+    Cached means, variances, pmfs and covariances between serialized nodes
+    are stored alongside.
+
+    Dependencies are preserved between every random variable serialized
+    together, but not between separately serialized models. Random
+    variables that are used together should be serialized together.
+
+    There are two costs to keep in mind. Unary and binary random variables
+    are tabulated over the supports of their operands, so serializing them
+    calculates the mass functions of the operands, which takes time
+    exponential in the number of roots an operand shares between its own
+    parents. Array roots and their columns are the exception, tabulated
+    straight from their arrays. And while loading the arrays takes
+    milliseconds, build() constructs every node of the graph, which takes
+    time linear in its size (about half a second for 75k nodes), though
+    nothing is ever recalculated.
+    '''
+
+    FIELDS = ['ops', 'operands', 'constants', 'table_offsets', 'table_keys', 'table_second_keys',
+              'table_values', 'means', 'variances', 'pmf_offsets', 'pmf_values', 'pmf_probabilities',
+              'covariances', 'outputs', 'vector_lengths']
+
+
+    def __init__(self, **arrays):
+        for field in SerializedModel.FIELDS:
+            setattr(self, field, arrays[field])
+
+
+    def __len__(self):
+        '''
+        Returns:
+            The number of nodes in the serialized graph
+        '''
+
+        return len(self.ops)
+
+
+    def build(self):
+        '''
+        Reconstructs the random variables, along with their cached results.
+
+        Returns:
+            A list with the same structure as the list that was serialized,
+            containing the rebuilt random variables and random vectors
+        '''
+
+        # Numpy scalars are slow to work with one at a time, so the
+        # arrays that are read per node are converted to lists first
+        ops = self.ops.tolist()
+        operands = self.operands.tolist()
+        constants = self.constants.tolist()
+        offsets = self.table_offsets.tolist()
+        nodes = []
+        # Building a large graph allocates many objects at once, which would
+        # otherwise trigger the garbage collector over and over
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for i in range(len(ops)):
+                a, b = operands[i]
+                c, d, e = constants[i]
+                nodes.append(self._build_node(i, ops[i], a, b, c, d, e, offsets, nodes))
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        for i in np.flatnonzero(~np.isnan(self.means)):
+            nodes[i].saved_mean = self.means[i].item()
+        for i in np.flatnonzero(~np.isnan(self.variances)):
+            nodes[i].saved_variance = self.variances[i].item()
+        for i in np.flatnonzero(self.pmf_offsets[1:] > self.pmf_offsets[:-1]):
+            start, end = self.pmf_offsets[i], self.pmf_offsets[i + 1]
+            nodes[i].saved_pmf = dict(zip(self.pmf_values[start:end].tolist(),
+                                          self.pmf_probabilities[start:end].tolist()))
+        for i, j, covariance in self.covariances:
+            nodes[int(i)]._save_covariance(nodes[int(j)], covariance)
+
+        result = []
+        position = 0
+        for length in self.vector_lengths:
+            if length < 0:
+                result.append(nodes[self.outputs[position]])
+                position += 1
+            else:
+                result.append(RandVec([nodes[i] for i in self.outputs[position:position + length]]))
+                position += length
+        return result
+
+
+    def _build_node(self, i, op, a, b, c, d, e, offsets, nodes):
+        '''Builds the random variable at index {i}, given its op code, operands
+        and constants, where {nodes} maps the indices of its operands to their
+        random variables'''
+
+        if op == CONSTANT_PLUS:
+            rv = ConstantPlusDiscreteRandVar(nodes[a], c)
+        elif op == PLUS:
+            rv = DiscretePlusDiscreteRandVar(nodes[a], nodes[b])
+        elif op == CONSTANT_TIMES:
+            rv = ConstantTimesDiscreteRandVar(nodes[a], c)
+        elif op == TIMES:
+            rv = DiscreteTimesDiscreteRandVar(nodes[a], nodes[b])
+        elif op == AFFINE:
+            rv = AffineDiscreteRandVar(nodes[a], c, d)
+        elif op == BINOMIAL_SUM:
+            rv = BinomialSumDiscreteRandVar(nodes[a], nodes[b])
+        elif op == MAXIMUM:
+            rv = MaximumDiscreteRandVar(nodes[a], nodes[b])
+        elif op == MINIMUM:
+            rv = MinimumDiscreteRandVar(nodes[a], nodes[b])
+        elif op == COMPARISON:
+            rv = ComparisonDiscreteRandVar(nodes[a], nodes[b], ComparisonDiscreteRandVar.OPERATORS[int(c)])
+        elif op == BERNOULLI:
+            rv = BernoulliRandVar(c)
+        elif op == BINOMIAL:
+            rv = BinomialRandVar(int(c), d)
+        elif op == POISSON:
+            rv = PoissonRandVar(c, d)
+        elif op == GEOMETRIC:
+            rv = GeometricRandVar(c, d)
+        elif op == NEGATIVE_BINOMIAL:
+            rv = NegativeBinomialRandVar(c, d, e)
+        else:
+            keys = self.table_keys[offsets[i]:offsets[i + 1]]
+            values = self.table_values[offsets[i]:offsets[i + 1]]
+            if op == ROOT:
+                rv = RootDiscreteRandVar(set(keys.tolist()), TableFunction(keys, values))
+            elif op == UNIFORM:
+                rv = UniformDiscreteRandVar(set(keys.tolist()))
+            elif op == UNARY:
+                rv = UnaryDiscreteRandVar(nodes[a], TableFunction(keys, values))
+            elif op == BINARY:
+                second_keys = self.table_second_keys[offsets[i]:offsets[i + 1]]
+                rv = BinaryDiscreteRandVar(nodes[a], nodes[b], TableFunction(keys, values, second_keys))
+            else:
+                raise ValueError("Unknown op code {}".format(op))
+        return rv
+
+
+    def save(self, path):
+        '''
+        Saves the serialized model to a .npz file. No Python objects are
+        pickled, so the file can be loaded without executing any code.
+
+        Args:
+            path: The path of the file to write
+        '''
+
+        np.savez(path, **{field: getattr(self, field) for field in SerializedModel.FIELDS})
+
+
+    @staticmethod
+    def load(path):
+        '''
+        Loads a serialized model saved by save().
+
+        Args:
+            path: The path of the file to read
+
+        Returns:
+            The serialized model
+        '''
+
+        with np.load(path, allow_pickle=False) as data:
+            return SerializedModel(**{field: data[field] for field in SerializedModel.FIELDS})
+
+
+def serialize(rvs):
+    '''
+    Serializes a list of discrete random variables and random vectors,
+    along with every random variable they depend on. The operands of unary
+    and binary random variables have their mass functions calculated, as
+    described in SerializedModel.
+
+    Args:
+        rvs: A list of discrete random variables and random vectors
+
+    Returns:
+        The SerializedModel of the graph
+    '''
+
+    outputs = []
+    vector_lengths = []
+    for rv in rvs:
+        if isinstance(rv, RandVec):
+            outputs.extend(rv.randvars)
+            vector_lengths.append(len(rv))
+        else:
+            outputs.append(rv)
+            vector_lengths.append(-1)
+
+    nodes = _topological_order(outputs)
+    index = {rv: i for i, rv in enumerate(nodes)}
+
+    n = len(nodes)
+    ops = np.empty(n, dtype=np.int8)
+    operands = np.full((n, 2), -1, dtype=np.int64)
+    constants = np.full((n, 3), np.nan)
+    table_offsets = np.zeros(n + 1, dtype=np.int64)
+    table_keys = []
+    table_second_keys = []
+    table_values = []
+    for i, rv in enumerate(nodes):
+        op, parents, consts, table = _encode(rv)
+        ops[i] = op
+        for j, parent in enumerate(parents):
+            operands[i][j] = index[parent]
+        for j, const in enumerate(consts):
+            constants[i][j] = const
+        # Tables are gathered as arrays, since those of array random
+        # variables are taken straight from their arrays
+        table_offsets[i + 1] = table_offsets[i]
+        if table is not None:
+            table_keys.append(np.asarray(table[0], dtype=np.float64))
+            table_values.append(np.asarray(table[1], dtype=np.float64))
+            table_second_keys.append(np.asarray(table[2], dtype=np.float64) if len(table) > 2
+                                     else np.full(len(table[0]), np.nan))
+            table_offsets[i + 1] += len(table[0])
+
+    means = np.full(n, np.nan)
+    variances = np.full(n, np.nan)
+    pmf_offsets = np.zeros(n + 1, dtype=np.int64)
+    pmf_values = []
+    pmf_probabilities = []
+    covariances = []
+    for i, rv in enumerate(nodes):
+        if rv.saved_mean is not None:
+            means[i] = rv.saved_mean
+        if rv.saved_variance is not None:
+            variances[i] = rv.saved_variance
+        if rv.saved_pmf is not None:
+            pmf_values.extend(rv.saved_pmf.keys())
+            pmf_probabilities.extend(rv.saved_pmf.values())
+        pmf_offsets[i + 1] = len(pmf_values)
+        for other, covariance in rv.saved_covariances.items():
+            # Covariances are cached on both random variables but only stored once
+            if other in index and index[other] >= i:
+                covariances.append((i, index[other], covariance))
+
+    return SerializedModel(
+        ops=ops,
+        operands=operands,
+        constants=constants,
+        table_offsets=table_offsets,
+        table_keys=np.concatenate([np.empty(0)] + table_keys),
+        table_second_keys=np.concatenate([np.empty(0)] + table_second_keys),
+        table_values=np.concatenate([np.empty(0)] + table_values),
+        means=means,
+        variances=variances,
+        pmf_offsets=pmf_offsets,
+        pmf_values=np.asarray(pmf_values, dtype=np.float64),
+        pmf_probabilities=np.asarray(pmf_probabilities, dtype=np.float64),
+        covariances=np.asarray(covariances, dtype=np.float64).reshape(-1, 3),
+        outputs=np.asarray([index[rv] for rv in outputs], dtype=np.int64),
+        vector_lengths=np.asarray(vector_lengths, dtype=np.int64))
+
+
+def structural_hash(rv):
+    '''
+    Calculates a hash of the structure of a discrete random variable: the
+    op codes, constants and lookup tables of it and its ancestors, and how
+    they are connected. Random variables with the same structure have the
+    same distribution, even when they were built separately, in different
+    processes. Cached results are not part of the structure.
+
+    Every random variable is hashed from its own op code, constants and
+    lookup table and the hashes of its operands, which are cached, so
+    hashing takes time linear in the number of ancestors that were not
+    hashed before. Operands that share roots also hash the positions of
+    the shared roots within each operand, which takes time linear in the
+    size of the operands.
+
+    Args:
+        rv: A discrete random variable
+
+    Returns:
+        The hash as a hexadecimal string
+    '''
+
+    for node in _unhashed_order(rv):
+        node.saved_hash = _node_hash(node)
+    return rv.saved_hash
+
+
+def save(path, rvs):
+    '''
+    Serializes a list of discrete random variables and random vectors
+    and saves them to a .npz file.
+
+    Args:
+        path: The path of the file to write
+        rvs: A list of discrete random variables and random vectors
+    '''
+
+    serialize(rvs).save(path)
+
+
+def load(path):
+    '''
+    Loads and rebuilds random variables saved by save(). Every node of the
+    graph is constructed, so this takes time linear in the size of the
+    graph. SerializedModel.load() only reads the arrays.
+
+    Args:
+        path: The path of the file to read
+
+    Returns:
+        The list of random variables and random vectors that was saved
+    '''
+
+    return SerializedModel.load(path).build()
+
+
+def _topological_order(outputs):
+    '''Orders the ancestors of the outputs so that every random variable
+    appears after its parents. The order only depends on the structure of
+    the graph, since operands are always visited in order'''
+
+    order = []
+    visited = set()
+    for output in outputs:
+        stack = [(output, False)]
+        while len(stack) > 0:
+            rv, expanded = stack.pop()
+            if expanded:
+                order.append(rv)
+                continue
+            if rv in visited:
+                continue
+            visited.add(rv)
+            stack.append((rv, True))
+            for parent in reversed(_encode_parents(rv)):
+                if parent not in visited:
+                    stack.append((parent, False))
+    return order
+
+
+def _unhashed_order(rv):
+    '''Orders the ancestors of a random variable that have no cached hash
+    so that every random variable appears after its parents'''
+
+    order = []
+    visited = set()
+    stack = [(rv, False)]
+    while len(stack) > 0:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+            continue
+        if node in visited or node.saved_hash is not None:
+            continue
+        visited.add(node)
+        stack.append((node, True))
+        for parent in _encode_parents(node):
+            stack.append((parent, False))
+    return order
+
+
+def _node_hash(rv):
+    '''Hashes a random variable whose operands have been hashed'''
+
+    op, parents, consts, table = _encode(rv)
+    if table is None:
+        table = ([], [])
+    # Constants and tables are converted like serialize() converts them, so
+    # that parameters being swept over arrays are rejected
+    header = (op, [float(const) for const in consts], len(parents), [len(column) for column in table])
+    digest = hashlib.sha256(repr(header).encode())
+    for column in table:
+        digest.update(np.asarray(column, dtype=np.float64).tobytes())
+    for parent in parents:
+        digest.update(parent.saved_hash.encode())
+    digest.update(repr(_shared_positions(parents)).encode())
+    return digest.hexdigest()
+
+
+def _shared_positions(parents):
+    '''Describes which operands share which roots. For every operand, the
+    shared roots are listed by their position among its roots, in the order
+    its graph is traversed, along with a label that is equal for the same
+    root in different operands'''
+
+    seen = 0
+    shared = 0
+    for parent in parents:
+        mask = parent.root_mask()
+        shared |= seen & mask
+        seen |= mask
+    if shared == 0:
+        return []
+    labels = {}
+    positions = []
+    for parent in parents:
+        found = []
+        for position, root in enumerate(_ordered_roots(parent)):
+            if root.root_mask() & shared:
+                found.append((position, labels.setdefault(root, len(labels))))
+        positions.append(found)
+    return positions
+
+
+def _ordered_roots(rv):
+    '''Returns the roots of a random variable in the order its graph is
+    traversed, which only depends on its structure'''
+
+    roots = []
+    visited = set()
+    stack = [rv]
+    while len(stack) > 0:
+        node = stack.pop()
+        if node in visited:
+            continue
+        visited.add(node)
+        parents = _encode_parents(node)
+        if len(parents) == 0:
+            roots.append(node)
+        stack.extend(reversed(parents))
+    return roots
+
+
+def _encode_parents(rv):
+    '''Returns the operands of a random variable in order'''
+
+    if isinstance(rv, RootDiscreteRandVar):
+        return []
+    elif isinstance(rv, (DiscretePlusDiscreteRandVar, DiscreteTimesDiscreteRandVar, OrderDiscreteRandVar,
+                         BinaryDiscreteRandVar, BinomialSumDiscreteRandVar)):
+        return [rv.rv1, rv.rv2]
+    elif isinstance(rv, (ConstantPlusDiscreteRandVar, ConstantTimesDiscreteRandVar, UnaryDiscreteRandVar,
+                         AffineDiscreteRandVar)):
+        return [rv.rv]
+    raise ValueError("Cannot serialize random variables of type {}".format(type(rv).__name__))
+
+
+def _encode(rv):
+    '''Returns the op code, operands, constants and lookup table of a random variable'''
+
+    parents = _encode_parents(rv)
+    if type(rv) is BernoulliRandVar:
+        return BERNOULLI, parents, [rv.success_rate], None
+    elif type(rv) is BinomialRandVar:
+        return BINOMIAL, parents, [rv.trials, rv.success_rate], None
+    elif type(rv) is PoissonRandVar:
+        return POISSON, parents, [rv.rate, rv.tolerance], None
+    elif type(rv) is GeometricRandVar:
+        return GEOMETRIC, parents, [rv.success_rate, rv.tolerance], None
+    elif type(rv) is NegativeBinomialRandVar:
+        return NEGATIVE_BINOMIAL, parents, [rv.successes, rv.success_rate, rv.tolerance], None
+    elif type(rv) is UniformDiscreteRandVar:
+        return UNIFORM, parents, [], (sorted(rv.sample_space), [0] * len(rv.sample_space))
+    elif isinstance(rv, ArrayRootDiscreteRandVar):
+        # The tables of array random variables are read from their arrays
+        # rather than from mass functions and functions called per row
+        return ROOT, parents, [], (np.arange(len(rv.probabilities)), np.asarray(rv.probabilities))
+    elif isinstance(rv, RootDiscreteRandVar):
+        # Tables are sorted so that equal distributions serialize identically
+        keys = sorted(rv.pmf().keys())
+        return ROOT, parents, [], (keys, [rv.pmf()[x] for x in keys])
+    elif isinstance(rv, ConstantPlusDiscreteRandVar):
+        return CONSTANT_PLUS, parents, [rv.c], None
+    elif isinstance(rv, DiscretePlusDiscreteRandVar):
+        return PLUS, parents, [], None
+    elif isinstance(rv, ConstantTimesDiscreteRandVar):
+        return CONSTANT_TIMES, parents, [rv.c], None
+    elif isinstance(rv, DiscreteTimesDiscreteRandVar):
+        return TIMES, parents, [], None
+    elif isinstance(rv, AffineDiscreteRandVar):
+        return AFFINE, parents, [rv.scale, rv.shift], None
+    elif isinstance(rv, BinomialSumDiscreteRandVar):
+        return BINOMIAL_SUM, parents, [], None
+    elif isinstance(rv, MaximumDiscreteRandVar):
+        return MAXIMUM, parents, [], None
+    elif isinstance(rv, MinimumDiscreteRandVar):
+        return MINIMUM, parents, [], None
+    elif isinstance(rv, ComparisonDiscreteRandVar):
+        return COMPARISON, parents, [ComparisonDiscreteRandVar.OPERATORS.index(rv.op)], None
+    elif isinstance(rv, BinaryDiscreteRandVar):
+        # The function only ever needs to be evaluated on the grid of the supports
+        pairs = [(x, y) for x in sorted(rv.rv1.pmf().keys()) for y in sorted(rv.rv2.pmf().keys())]
+        keys = [x for x, _ in pairs]
+        second_keys = [y for _, y in pairs]
+        values = np.asarray(rv.func(np.asarray(keys), np.asarray(second_keys))).tolist() if rv.vectorized \
+            else [rv.func(x, y) for x, y in pairs]
+        return BINARY, parents, [], (keys, values, second_keys)
+    elif isinstance(rv, ColumnDiscreteRandVar):
+        return UNARY, parents, [], (np.arange(len(rv.values)), np.asarray(rv.values[:, rv.column]))
+    else:
+        # The function only ever needs to be evaluated on the support of its operand
+        keys = sorted(rv.rv.pmf().keys())
+        return UNARY, parents, [], (keys, [rv.func(x) for x in keys])
@@ -2,6 +2,7 @@ from .root_randvar import RootDiscreteRandVar
 
 import random
 import math
+import numpy as np
 
 
 class BernoulliRandVar(RootDiscreteRandVar):
@@ -13,22 +14,41 @@ class BernoulliRandVar(RootDiscreteRandVar):
     1 - p.
     '''
 
+    __slots__ = ('_success_rate',)
+
+
     def __init__(self, success_rate):
 
         def pmf(x):
             if x == 0:
-                return 1 - success_rate
+                return 1 - self.success_rate
             else:
-                return success_rate
+                return self.success_rate
 
         RootDiscreteRandVar.__init__(self, {0, 1}, pmf)
         self.success_rate = success_rate
 
 
+    @property
+    def success_rate(self):
+        return self._success_rate
+
+
+    @success_rate.setter
+    def success_rate(self, success_rate):
+        # Changing the parameter in place discards the affected caches
+        self._success_rate = success_rate
+        self.invalidate()
+
+
     def _new_sample(self):
         return 1 if random.uniform(0, 1) < self.success_rate else 0
 
 
+    def _new_sample_batch(self, size, batch):
+        return (np.random.random(size) < self.success_rate).astype(np.int64)
+
+
     def _new_mean(self, fixed_means):
         return self.success_rate
 
@@ -37,6 +57,11 @@ class BernoulliRandVar(RootDiscreteRandVar):
         return self.success_rate * (1 - self.success_rate)
 
 
+    def _parameter_derivatives(self):
+        # P(X = 0) = 1 - p and P(X = 1) = p
+        return {'success_rate': np.array([-1.0, 1.0])}
+
+
 class BinomialRandVar(RootDiscreteRandVar):
     '''
     A Binomial random variable models a sequence of
@@ -45,32 +70,44 @@ class BinomialRandVar(RootDiscreteRandVar):
     many successes occurred.
     '''
 
+    __slots__ = ('_trials', '_success_rate')
+
+
     def __init__(self, trials, success_rate):
 
         def pmf(x):
-            # https://stackoverflow.com/questions/3025162/statistics-combinations-in-python 
-            def choose(n, k):
-                if math.isclose(n, math.floor(n)):
-                    n = int(n)
-                if math.isclose(k, math.floor(k)):
-                    k = int(k)
-                if 0 <= k <= n: 
-                    ntok = 1
-                    ktok = 1
-                    for t in range(1, min(k, n - k) + 1):
-                        ntok *= n
-                        ktok *= t
-                        n -= 1
-                    return ntok // ktok
-                else:
-                    return 0
-            return choose(trials, x) * (success_rate ** x) * ((1 - success_rate) ** (trials - x))
+            p = self.success_rate
+            return choose(self.trials, x) * (p ** x) * ((1 - p) ** (self.trials - x))
 
         RootDiscreteRandVar.__init__(self, set(range(trials + 1)), pmf)
         self.trials = trials
         self.success_rate = success_rate
 
 
+    @property
+    def trials(self):
+        return self._trials
+
+
+    @trials.setter
+    def trials(self, trials):
+        # Changing the parameters in place discards the affected caches
+        self._trials = trials
+        self.sample_space = set(range(trials + 1))
+        self.invalidate()
+
+
+    @property
+    def success_rate(self):
+        return self._success_rate
+
+
+    @success_rate.setter
+    def success_rate(self, success_rate):
+        self._success_rate = success_rate
+        self.invalidate()
+
+
     def _new_sample(self):
         X = BernoulliRandVar(self.success_rate)
         successes = 0
@@ -80,6 +117,10 @@ class BinomialRandVar(RootDiscreteRandVar):
         return successes
 
 
+    def _new_sample_batch(self, size, batch):
+        return np.random.binomial(self.trials, self.success_rate, size)
+
+
     def _new_mean(self, fixed_means):
         return self.trials * self.success_rate
 
@@ -88,6 +129,22 @@ class BinomialRandVar(RootDiscreteRandVar):
         return self.trials * self.success_rate * (1 - self.success_rate)
 
 
+    def _parameter_derivatives(self):
+        # d/dp of C(n, x) p^x (1 - p)^(n - x), where each term of the
+        # product rule is left out when its exponent would go negative
+        n = self.trials
+        p = self.success_rate
+        derivatives = np.zeros(n + 1)
+        for x in range(n + 1):
+            derivative = 0
+            if x > 0:
+                derivative += x * p ** (x - 1) * (1 - p) ** (n - x)
+            if x < n:
+                derivative -= (n - x) * p ** x * (1 - p) ** (n - x - 1)
+            derivatives[x] = choose(n, x) * derivative
+        return {'success_rate': derivatives}
+
+
 class UniformDiscreteRandVar(RootDiscreteRandVar):
     '''
     A uniform discrete random variable is a simplistic model of
@@ -96,12 +153,37 @@ class UniformDiscreteRandVar(RootDiscreteRandVar):
     a distinct number.
     '''
 
+    __slots__ = ()
+
+
     def __init__(self, sample_space):
-        p = 1 / len(sample_space)
-        RootDiscreteRandVar.__init__(self, sample_space, lambda x : p)
+        RootDiscreteRandVar.__init__(self, sample_space, lambda x : 1 / len(self.sample_space))
 
 
     def _new_sample(self):
         if self.sample_list is None:
             self.sample_list = list(self.sample_space)
         return random.choice(self.sample_list)
+
+
+    def _new_sample_batch(self, size, batch):
+        values, _ = self.support()
+        return values[np.random.randint(len(values), size=size)]
+
+
+# https://stackoverflow.com/questions/3025162/statistics-combinations-in-python 
+def choose(n, k):
+    if math.isclose(n, math.floor(n)):
+        n = int(n)
+    if math.isclose(k, math.floor(k)):
+        k = int(k)
+    if 0 <= k <= n: 
+        ntok = 1
+        ktok = 1
+        for t in range(1, min(k, n - k) + 1):
+            ntok *= n
+            ktok *= t
+            n -= 1
+        return ntok // ktok
+    else:
+        return 0
@@ -0,0 +1,269 @@
+from .serialize import SerializedModel, ROOT, BERNOULLI, BINOMIAL, UNIFORM, CONSTANT_PLUS, PLUS, \
+    CONSTANT_TIMES, AFFINE, BINOMIAL_SUM, POISSON, GEOMETRIC, NEGATIVE_BINOMIAL
+
+import math
+import numpy as np
+
+
+class GraphStore:
+    '''
+    An array-backed store of a graph of discrete random variables, for
+    models too large to keep every random variable as a Python object.
+
+    The graph is kept in the parallel numpy arrays of a SerializedModel:
+    op codes, operand indices, constants and cached means and variances,
+    at under a hundred bytes per node. Random variables are referred to by
+    lightweight NodeHandle objects. Means and variances that follow in
+    closed form from those of the operands, such as those of sums and
+    affine maps, are calculated directly on the arrays. Anything else
+    builds the random variable as an object, along with its ancestors,
+    and keeps it for later queries. Every result is written back into the
+    arrays, so saving the model afterwards keeps it.
+    '''
+
+    def __init__(self, model):
+        '''
+        Args:
+            model: The SerializedModel holding the graph
+        '''
+
+        self.model = model
+        self.nodes = {}
+
+
+    @staticmethod
+    def load(path):
+        '''
+        Loads a store from a model saved by SerializedModel.save().
+
+        Args:
+            path: The path of the file to read
+
+        Returns:
+            The graph store
+        '''
+
+        return GraphStore(SerializedModel.load(path))
+
+
+    def __len__(self):
+        return len(self.model)
+
+
+    def handle(self, i):
+        '''
+        Args:
+            i: The index of a node in the serialized graph
+
+        Returns:
+            The NodeHandle of the node
+        '''
+
+        return NodeHandle(self, i)
+
+
+    def outputs(self):
+        '''
+        Returns:
+            The handles of the random variables that were serialized, with
+            random vectors flattened into their random variables
+        '''
+
+        return [NodeHandle(self, i) for i in self.model.outputs.tolist()]
+
+
+    def mean(self, i):
+        '''
+        Args:
+            i: The index of a node in the serialized graph
+
+        Returns:
+            The theoretical mean of the node
+        '''
+
+        means = self.model.means
+        if math.isnan(means[i]):
+            for j in self._ancestors(i):
+                if math.isnan(means[j]):
+                    mean = self._closed_form_mean(j)
+                    means[j] = self.node(j).mean() if mean is None else mean
+        return means[i].item()
+
+
+    def variance(self, i):
+        '''
+        Args:
+            i: The index of a node in the serialized graph
+
+        Returns:
+            The theoretical variance of the node
+        '''
+
+        variances = self.model.variances
+        if math.isnan(variances[i]):
+            # Unlike means, variances of sums depend on covariances, so only
+            # the operands that a closed form needs are visited
+            variance = self._closed_form_variance(i)
+            variances[i] = self.node(i).variance() if variance is None else variance
+        return variances[i].item()
+
+
+    def node(self, i):
+        '''
+        Builds the random variable at a node as an object, along with every
+        ancestor that has not been built yet.
+
+        Args:
+            i: The index of a node in the serialized graph
+
+        Returns:
+            The random variable
+        '''
+
+        if i not in self.nodes:
+            model = self.model
+            offsets = model.table_offsets
+            for j in self._ancestors(i):
+                if j in self.nodes:
+                    continue
+                a, b = model.operands[j].tolist()
+                c, d, e = model.constants[j].tolist()
+                rv = model._build_node(j, model.ops[j].item(), a, b, c, d, e, offsets, self.nodes)
+                if not math.isnan(model.means[j]):
+                    rv.saved_mean = model.means[j].item()
+                if not math.isnan(model.variances[j]):
+                    rv.saved_variance = model.variances[j].item()
+                self.nodes[j] = rv
+        return self.nodes[i]
+
+
+    def _operands(self, i):
+        '''Returns the indices of the operands of a node'''
+
+        model = self.model
+        if model.ops[i] == BINOMIAL_SUM:
+            start, end = model.table_offsets[i], model.table_offsets[i + 1]
+            return model.table_keys[start:end].astype(np.int64).tolist()
+        return [j for j in model.operands[i].tolist() if j >= 0]
+
+
+    def _ancestors(self, i):
+        '''Returns the indices of a node and its ancestors in topological
+        order, which is simply increasing order in a serialized graph'''
+
+        visited = {i}
+        stack = [i]
+        while len(stack) > 0:
+            for j in self._operands(stack.pop()):
+                if j not in visited:
+                    visited.add(j)
+                    stack.append(j)
+        return sorted(visited)
+
+
+    def _table(self, i):
+        model = self.model
+        start, end = model.table_offsets[i], model.table_offsets[i + 1]
+        return model.table_keys[start:end], model.table_values[start:end]
+
+
+    def _closed_form_mean(self, i):
+        '''Calculates the mean of a node from the means of its operands, or
+        returns None if there is no closed form'''
+
+        model = self.model
+        op = model.ops[i]
+        a, b = model.operands[i].tolist()
+        c, d, e = model.constants[i].tolist()
+        means = model.means
+        if op == CONSTANT_PLUS:
+            return means[a] + c
+        elif op == PLUS:
+            return means[a] + means[b]
+        elif op == CONSTANT_TIMES:
+            return means[a] * c
+        elif op == AFFINE:
+            return means[a] * c + d
+        elif op == BINOMIAL_SUM:
+            return means[self._operands(i)].sum()
+        elif op == BERNOULLI:
+            return c
+        elif op == BINOMIAL:
+            return c * d
+        elif op == POISSON:
+            return c
+        elif op == GEOMETRIC:
+            return 1 / c
+        elif op == NEGATIVE_BINOMIAL:
+            return c * (1 - d) / d
+        elif op == UNIFORM:
+            return self._table(i)[0].mean()
+        elif op == ROOT:
+            keys, values = self._table(i)
+            return np.dot(keys, values)
+        return None
+
+
+    def _closed_form_variance(self, i):
+        '''Calculates the variance of a node from the variances of its
+        operands, or returns None if there is no closed form'''
+
+        model = self.model
+        op = model.ops[i]
+        a, b = model.operands[i].tolist()
+        c, d, e = model.constants[i].tolist()
+        if op == CONSTANT_PLUS:
+            return self.variance(a)
+        elif op == CONSTANT_TIMES or op == AFFINE:
+            return self.variance(a) * c * c
+        elif op == BINOMIAL_SUM:
+            # The terms of a Binomial sum are independent
+            return sum(self.variance(term) for term in self._operands(i))
+        elif op == BERNOULLI:
+            return c * (1 - c)
+        elif op == BINOMIAL:
+            return c * d * (1 - d)
+        elif op == POISSON:
+            return c
+        elif op == GEOMETRIC:
+            return (1 - c) / (c * c)
+        elif op == NEGATIVE_BINOMIAL:
+            return c * (1 - d) / (d * d)
+        elif op == UNIFORM or op == ROOT:
+            keys, values = self._table(i)
+            probabilities = np.full(len(keys), 1 / len(keys)) if op == UNIFORM else values
+            mean = np.dot(keys, probabilities)
+            return np.dot(keys * keys, probabilities) - mean * mean
+        return None
+
+
+class NodeHandle:
+    '''
+    A lightweight reference to a node of a GraphStore. Queries are
+    answered by the store, which only builds the random variable as an
+    object when its results cannot be calculated on the arrays directly.
+    '''
+
+    __slots__ = ('store', 'index')
+
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+
+    def mean(self):
+        return self.store.mean(self.index)
+
+
+    def variance(self):
+        return self.store.variance(self.index)
+
+
+    def node(self):
+        '''
+        Returns:
+            The random variable that this handle refers to, built as an object
+        '''
+
+        return self.store.node(self.index)
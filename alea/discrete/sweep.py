@@ -0,0 +1,90 @@
+from .root_randvar import RootDiscreteRandVar
+
+import numpy as np
+
+
+class SweepResult:
+    '''
+    The results of a parameter sweep. Every attribute is an array whose
+    last axis follows the points of the sweep.
+    '''
+
+    def __init__(self, mean, variance, quantiles):
+        '''
+        Args:
+            mean: The mean at every point of the sweep
+            variance: The variance at every point of the sweep
+            quantiles: A dictionary mapping every requested probability to
+            the quantile at every point of the sweep
+        '''
+
+        self.mean = mean
+        self.variance = variance
+        self.quantiles = quantiles
+
+
+def sweep(rv, parameters, quantiles=()):
+    '''
+    Evaluates the mean, variance and quantiles of a discrete random variable
+    over many values of the parameters of its roots in a single pass.
+
+    Rather than rebuilding the graph for every point of the sweep, the swept
+    parameters are temporarily replaced by arrays. Every probability in the
+    graph then becomes an array with one entry per point, and the graph is
+    evaluated once with numpy broadcasting over that extra dimension. The
+    original parameters are restored afterwards, and only the caches that
+    depend on the swept roots are discarded.
+
+    The parameters of a root are given as a dictionary mapping attribute
+    names to arrays, such as {'success_rate': np.linspace(0.1, 0.9, 1000)}
+    for a Bernoulli or Binomial random variable. The mass function of any
+    root without a closed-form mean, such as an arbitrary root or a uniform
+    random variable, can be swept with the 'probabilities' key, mapping to a
+    table with one row per point and one column per value of root.support().
+    All arrays must have the same number of points.
+
+    Args:
+        rv: The discrete random variable to evaluate
+        parameters: A dictionary mapping roots to dictionaries of parameters
+        quantiles: The probabilities at which to evaluate quantiles
+
+    Returns:
+        A SweepResult with one entry per point of the sweep
+    '''
+
+    restore = []
+    try:
+        for rrv, params in parameters.items():
+            for name, value in params.items():
+                if name == 'probabilities':
+                    restore.append((rrv, 'mass_function', rrv.mass_function))
+                    rrv.mass_function = _table_mass_function(rrv, value)
+                else:
+                    restore.append((rrv, name, getattr(rrv, name)))
+                    setattr(rrv, name, np.asarray(value))
+            rrv.invalidate()
+
+        mean = np.asarray(rv.mean())
+        variance = np.asarray(rv.variance())
+        result = SweepResult(mean, variance, {q: np.asarray(rv.quantile(q)) for q in quantiles})
+    finally:
+        for rrv, name, value in reversed(restore):
+            setattr(rrv, name, value)
+        for rrv in parameters:
+            rrv.invalidate()
+    return result
+
+
+def _table_mass_function(rrv, table):
+    '''Creates a mass function that returns a column of a table of
+    probabilities, with one column per value of the support of a root'''
+
+    if not isinstance(rrv, RootDiscreteRandVar) or \
+            type(rrv)._new_mean is not RootDiscreteRandVar._new_mean:
+        raise ValueError("Only the mass function of roots without closed-form moments can be swept")
+    table = np.asarray(table, dtype=np.float64)
+    values, _ = rrv.support()
+    if table.ndim != 2 or table.shape[1] != len(values):
+        raise ValueError("Probabilities must have one column per value in the support")
+    columns = {x: table[:, i] for i, x in enumerate(values.tolist())}
+    return lambda x : columns[x]
@@ -0,0 +1,405 @@
+from .root_randvar import RootDiscreteRandVar
+
+from abc import abstractmethod
+
+import math
+import numpy as np
+
+
+class TruncatedDiscreteRandVar(RootDiscreteRandVar):
+    '''
+    A truncated discrete random variable is a root whose support is the
+    infinite sequence of integers start, start + 1, start + 2, ... Its
+    probabilities are calculated in log space, as numpy arrays, and only
+    as far as the queries on it need.
+
+    Means and variances have closed forms, and samples are drawn with
+    numpy, so neither needs the support at all. The cdf, tail probabilities
+    and quantiles only extend the log probabilities up to the point they
+    are evaluated at. The mass function and support, which are needed to
+    combine this random variable with others, are truncated at the first
+    value beyond which the remaining tail probability is at most the
+    tolerance, and renormalized to sum to 1.
+    '''
+
+    __slots__ = ('start', 'tolerance', 'saved_log_pmf', 'saved_cutoff')
+
+
+    def __init__(self, start, tolerance):
+        '''
+        Args:
+            start: The smallest value of the support
+            tolerance: The largest tail probability that the truncated
+            support may leave out
+        '''
+
+        RootDiscreteRandVar.__init__(self, None, self._probability)
+        self.start = start
+        self.tolerance = tolerance
+        self.saved_log_pmf = None
+        self.saved_cutoff = None
+
+
+    @property
+    def sample_space(self):
+        return set(range(self.start, self._cutoff() + 1))
+
+
+    @sample_space.setter
+    def sample_space(self, sample_space):
+        if sample_space is not None:
+            raise ValueError("The support of a truncated random variable follows from its parameters")
+
+
+    def support(self):
+        if self.saved_support is None:
+            cutoff = self._cutoff()
+            probabilities = np.exp(self.saved_log_pmf[:cutoff - self.start + 1])
+            self.saved_support = (np.arange(self.start, cutoff + 1), probabilities / probabilities.sum())
+        return self.saved_support
+
+
+    def log_pmf(self, x):
+        '''
+        Returns the logarithm of the probability of a value, without any
+        truncation. Far in the tail, the probability itself would underflow
+        to zero while its logarithm stays accurate.
+
+        Args:
+            x: A value of the random variable
+
+        Returns:
+            log P(X = x)
+        '''
+
+        if x < self.start or x != math.floor(x):
+            return -math.inf
+        # Values beyond the calculated log probabilities are evaluated on
+        # their own rather than by extending the array up to them
+        if self.saved_log_pmf is None or x - self.start >= len(self.saved_log_pmf):
+            return self._log_probability(int(x))
+        return self.saved_log_pmf[int(x) - self.start].item()
+
+
+    def cdf(self, x, approx=None):
+        if approx is not None:
+            return RootDiscreteRandVar.cdf(self, x, approx)
+        if x < self.start:
+            return 0.0
+        k = int(math.floor(x))
+        # The log probabilities are only extended up to x, or until doubling
+        # them past the median no longer changes the cumulative probability,
+        # whichever comes first
+        self._grow(self.start)
+        total = None
+        while k - self.start >= len(self.saved_log_pmf):
+            current = np.exp(self.saved_log_pmf).sum().item()
+            if current == total and current >= 0.5:
+                return min(current, 1.0)
+            total = current
+            self._grow(min(k, self.start + 2 * len(self.saved_log_pmf)))
+        return min(np.exp(self.saved_log_pmf[:k - self.start + 1]).sum().item(), 1.0)
+
+
+    def tail_probability(self, x, approx=None):
+        if approx is not None:
+            return RootDiscreteRandVar.tail_probability(self, x, approx)
+        cdf = self.cdf(x)
+        if cdf < 0.5:
+            return 1 - cdf
+        # Far in the tail, 1 - cdf(x) would lose its precision, so the tail
+        # is summed directly until its terms no longer contribute
+        n = int(math.floor(x)) - self.start + 1
+        if n >= len(self.saved_log_pmf):
+            # Beyond the calculated log probabilities, the terms are evaluated
+            # on their own rather than by extending the array up to x
+            tail = 0.0
+            while True:
+                term = math.exp(self._log_probability(self.start + n))
+                tail += term
+                if term <= tail * 1e-17:
+                    return tail
+                n += 1
+        while True:
+            terms = np.exp(self.saved_log_pmf[n:])
+            tail = terms.sum().item()
+            if len(terms) > 0 and terms[-1] <= tail * 1e-17:
+                return tail
+            self._grow(self.start + 2 * len(self.saved_log_pmf))
+
+
+    def quantile(self, q, approx=None):
+        if approx is not None:
+            return RootDiscreteRandVar.quantile(self, q, approx)
+        if q > 1 - self.tolerance:
+            return self._cutoff()
+        self._grow(self.start)
+        # Allow for rounding errors in the cumulative sums
+        cdf = np.cumsum(np.exp(self.saved_log_pmf))
+        while cdf[-1] < q - 1e-12:
+            self._grow(self.start + 2 * len(self.saved_log_pmf))
+            cdf = np.cumsum(np.exp(self.saved_log_pmf))
+        return self.start + int(np.argmax(cdf >= q - 1e-12))
+
+
+    def _clear_caches(self):
+        RootDiscreteRandVar._clear_caches(self)
+        self.saved_log_pmf = None
+        self.saved_cutoff = None
+
+
+    def _probability(self, x):
+        values, probabilities = self.support()
+        if x < self.start or x > values[-1] or x != math.floor(x):
+            return 0.0
+        return probabilities[int(x) - self.start].item()
+
+
+    def _grow(self, x):
+        # Extends the log probabilities to cover every value up to x. The
+        # length at least doubles every time, so growing one value at a
+        # time still only costs linear time overall
+        length = 0 if self.saved_log_pmf is None else len(self.saved_log_pmf)
+        if x - self.start < length:
+            return
+        length = max(2 * length, x - self.start + 1, 64)
+        self.saved_log_pmf = self._log_probabilities(self.start + length)
+
+
+    def _cutoff(self):
+        # The smallest value that leaves at most the tolerance in the tail
+        if self.saved_cutoff is None:
+            self._grow(self.start)
+            while True:
+                cdf = np.cumsum(np.exp(self.saved_log_pmf))
+                if cdf[-1] >= 1 - self.tolerance:
+                    self.saved_cutoff = self.start + int(np.argmax(cdf >= 1 - self.tolerance))
+                    break
+                self._grow(self.start + 2 * len(self.saved_log_pmf))
+        return self.saved_cutoff
+
+
+    def _new_pmf(self, fixed_means):
+        values, probabilities = self.support()
+        return dict(zip(values.tolist(), probabilities.tolist()))
+
+
+    @abstractmethod
+    def _log_probabilities(self, stop):
+        '''Implemented by subclasses, calculates the logarithms of the
+        probabilities of every value from start up to, but excluding, stop'''
+
+        pass
+
+
+    @abstractmethod
+    def _log_probability(self, x):
+        '''Implemented by subclasses, calculates the logarithm of the
+        probability of a single value x, which is at least start'''
+
+        pass
+
+
+class PoissonRandVar(TruncatedDiscreteRandVar):
+    '''
+    A Poisson random variable models the number of events
+    that occur in a fixed interval, when events occur
+    independently at a constant average rate. The variable
+    outputs the number of events, with mean equal to the rate.
+    '''
+
+    __slots__ = ('_rate',)
+
+
+    def __init__(self, rate, tolerance=1e-12):
+        TruncatedDiscreteRandVar.__init__(self, 0, tolerance)
+        self.rate = rate
+
+
+    @property
+    def rate(self):
+        return self._rate
+
+
+    @rate.setter
+    def rate(self, rate):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self._rate = rate
+        self.invalidate()
+
+
+    def _log_probabilities(self, stop):
+        # log P(X = k) = k log(rate) - rate - log(k!)
+        k = np.arange(stop)
+        log_factorials = np.concatenate([[0], np.cumsum(np.log(np.arange(1, stop)))])
+        return k * math.log(self.rate) - self.rate - log_factorials
+
+
+    def _log_probability(self, x):
+        return x * math.log(self.rate) - self.rate - math.lgamma(x + 1)
+
+
+    def _new_sample(self):
+        return int(np.random.poisson(self.rate))
+
+
+    def _new_sample_batch(self, size, batch):
+        return np.random.poisson(self.rate, size)
+
+
+    def _new_mean(self, fixed_means):
+        return self.rate
+
+
+    def _new_variance(self):
+        return self.rate
+
+
+    def _parameter_derivatives(self):
+        values, probabilities = self.support()
+        return {'rate': probabilities * (values / self.rate - 1)}
+
+
+class GeometricRandVar(TruncatedDiscreteRandVar):
+    '''
+    A Geometric random variable models a sequence of
+    independent Bernoulli trials where success occurs
+    with probability p. The variable outputs how many
+    trials it took to get the first success, including
+    the success itself.
+    '''
+
+    __slots__ = ('_success_rate',)
+
+
+    def __init__(self, success_rate, tolerance=1e-12):
+        TruncatedDiscreteRandVar.__init__(self, 1, tolerance)
+        self.success_rate = success_rate
+
+
+    @property
+    def success_rate(self):
+        return self._success_rate
+
+
+    @success_rate.setter
+    def success_rate(self, success_rate):
+        if not 0 < success_rate < 1:
+            raise ValueError("Success rate must be strictly between 0 and 1")
+        self._success_rate = success_rate
+        self.invalidate()
+
+
+    def _log_probabilities(self, stop):
+        # log P(X = k) = (k - 1) log(1 - p) + log(p)
+        k = np.arange(1, stop)
+        return (k - 1) * math.log1p(-self.success_rate) + math.log(self.success_rate)
+
+
+    def _log_probability(self, x):
+        return (x - 1) * math.log1p(-self.success_rate) + math.log(self.success_rate)
+
+
+    def _new_sample(self):
+        return int(np.random.geometric(self.success_rate))
+
+
+    def _new_sample_batch(self, size, batch):
+        return np.random.geometric(self.success_rate, size)
+
+
+    def _new_mean(self, fixed_means):
+        return 1 / self.success_rate
+
+
+    def _new_variance(self):
+        return (1 - self.success_rate) / self.success_rate ** 2
+
+
+    def _parameter_derivatives(self):
+        values, probabilities = self.support()
+        p = self.success_rate
+        return {'success_rate': probabilities * (1 / p - (values - 1) / (1 - p))}
+
+
+class NegativeBinomialRandVar(TruncatedDiscreteRandVar):
+    '''
+    A Negative Binomial random variable models a sequence
+    of independent Bernoulli trials where success occurs
+    with probability p. The variable outputs how many
+    failures occurred before the nth success. The number
+    of successes does not need to be an integer.
+    '''
+
+    __slots__ = ('_successes', '_success_rate')
+
+
+    def __init__(self, successes, success_rate, tolerance=1e-12):
+        TruncatedDiscreteRandVar.__init__(self, 0, tolerance)
+        self.successes = successes
+        self.success_rate = success_rate
+
+
+    @property
+    def successes(self):
+        return self._successes
+
+
+    @successes.setter
+    def successes(self, successes):
+        if successes <= 0:
+            raise ValueError("Number of successes must be positive")
+        self._successes = successes
+        self.invalidate()
+
+
+    @property
+    def success_rate(self):
+        return self._success_rate
+
+
+    @success_rate.setter
+    def success_rate(self, success_rate):
+        if not 0 < success_rate < 1:
+            raise ValueError("Success rate must be strictly between 0 and 1")
+        self._success_rate = success_rate
+        self.invalidate()
+
+
+    def _log_probabilities(self, stop):
+        # log P(X = k) = log(Gamma(k + n) / Gamma(n)) - log(k!) + n log(p) + k log(1 - p),
+        # where Gamma(k + n) / Gamma(n) = n(n + 1)...(n + k - 1)
+        n = self.successes
+        k = np.arange(stop)
+        log_rising = np.concatenate([[0], np.cumsum(np.log(n + np.arange(stop - 1)))])
+        log_factorials = np.concatenate([[0], np.cumsum(np.log(np.arange(1, stop)))])
+        return log_rising - log_factorials + n * math.log(self.success_rate) + k * math.log1p(-self.success_rate)
+
+
+    def _log_probability(self, x):
+        n = self.successes
+        return math.lgamma(x + n) - math.lgamma(n) - math.lgamma(x + 1) + n * math.log(self.success_rate) + \
+            x * math.log1p(-self.success_rate)
+
+
+    def _new_sample(self):
+        return int(np.random.negative_binomial(self.successes, self.success_rate))
+
+
+    def _new_sample_batch(self, size, batch):
+        return np.random.negative_binomial(self.successes, self.success_rate, size)
+
+
+    def _new_mean(self, fixed_means):
+        return self.successes * (1 - self.success_rate) / self.success_rate
+
+
+    def _new_variance(self):
+        return self.successes * (1 - self.success_rate) / self.success_rate ** 2
+
+
+    def _parameter_derivatives(self):
+        values, probabilities = self.support()
+        p = self.success_rate
+        return {'success_rate': probabilities * (self.successes / p - values / (1 - p))}
@@ -1,7 +1,7 @@
-from .randvar import DiscreteRandVar
+from .randvar import DiscreteRandVar, _pmf_arrays
 
 import copy
-import itertools
+import numpy as np
 
 
 class UnaryDiscreteRandVar(DiscreteRandVar):
@@ -15,42 +15,101 @@ class UnaryDiscreteRandVar(DiscreteRandVar):
     The function g must be well-defined for every value
     in the support of X and g(X) must satisfy the properties
     of a discrete random variable.
+
+    If g is vectorized, meaning that it can be applied to a
+    whole numpy array of values at once, it is applied to the
+    entire support of X and to entire batches of samples
+    instead of once per value. Numpy ufuncs are always
+    treated as vectorized.
     '''
 
-    def __init__(self, rv, func):
+    __slots__ = ('rv', 'func', 'vectorized')
+
+
+    def __init__(self, rv, func, vectorized=False):
         DiscreteRandVar.__init__(self)
         self.rv = rv
         self.func = func
+        self.vectorized = vectorized or isinstance(func, np.ufunc)
 
-        rv.children.add(self)
-        self.parents.add(rv)
-
-
-    def _new_roots(self):
-        return self.rv.roots()
+        self._add_parents(rv)
 
 
     def _new_sample(self):
         return self.func(self.rv.sample())
 
 
+    def _new_sample_batch(self, size, batch):
+        samples = self.rv.sample_batch(size, batch)
+        if self.vectorized:
+            return np.asarray(self.func(samples))
+        # A batch usually contains far fewer distinct values than samples,
+        # so the function is only called once per distinct value
+        values, inverse = np.unique(samples, return_inverse=True)
+        return np.asarray([self.func(x) for x in values.tolist()])[inverse]
+
+
     def _new_mean(self, fixed_means):
-        # Uses the same computation process as that of multiplication
-        # Start at the roots and work our way up
-        roots = self.roots()
-        rrv_supports = []
-        for rrv in roots:
-            if rrv in fixed_means:
-                rrv_space = [(fixed_means[rrv], 1)]
-            else:
-                rrv_space = [(x, rrv.mass_function(x)) for x in rrv.sample_space]
-            rrv_supports.append(rrv_space)
+        # E[g(X)] is the sum of g(x)P(X = x) over the support of X, where
+        # the mass function of X accounts for any fixed roots
+        pmf = self.rv.pmf(fixed_means)
+        if self.vectorized:
+            values, probabilities = _pmf_arrays(pmf)
+            mean = np.tensordot(probabilities, self.func(values), axes=(0, 0))
+            return mean.item() if np.ndim(mean) == 0 else mean
         mean = 0
-        for combination in itertools.product(*rrv_supports):
-            weight = 1
-            fixes = copy.copy(fixed_means)
-            for (rrv, (fix, prob)) in zip(roots, combination):
-                weight *= prob
-                fixes[rrv] = fix
-            mean += weight * self.func(self.rv.mean(fixes))
+        for x, p in pmf.items():
+            mean += p * self.func(x)
         return mean
+
+
+    def _new_pmf(self, fixed_means):
+        pmf = self.rv.pmf(fixed_means)
+        if self.vectorized:
+            # Group equal outputs together, summing their probabilities
+            values, probabilities = _pmf_arrays(pmf)
+            outputs, inverse = np.unique(np.asarray(self.func(values)), return_inverse=True)
+            grouped = np.zeros((len(outputs),) + probabilities.shape[1:])
+            np.add.at(grouped, inverse.ravel(), probabilities)
+            return dict(zip(outputs.tolist(), list(grouped) if grouped.ndim > 1 else grouped.tolist()))
+        result = {}
+        for x, p in pmf.items():
+            value = self.func(x)
+            result[value] = result.get(value, 0) + p
+        return result
+
+
+    def _new_mean_gradient(self, fixed_means):
+        # The derivative with respect to P(R = r) is E[g(X) | R = r], which
+        # only needs the mass function of X given every value of every root
+        return {rrv: first for rrv, (first, _) in self._conditional_moments(fixed_means).items()}
+
+
+    def _new_variance_gradient(self):
+        # Likewise, the derivative of E[g(X)^2] is E[g(X)^2 | R = r]
+        mean = self.mean()
+        return {rrv: second - 2 * mean * first for rrv, (first, second) in self._conditional_moments({}).items()}
+
+
+    def _conditional_moments(self, fixed_means):
+        '''Calculates E[g(X) | R = r] and E[g(X)^2 | R = r] for every value r
+        of every root R that is not fixed, ordered like R.support()'''
+
+        moments = {}
+        for rrv in self.roots():
+            if rrv in fixed_means:
+                continue
+            fixes = copy.copy(fixed_means)
+            first = []
+            second = []
+            for x in rrv.support()[0].tolist():
+                fixes[rrv] = x
+                values, probabilities = _pmf_arrays(self.rv.pmf(fixes))
+                if self.vectorized:
+                    outputs = np.asarray(self.func(values), dtype=np.float64)
+                else:
+                    outputs = np.asarray([self.func(value) for value in values.tolist()], dtype=np.float64)
+                first.append(probabilities @ outputs)
+                second.append(probabilities @ (outputs * outputs))
+            moments[rrv] = (np.asarray(first), np.asarray(second))
+        return moments
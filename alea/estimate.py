@@ -0,0 +1,212 @@
+import asyncio
+import math
+import numpy as np
+
+
+class Estimate:
+    '''
+    A Monte Carlo estimate of an expectation together with its uncertainty.
+
+    The variance reduction compares the estimator to plain Monte Carlo
+    with the same number of draws. It is the ratio of the variance that
+    plain sampling would have to the variance this estimator achieved,
+    so a variance reduction of 10 means that plain sampling would need
+    roughly 10 times as many draws to reach the same confidence.
+    '''
+
+    def __init__(self, mean, standard_error, trials, variance_reduction=1.0):
+        '''
+        Args:
+            mean: The estimated expectation
+            standard_error: The estimated standard deviation of the estimate
+            trials: The number of draws used
+            variance_reduction: The variance of plain Monte Carlo divided by
+            the variance of this estimate
+        '''
+
+        self.mean = mean
+        self.standard_error = standard_error
+        self.trials = trials
+        self.variance_reduction = variance_reduction
+
+
+    @staticmethod
+    def from_samples(samples):
+        '''
+        Creates the plain Monte Carlo estimate of the mean of some samples.
+
+        Args:
+            samples: A numpy array of independent samples
+
+        Returns:
+            The estimate of the mean
+        '''
+
+        n = len(samples)
+        standard_error = samples.std(ddof=1) / math.sqrt(n) if n > 1 else math.inf
+        return Estimate(samples.mean(), standard_error, n)
+
+
+    def confidence_interval(self, level=0.95):
+        '''
+        Calculates a confidence interval around the estimate, using the
+        normal approximation to the distribution of the estimate.
+
+        Args:
+            level: The probability that the interval covers the true mean
+
+        Returns:
+            A tuple of the lower and upper bound of the interval
+        '''
+
+        z = normal_quantile((1 + level) / 2)
+        return (self.mean - z * self.standard_error, self.mean + z * self.standard_error)
+
+
+    def __repr__(self):
+        return 'Estimate(mean={}, standard_error={}, trials={}, variance_reduction={})'.format(
+            self.mean, self.standard_error, self.trials, self.variance_reduction)
+
+
+def variance_reduction(plain_variance, trials, estimator_variance):
+    '''Compares the variance of an estimator to that of plain Monte Carlo
+    with {trials} draws of a random variable with {plain_variance}'''
+
+    if estimator_variance <= 0:
+        return math.inf if plain_variance > 0 else 1.0
+    return plain_variance / trials / estimator_variance
+
+
+def normal_cdf(z):
+    '''
+    Args:
+        z: A point
+
+    Returns:
+        The standard normal distribution function at {z}
+    '''
+
+    return 0.5 * math.erfc(-z / math.sqrt(2))
+
+
+def normal_pdf(z):
+    '''
+    Args:
+        z: A point
+
+    Returns:
+        The standard normal density at {z}
+    '''
+
+    return math.exp(-z * z / 2) / math.sqrt(2 * math.pi)
+
+
+def normal_quantile(p):
+    '''
+    Inverts the standard normal distribution function with the rational
+    approximation of Acklam, refined by a step of Halley's method, which
+    makes it accurate to machine precision.
+
+    Args:
+        p: A probability strictly between 0 and 1
+
+    Returns:
+        The {p}-quantile of the standard normal distribution
+    '''
+
+    if not 0 < p < 1:
+        raise ValueError("Normal quantiles are only defined strictly between 0 and 1")
+    if p > 0.5:
+        # The upper half follows by symmetry, and 1 - p is exact there
+        return -normal_quantile(1 - p)
+    if p < _ACKLAM_LOW:
+        q = math.sqrt(-2 * math.log(p))
+        c, d = _ACKLAM_C, _ACKLAM_D
+        x = (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+            ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+    else:
+        q = p - 0.5
+        r = q * q
+        a, b = _ACKLAM_A, _ACKLAM_B
+        x = (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+            (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+    error = normal_cdf(x) - p
+    u = error / normal_pdf(x)
+    return x - u / (1 + x * u / 2)
+
+
+# The coefficients of Acklam's approximation of the normal quantile function,
+# and the probability below which the tail approximation is used
+_ACKLAM_A = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02,
+             -3.066479806614716e+01, 2.506628277459239e+00]
+_ACKLAM_B = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01,
+             -1.328068155288572e+01]
+_ACKLAM_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00,
+             4.374664141464968e+00, 2.938163982698783e+00]
+_ACKLAM_D = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00]
+_ACKLAM_LOW = 0.02425
+
+
+async def iterate_estimates(sample_batch, trials=10000, chunk_size=10000, timeout=None, tolerance=None,
+                            executor=None):
+    '''
+    Estimates a mean by sampling in chunks, yielding a running estimate
+    after every chunk. Each chunk is generated by {sample_batch} in an
+    executor, so the event loop stays responsive while sampling runs.
+    This is an async generator: breaking out of the loop or cancelling
+    the consuming task stops the sampling after the current chunk.
+
+    Args:
+        sample_batch: A function taking a number of samples and returning
+        them as a numpy array, with the samples along the first axis
+        trials: The total number of samples to take, or None to keep
+        sampling until stopped
+        chunk_size: The number of samples in every chunk
+        timeout: The number of seconds after which to stop sampling, or
+        None. A chunk that is still running at the deadline is abandoned
+        tolerance: A standard error below which to stop sampling, or None
+        executor: The executor to sample in, or None for the default
+        executor of the event loop
+
+    Yields:
+        The running Estimate of the mean after every chunk
+    '''
+
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    count = 0
+    mean = 0
+    squares = 0
+    while trials is None or count < trials:
+        size = chunk_size if trials is None else min(chunk_size, trials - count)
+        future = loop.run_in_executor(executor, sample_batch, size)
+        if deadline is None:
+            samples = await future
+        else:
+            try:
+                samples = await asyncio.wait_for(future, max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                return
+
+        # The mean and the sum of squared deviations of every chunk are
+        # merged into the running ones (Chan et al.), which unlike running
+        # sums of squares stays accurate for large means and many samples
+        samples = samples.astype(np.float64)
+        size = len(samples)
+        chunk_mean = samples.mean(axis=0)
+        delta = chunk_mean - mean
+        mean = mean + delta * (size / (count + size))
+        squares = squares + ((samples - chunk_mean) ** 2).sum(axis=0) + delta ** 2 * (count * size / (count + size))
+        count += size
+        if count > 1:
+            variance = squares / (count - 1)
+            standard_error = np.sqrt(variance / count)
+        else:
+            standard_error = mean * math.inf
+        estimate = Estimate(mean, standard_error, count)
+        yield estimate
+
+        if tolerance is not None and np.all(standard_error <= tolerance):
+            return
+        if deadline is not None and loop.time() >= deadline:
+            return
@@ -0,0 +1,184 @@
+from .randvec import RandVec
+
+import os
+import queue
+import threading
+import numpy as np
+
+
+# Every file written by a SampleWriter has a header of exactly this many
+# bytes, so that the header can be rewritten in place as rows are appended
+HEADER_BYTES = 128
+
+
+class SampleWriter:
+    '''
+    Writes rows of samples to a .npy file as they are generated, without
+    ever holding more than one batch in memory. The file can be loaded
+    with np.load(), including with mmap_mode, at any point after close().
+
+    The header of a .npy file records the number of rows, so it is written
+    with a fixed size and rewritten in place whenever the writer is closed.
+    This also makes the file appendable: opening a writer on an existing
+    file it wrote continues after its last row.
+    '''
+
+    def __init__(self, path, columns, dtype=np.float64, append=False):
+        '''
+        Args:
+            path: The path of the .npy file
+            columns: The number of values in every row
+            dtype: The numpy type to store the values as
+            append: Whether to continue an existing file rather than
+            replacing it
+        '''
+
+        self.path = path
+        self.columns = columns
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        if append and os.path.exists(path):
+            self.file = open(path, 'r+b')
+            if np.lib.format.read_magic(self.file) != (1, 0):
+                self.file.close()
+                raise ValueError("Only files written by a SampleWriter can be appended to")
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self.file)
+            if self.file.tell() != HEADER_BYTES or len(shape) != 2 or fortran_order:
+                self.file.close()
+                raise ValueError("Only files written by a SampleWriter can be appended to")
+            if shape[1] != columns or dtype != self.dtype:
+                self.file.close()
+                raise ValueError("The rows must have the same number of columns and type as the file")
+            self.rows = shape[0]
+            self.file.seek(HEADER_BYTES + self.rows * columns * self.dtype.itemsize)
+            self.file.truncate()
+        else:
+            self.file = open(path, 'w+b')
+            self._write_header()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def write(self, samples):
+        '''
+        Appends rows to the file.
+
+        Args:
+            samples: A 2D array with one row per sample
+        '''
+
+        samples = np.ascontiguousarray(samples, dtype=self.dtype)
+        if samples.ndim != 2 or samples.shape[1] != self.columns:
+            raise ValueError("Every row must have {} values".format(self.columns))
+        self.file.write(samples.data)
+        self.rows += len(samples)
+
+
+    def close(self):
+        '''Records the number of rows in the header and closes the file'''
+
+        if not self.file.closed:
+            self._write_header()
+            self.file.close()
+
+
+    def _write_header(self):
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+                  'shape': (self.rows, self.columns)}
+        text = repr(header).encode('latin1')
+        magic = np.lib.format.magic(1, 0)
+        # The header is padded with spaces up to the fixed size and ends in a newline
+        padding = HEADER_BYTES - len(magic) - 2 - len(text) - 1
+        position = self.file.tell()
+        self.file.seek(0)
+        self.file.write(magic + (HEADER_BYTES - len(magic) - 2).to_bytes(2, 'little') + text +
+                        b' ' * padding + b'\n')
+        if position > 0:
+            self.file.seek(position)
+
+
+def export_samples(path, rvs, trials, batch_size=100000, dtype=np.float64, append=False, threaded=False,
+                   queue_size=2):
+    '''
+    Draws {trials} joint samples of random variables and random vectors
+    and streams them to a .npy file, one batch at a time. Every row holds
+    one draw: a column per random variable, with random vectors flattened
+    into their random variables. Memory use is bounded by the batch size,
+    however many samples are written.
+
+    With {threaded}, batches are written by a separate thread while the
+    next ones are sampled, so that disk I/O overlaps with sampling. At most
+    {queue_size} batches wait to be written at any time, which keeps the
+    memory bounded when the disk is slower than sampling.
+
+    Args:
+        path: The path of the .npy file
+        rvs: A list of random variables and random vectors
+        trials: The number of samples to draw
+        batch_size: The number of samples in every batch
+        dtype: The numpy type to store the samples as
+        append: Whether to add the samples to an existing file written by
+        export_samples rather than replacing it
+        threaded: Whether to write batches in a separate thread
+        queue_size: The largest number of batches waiting to be written
+
+    Returns:
+        The total number of rows in the file
+    '''
+
+    if batch_size <= 0 or queue_size <= 0:
+        raise ValueError("Batch and queue sizes must be positive")
+    columns = sum(len(rv) if isinstance(rv, RandVec) else 1 for rv in rvs)
+    with SampleWriter(path, columns, dtype, append) as writer:
+        if not threaded:
+            for samples in _batches(rvs, trials, batch_size):
+                writer.write(samples)
+            return writer.rows
+
+        batches = queue.Queue(maxsize=queue_size)
+        errors = []
+        def write():
+            while True:
+                samples = batches.get()
+                if samples is None:
+                    return
+                # After a failure, batches are still taken off the queue
+                # so that the sampling thread never blocks on it
+                if len(errors) == 0:
+                    try:
+                        writer.write(samples)
+                    except Exception as e:
+                        errors.append(e)
+        thread = threading.Thread(target=write, daemon=True)
+        thread.start()
+        try:
+            for samples in _batches(rvs, trials, batch_size):
+                if len(errors) > 0:
+                    break
+                batches.put(samples)
+        finally:
+            batches.put(None)
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+        return writer.rows
+
+
+def _batches(rvs, trials, batch_size):
+    '''Generates the joint samples of random variables and random vectors
+    as 2D arrays of at most {batch_size} rows'''
+
+    for start in range(0, trials, batch_size):
+        size = min(batch_size, trials - start)
+        batch = {}
+        columns = []
+        for rv in rvs:
+            samples = rv.sample_batch(size, batch)
+            columns.append(samples if samples.ndim == 2 else samples.reshape((size, 1)))
+        yield np.hstack(columns)
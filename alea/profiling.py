@@ -0,0 +1,164 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
+import time
+
+
+# The report currently collecting statistics. When no profile is active,
+# this is None and random variables skip all bookkeeping
+current = None
+
+
+class ProfileReport:
+    '''
+    Collects statistics about how random variables are evaluated while a
+    profile is active. Every call to one of the uncached calculations
+    (_new_mean, _new_variance, _new_covariance, _new_pmf, _new_sample) is
+    counted and timed, both per node type and per node. Cache hits and
+    misses are counted per cache, and the number of root combinations
+    enumerated by a node is attributed to the node doing the enumeration.
+
+    Times are measured with a wall clock. The total time of a call includes
+    the calls it makes to other random variables, while the self time
+    excludes them, which makes the self time the better guide to where an
+    evaluation is actually spending its time.
+
+    The report holds strong references to the nodes it has seen, so it
+    should be discarded once it has been inspected.
+    '''
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.total_time = defaultdict(float)
+        self.self_time = defaultdict(float)
+        self.combinations = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.node_calls = defaultdict(int)
+        self.node_time = defaultdict(float)
+        self.wall_time = 0
+        self._stack = []
+
+
+    def call(self, rv, method, *args):
+        '''
+        Calls the given method of a random variable and records the call.
+        Used internally by random variables while the profile is active.
+
+        Args:
+            rv: The random variable being evaluated
+            method: The name of the method to call
+            args: The arguments to pass to the method
+
+        Returns:
+            Whatever the method returns
+        '''
+
+        key = (type(rv).__name__, method)
+        self.calls[key] += 1
+        self.node_calls[rv] += 1
+        # The frame tracks the time spent in nested calls,
+        # which is subtracted to produce the self time
+        frame = [rv, method, 0]
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            return getattr(rv, method)(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            self.total_time[key] += elapsed
+            self.self_time[key] += elapsed - frame[2]
+            self.node_time[rv] += elapsed - frame[2]
+            if len(self._stack) > 0:
+                self._stack[-1][2] += elapsed
+
+
+    def cache(self, name, hit):
+        '''
+        Records a lookup in one of the caches of a random variable.
+
+        Args:
+            name: The name of the cache, such as 'mean' or 'covariance'
+            hit: Whether the cached value was found
+        '''
+
+        if hit:
+            self.cache_hits[name] += 1
+        else:
+            self.cache_misses[name] += 1
+
+
+    def enumerate(self, count):
+        '''
+        Records that {count} root combinations were enumerated by the
+        random variable currently being evaluated.
+
+        Args:
+            count: The number of root combinations
+        '''
+
+        if len(self._stack) > 0:
+            rv, method, _ = self._stack[-1]
+            self.combinations[(type(rv).__name__, method)] += count
+        else:
+            self.combinations[(None, None)] += count
+
+
+    def hottest(self, n=10):
+        '''
+        Finds the nodes that spent the most time evaluating themselves.
+
+        Args:
+            n: The number of nodes to return
+
+        Returns:
+            A list of up to {n} (node, self time, calls) tuples, slowest first
+        '''
+
+        nodes = sorted(self.node_time, key=lambda rv : self.node_time[rv], reverse=True)
+        return [(rv, self.node_time[rv], self.node_calls[rv]) for rv in nodes[:n]]
+
+
+    def __str__(self):
+        lines = ["{:<40}{:<18}{:>10}{:>12}{:>12}{:>14}".format(
+            "node type", "method", "calls", "total (s)", "self (s)", "combinations")]
+        for key in sorted(self.calls, key=lambda k : self.self_time[k], reverse=True):
+            lines.append("{:<40}{:<18}{:>10}{:>12.6f}{:>12.6f}{:>14}".format(
+                key[0], key[1], self.calls[key], self.total_time[key],
+                self.self_time[key], self.combinations.get(key, 0)))
+        for name in sorted(set(self.cache_hits) | set(self.cache_misses)):
+            lines.append("cache {:<12} hits {:>10} misses {:>10}".format(
+                name, self.cache_hits.get(name, 0), self.cache_misses.get(name, 0)))
+        lines.append("wall time {:.6f}s".format(self.wall_time))
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile():
+    '''
+    Profiles every random variable evaluated within the context. Profiling
+    is opt-in: outside of this context, random variables only pay for a
+    single check of whether a profile is active.
+
+        with alea.profile() as report:
+            Z.variance()
+        print(report)
+
+    Profiles may be nested, in which case the inner profile collects the
+    statistics until it exits. Profiling is not thread-safe.
+
+    Returns:
+        The ProfileReport that collects the statistics
+    '''
+
+    global current
+    previous = current
+    report = ProfileReport()
+    current = report
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        report.wall_time = time.perf_counter() - start
+        current = previous
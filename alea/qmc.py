@@ -0,0 +1,89 @@
+import numpy as np
+
+
+def primes(count):
+    '''
+    Finds the first {count} prime numbers.
+
+    Args:
+        count: The number of primes to find
+
+    Returns:
+        A list of the first {count} primes
+    '''
+
+    found = []
+    candidate = 2
+    while len(found) < count:
+        if all(candidate % p != 0 for p in found if p * p <= candidate):
+            found.append(candidate)
+        candidate += 1
+    return found
+
+
+def halton(size, dimensions, scramble=True):
+    '''
+    Generates points of the Halton low-discrepancy sequence in the unit
+    hypercube. The ith coordinate of the nth point is the radical inverse
+    of n in the base of the ith prime: the digits of n are mirrored around
+    the decimal point. Consecutive points fill the hypercube far more evenly
+    than independent uniforms do.
+
+    When scrambled, the digits at every position of every coordinate are
+    passed through an independent random permutation, and the digits beyond
+    those used by the sequence are filled with a random offset. Every point
+    is then uniformly distributed on its own while the set of points keeps
+    its low discrepancy, so independently scrambled replicates can be used
+    to estimate errors (randomized quasi-Monte Carlo). Scrambling also
+    breaks up the correlations between the coordinates with large bases.
+
+    Args:
+        size: The number of points to generate
+        dimensions: The number of coordinates of every point
+        scramble: Whether to randomly scramble the digits
+
+    Returns:
+        The points as a {size}-by-{dimensions} numpy array
+    '''
+
+    points = np.empty((size, dimensions))
+    for j, base in enumerate(primes(dimensions)):
+        indices = np.arange(size)
+        coordinate = np.zeros(size)
+        scale = 1 / base
+        while True:
+            digits = indices % base
+            if scramble:
+                digits = np.random.permutation(base)[digits]
+            coordinate += digits * scale
+            indices //= base
+            # Stop once every index has run out of digits, after filling
+            # the remaining digits when scrambling
+            if not np.any(indices):
+                if scramble:
+                    coordinate += np.random.random() * scale
+                break
+            scale /= base
+        points[:, j] = coordinate
+    return points
+
+
+def latin_hypercube(size, dimensions):
+    '''
+    Generates stratified points in the unit hypercube. Every coordinate has
+    exactly one point in each of the {size} equal strata of [0, 1), placed
+    uniformly within its stratum, and the strata are matched up randomly
+    between coordinates.
+
+    Args:
+        size: The number of points to generate
+        dimensions: The number of coordinates of every point
+
+    Returns:
+        The points as a {size}-by-{dimensions} numpy array
+    '''
+
+    points = np.empty((size, dimensions))
+    for j in range(dimensions):
+        points[:, j] = (np.random.permutation(size) + np.random.random(size)) / size
+    return points
@@ -1,6 +1,27 @@
 from abc import ABC, abstractmethod
-from weakref import WeakSet
 from collections import deque
+from types import MappingProxyType
+
+from . import profiling
+from .estimate import Estimate, variance_reduction, iterate_estimates
+from .qmc import halton, latin_hypercube
+
+import numpy as np
+import functools
+import heapq
+import math
+import weakref
+
+
+# Shared by every random variable without cached covariances
+_NO_COVARIANCES = MappingProxyType({})
+
+# Every root is given a dense integer id, so that a set of roots can be
+# stored as the bits of an integer. The registry maps ids to weak references
+# to the roots, and the ids of garbage collected roots are reused, smallest
+# first, to keep the integers short
+_root_registry = []
+_free_root_ids = []
 
 
 class RandVar(ABC):
@@ -17,30 +38,108 @@ class RandVar(ABC):
     variables. However, its distribution is not affected by any
     child random variables. Thus, if any child random variables are
     garbage collected, it will not affect this random variable.
+
+    Large models contain millions of random variables, so every class
+    declares __slots__ instead of carrying a __dict__. Parents are kept in
+    a tuple and children in a list of weak references, and neither they
+    nor the cache of covariances are allocated until something is put in
+    them.
     '''
 
+    __slots__ = ('saved_sample', 'saved_mean', 'saved_variance', '_covariances', '_parents', '_children',
+                 'saved_root_mask', '__weakref__')
+
+
     def __init__(self):
         self.saved_sample = None
         self.saved_mean = None
         self.saved_variance = None
-        self.saved_covariances = {}
-        self.parents = set()
-        self.children = WeakSet()
-        self.saved_roots = None
+        self._covariances = None
+        self._parents = None
+        self._children = None
+        self.saved_root_mask = None
+
+
+    @property
+    def parents(self):
+        '''The tuple of random variables that this random variable is built from'''
+
+        return () if self._parents is None else self._parents
+
+
+    @property
+    def children(self):
+        '''The list of random variables built from this random variable
+        that have not been garbage collected'''
+
+        if self._children is None:
+            return []
+        children = [ref() for ref in self._children]
+        return [child for child in children if child is not None]
+
+
+    @property
+    def saved_covariances(self):
+        '''A read-only view of the cached covariances between this random
+        variable and others. Covariances are cached through _save_covariance()'''
+
+        return _NO_COVARIANCES if self._covariances is None else MappingProxyType(self._covariances)
 
 
     def roots(self):
         '''
         Finds the roots associated with the random variable. Root random variables
-        are direct mappings from a probability space. The roots of a random variable
-        will never change, so after they are found, they are simply cached.
+        are direct mappings from a probability space. The set is decoded from
+        root_mask() on every call, so checks that only need to know whether
+        roots are shared should compare masks instead.
 
         Returns:
             An immutable set of root random variables
         '''
-        if self.saved_roots is None:
-            self.saved_roots = self._new_roots()
-        return self.saved_roots
+
+        return frozenset(_mask_roots(self.root_mask()))
+
+
+    def root_mask(self):
+        '''
+        Returns the roots of this random variable as a bitset: an integer
+        whose ith bit is set if the root with id i is one of them. Roots are
+        numbered densely by a registry as they are first needed. Two random
+        variables are independent if the intersection of their masks is 0,
+        and masks of unions and intersections are single integer operations.
+        Random variables with a single parent share its mask. The roots of a
+        random variable will never change, so after they are found, they are
+        simply cached.
+
+        Returns:
+            The bitset of roots as an integer
+        '''
+
+        # The ancestors are visited with a stack rather than by recursion,
+        # so that long chains such as left-nested sums do not overflow it.
+        # Parents are visited in order, so roots are numbered depth first
+        stack = [self]
+        while len(stack) > 0:
+            rv = stack[-1]
+            if rv.saved_root_mask is not None:
+                stack.pop()
+            elif not rv._parents:
+                rv.saved_root_mask = 1 << _register_root(rv)
+                stack.pop()
+            elif rv is not self and type(rv).root_mask is not RandVar.root_mask:
+                rv.root_mask()
+                stack.pop()
+            else:
+                pending = [parent for parent in rv._parents if parent.saved_root_mask is None]
+                if len(pending) > 0:
+                    stack.extend(reversed(pending))
+                    continue
+                mask = rv._parents[0].saved_root_mask
+                for parent in rv._parents[1:]:
+                    mask |= parent.saved_root_mask
+                rv.saved_root_mask = mask
+                stack.pop()
+        return self.saved_root_mask
 
 
     def sample(self):
@@ -89,10 +188,39 @@ class RandVar(ABC):
 
         # In topological order, generate new samples
         for node in topo:
-            node.saved_sample = node._new_sample()
+            node.saved_sample = node._calculation('_new_sample')()
+
+
+    def sample_batch(self, size, batch=None):
+        '''
+        Generates {size} independent samples of this random variable at once,
+        as a numpy array. This is much faster than calling resample() {size}
+        times, since every random variable in the graph is sampled with a
+        single vectorized operation.
+
+        Like resample(), batches are consistent: the ith entries of the
+        batches of all random variables come from the same draw of the roots.
+        The {batch} dictionary maps random variables to the batches that have
+        already been generated. Passing the same dictionary when sampling
+        several random variables produces joint samples of all of them.
 
+        Args:
+            size: The number of samples to generate
+            batch: A dictionary mapping random variables to batches that
+            have already been generated
 
-    def sample_mean(self, trials=10000):
+        Returns:
+            The samples as a numpy array of length {size}
+        '''
+
+        if batch is None:
+            batch = {}
+        if self not in batch:
+            batch[self] = self._calculation('_new_sample_batch')(size, batch)
+        return batch[self]
+
+
+    def sample_mean(self, trials=10000, method='plain'):
         '''
         Performs a point estimate of the mean by simply
         sampling for {trial} amount of times and then averaging the
@@ -102,20 +230,268 @@ class RandVar(ABC):
         Note that a large number of samples will result in better
         approximation of the mean but will take more time to generate.
         A random variable will a high variance will converge to the
-        sampled mean more slowly.
+        sampled mean more slowly. The variance reduction methods of
+        estimate_mean() converge faster for the same number of samples.
 
         Args:
             trials: The number of samples to take
+            method: The sampling method, as in estimate_mean()
 
         Returns:
             An approximation of the mean
         '''
 
-        mean = 0
-        for _ in range(trials):
-            self.resample()
-            mean += self.sample()
-        return mean / trials
+        return self.estimate_mean(trials, method).mean
+
+
+    def estimate_mean(self, trials=10000, method='plain', replicates=10):
+        '''
+        Estimates the mean by Monte Carlo sampling and reports how precise
+        the estimate is. The following methods are supported:
+            plain: Averages {trials} independent samples.
+            control: Uses the samples of the roots as control variates.
+            The exact mean of every root is known, so the part of the error
+            that is explained by the roots straying from their means is
+            regressed out of the estimate.
+            antithetic: Draws samples in pairs, where every root is sampled
+            by inverse transform from a uniform U in one sample and from
+            1 - U in the other. Works well for monotone random variables.
+            stratified: Stratifies the uniforms that every root is sampled
+            from, so that every root covers its support evenly (Latin
+            hypercube sampling).
+            qmc: Samples every root by inverse transform from its own
+            coordinate of a scrambled Halton sequence (randomized
+            quasi-Monte Carlo). Converges much faster than plain sampling
+            for smooth functions of a moderate number of roots.
+        The stratified and qmc methods split the samples into independent
+        {replicates}, whose spread is used to calculate the standard error.
+
+        Args:
+            trials: The number of samples to take
+            method: One of 'plain', 'control', 'antithetic', 'stratified'
+            or 'qmc'
+            replicates: The number of independent replicates used by the
+            stratified and qmc methods
+
+        Returns:
+            An Estimate of the mean, including its standard error and its
+            variance reduction relative to plain sampling
+        '''
+
+        roots = list(self.roots())
+        # Without roots, as for a conditional whose roots all belong to its
+        # event, there is nothing to reduce the variance with
+        if method == 'plain' or len(roots) == 0 and method in ('control', 'antithetic', 'stratified', 'qmc'):
+            return Estimate.from_samples(self.sample_batch(trials))
+
+        elif method == 'control':
+            batch = {}
+            samples = self.sample_batch(trials, batch)
+            controls = np.column_stack([rrv._controls(batch[rrv]) for rrv in roots])
+            centered = controls - controls.mean(axis=0)
+            beta = np.linalg.lstsq(centered, samples - samples.mean(), rcond=None)[0]
+            adjusted = samples - controls @ beta
+            estimate = Estimate.from_samples(adjusted)
+
+        elif method == 'antithetic':
+            pairs = max(trials // 2, 2)
+            uniforms = {rrv: np.random.random(pairs) for rrv in roots}
+            first = self.sample_batch(pairs, {rrv: rrv._inverse_cdf(u) for rrv, u in uniforms.items()})
+            second = self.sample_batch(pairs, {rrv: rrv._inverse_cdf(1 - u) for rrv, u in uniforms.items()})
+            estimate = Estimate.from_samples((first + second) / 2)
+            samples = np.concatenate([first, second])
+
+        elif method == 'stratified' or method == 'qmc':
+            size = max(trials // replicates, 1)
+            batches = []
+            for _ in range(replicates):
+                if method == 'stratified':
+                    uniforms = latin_hypercube(size, len(roots))
+                else:
+                    uniforms = halton(size, len(roots))
+                # Every root is sampled by inverse transform from its own coordinate
+                batch = {rrv: rrv._inverse_cdf(uniforms[:, j]) for j, rrv in enumerate(roots)}
+                batches.append(self.sample_batch(size, batch))
+            estimate = Estimate.from_samples(np.asarray([x.mean() for x in batches]))
+            samples = np.concatenate(batches)
+
+        else:
+            raise ValueError("Unknown sampling method {}".format(method))
+
+        estimate.trials = len(samples)
+        estimate.variance_reduction = variance_reduction(
+            samples.var(ddof=1), len(samples), estimate.standard_error ** 2)
+        return estimate
+
+
+    def iter_sample_mean(self, trials=10000, chunk_size=10000, timeout=None, tolerance=None, executor=None):
+        '''
+        Estimates the mean by sampling in chunks without blocking an asyncio
+        event loop. This is an async generator that yields the running
+        estimate, including its standard error and confidence intervals,
+        after every chunk:
+
+            async for estimate in X.iter_sample_mean(trials=10 ** 7, timeout=0.5):
+                print(estimate.confidence_interval())
+
+        Chunks are sampled in an executor. Sampling stops after {trials}
+        samples, once the standard error falls below {tolerance}, once
+        {timeout} seconds have passed, or when the caller stops iterating
+        or is cancelled.
+
+        Args:
+            trials: The total number of samples, or None for no limit
+            chunk_size: The number of samples in every chunk
+            timeout: The number of seconds to sample for, or None
+            tolerance: The standard error to stop at, or None
+            executor: The executor to sample in, or None for the default
+
+        Returns:
+            An async iterator of Estimates of the mean
+        '''
+
+        return iterate_estimates(lambda size : self.sample_batch(size), trials, chunk_size,
+                                 timeout, tolerance, executor)
+
+
+    async def sample_mean_async(self, trials=10000, chunk_size=10000, timeout=None, tolerance=None, executor=None):
+        '''
+        Estimates the mean like iter_sample_mean(), but only returns the last
+        running estimate. With a {timeout}, this returns the best estimate
+        available at the deadline.
+
+        Args:
+            trials: The total number of samples, or None for no limit
+            chunk_size: The number of samples in every chunk
+            timeout: The number of seconds to sample for, or None
+            tolerance: The standard error to stop at, or None
+            executor: The executor to sample in, or None for the default
+
+        Returns:
+            The last Estimate of the mean, or None if no chunk finished
+        '''
+
+        estimate = None
+        async for estimate in self.iter_sample_mean(trials, chunk_size, timeout, tolerance, executor):
+            pass
+        return estimate
+
+
+    def estimate_tail_probability(self, threshold, trials=10000, tilt=None):
+        '''
+        Estimates P(X > threshold) by importance sampling. Instead of
+        sampling the roots from their own distributions, every root is
+        sampled from an exponentially tilted distribution that makes the
+        tail event common, and every sample is weighted by its likelihood
+        ratio so that the estimate stays unbiased. Events with probabilities
+        far too small to ever be observed by plain sampling can then be
+        estimated from a modest number of draws.
+
+        By default, each root is tilted in proportion to how strongly this
+        random variable depends on it linearly, Cov[X, R] / Var[R], and the
+        strength of the tilt is chosen so that the tilted mean of that linear
+        approximation equals the threshold. Either the strength of the tilt
+        or the tilt of every root can be given instead.
+
+        Args:
+            threshold: The threshold of the tail event
+            trials: The number of samples to take
+            tilt: None, a number scaling the default tilts, or a dictionary
+            mapping roots to the parameters of their exponential tilts
+
+        Returns:
+            An Estimate of the tail probability
+        '''
+
+        samples, weights = self._importance_batch(threshold, trials, tilt)
+        weighted = weights * (samples > threshold)
+        estimate = Estimate.from_samples(weighted)
+        p = min(max(estimate.mean, 0), 1)
+        estimate.variance_reduction = variance_reduction(p * (1 - p), trials, estimate.standard_error ** 2)
+        return estimate
+
+
+    def estimate_tail_expectation(self, threshold, trials=10000, tilt=None):
+        '''
+        Estimates E[X | X > threshold] by importance sampling, in the same way
+        as estimate_tail_probability(). The estimate is the ratio of the
+        weighted sum of the samples in the tail to the weighted number of
+        samples in the tail, and its standard error follows from the delta
+        method.
+
+        Args:
+            threshold: The threshold of the tail event
+            trials: The number of samples to take
+            tilt: None, a number scaling the default tilts, or a dictionary
+            mapping roots to the parameters of their exponential tilts
+
+        Returns:
+            An Estimate of the tail expectation
+        '''
+
+        samples, weights = self._importance_batch(threshold, trials, tilt)
+        tail = weights * (samples > threshold)
+        probability = tail.mean()
+        if probability <= 0:
+            raise ValueError("No samples fell in the tail, increase the number of trials")
+        mean = (tail * samples).mean() / probability
+        residuals = tail * (samples - mean)
+        standard_error = residuals.std(ddof=1) / math.sqrt(trials) / probability
+
+        # Plain sampling would only see about trials * P(X > threshold) tail samples
+        in_tail = samples > threshold
+        conditional_variance = np.average((samples[in_tail] - mean) ** 2, weights=weights[in_tail])
+        estimate = Estimate(mean, standard_error, trials)
+        estimate.variance_reduction = variance_reduction(
+            conditional_variance / min(probability, 1), trials, standard_error ** 2)
+        return estimate
+
+
+    def _importance_batch(self, threshold, trials, tilt):
+        '''Samples the roots from their tilted distributions, returning the
+        samples of this random variable along with their likelihood ratios'''
+
+        tilts = tilt if isinstance(tilt, dict) else self._exponential_tilts(threshold, tilt)
+        batch = {}
+        log_weights = np.zeros(trials)
+        for rrv in self.roots():
+            samples, log_ratios = rrv._tilted_sample_batch(tilts.get(rrv, 0), trials)
+            batch[rrv] = samples
+            log_weights += log_ratios
+        return self.sample_batch(trials, batch), np.exp(log_weights)
+
+
+    def _exponential_tilts(self, threshold, strength):
+        '''Tilts every root in proportion to the slope of the linear
+        regression of this random variable on the root'''
+
+        roots = list(self.roots())
+        slopes = {}
+        for rrv in roots:
+            slopes[rrv] = self.covariance(rrv) / rrv.variance() if rrv.variance() > 0 else 0
+        if strength is not None:
+            return {rrv: strength * slopes[rrv] for rrv in roots}
+
+        # The tilted mean of the linear approximation increases with the
+        # strength of the tilt, so the strength can be found by bisection
+        offset = self.mean() - sum(slopes[rrv] * rrv.mean() for rrv in roots)
+        def tilted_mean(strength):
+            return offset + sum(slopes[rrv] * rrv._tilted_mean(strength * slopes[rrv]) for rrv in roots)
+        if tilted_mean(0) >= threshold:
+            return {}
+        low = 0
+        high = 1 / math.sqrt(self.variance()) if self.variance() > 0 else 1
+        for _ in range(64):
+            if tilted_mean(high) >= threshold:
+                break
+            low, high = high, high * 2
+        for _ in range(64):
+            middle = (low + high) / 2
+            if tilted_mean(middle) < threshold:
+                low = middle
+            else:
+                high = middle
+        return {rrv: high * slopes[rrv] for rrv in roots}
 
 
     def sample_variance(self, trials=10000):
@@ -132,12 +508,7 @@ class RandVar(ABC):
             An approximation of the variance
         '''
 
-        mean = self.sample_mean(trials)
-        variance = 0
-        for _ in range(trials):
-            self.resample()
-            variance += (self.sample() - mean) ** 2
-        return variance / (trials - 1)
+        return self.sample_batch(trials).var(ddof=1)
 
 
     def mean(self, fixed_means={}):
@@ -165,9 +536,11 @@ class RandVar(ABC):
         if self in fixed_means:
             return fixed_means[self]
         if len(fixed_means) > 0:
-            return self._new_mean(fixed_means)
+            return self._calculation('_new_mean')(fixed_means)
+        if profiling.current is not None:
+            profiling.current.cache('mean', self.saved_mean is not None)
         if self.saved_mean is None:
-            self.saved_mean = self._new_mean(fixed_means)
+            self.saved_mean = self._calculation('_new_mean')(fixed_means)
         return self.saved_mean
 
 
@@ -180,8 +553,10 @@ class RandVar(ABC):
             The theoretical variance of the random variable
         '''
 
+        if profiling.current is not None:
+            profiling.current.cache('variance', self.saved_variance is not None)
         if self.saved_variance is None:
-            self.saved_variance = self._new_variance()
+            self.saved_variance = self._calculation('_new_variance')()
         return self.saved_variance
 
 
@@ -189,36 +564,114 @@ class RandVar(ABC):
         '''
         Given this random variable {self} and another random variable {rv},
         calculates the covariance between the two random variables. Covariances
-        are also cached and the cache space is compressed by taking advantage
-        of the fact that covariance is symmetric between two random variables.
+        are also cached. Since covariance is symmetric between two random
+        variables, the result is cached on both of them, which lets either
+        one drop it when its distribution changes.
 
         Returns:
             The theoretical covariance between this random variable and another
         '''
 
-        if rv in self.saved_covariances:
-            result = self.saved_covariances[rv]
-        # Covariance is symmetric: Cov[X, Y] = Cov[Y, X]
-        elif self in rv.saved_covariances:
-            result = rv.saved_covariances[self]
-        else:
-            result = self._new_covariance(rv)
-            self.saved_covariances[rv] = result
+        result = None if self._covariances is None else self._covariances.get(rv)
+        if profiling.current is not None:
+            profiling.current.cache('covariance', result is not None)
+        if result is None:
+            result = self._calculation('_new_covariance')(rv)
+            self._save_covariance(rv, result)
         return result
 
 
-    def _new_roots(self):
-        '''Default approach to use BFS to find sources of a graph'''
+    def invalidate(self):
+        '''
+        Discards every cached result that depends on this random variable.
+        Distributions are normally immutable, but roots may have their
+        parameters changed in place, in which case they call this method.
+        The caches of this random variable and all of its descendants are
+        cleared, along with any cached covariances involving them. The
+        caches of every other random variable are left untouched, so only
+        the affected part of the graph is recalculated.
+        '''
 
+        visited = {self}
         queue = deque([self])
-        roots= set()
         while len(queue) > 0:
-            curr = queue.popleft()
-            if len(curr.parents) == 0:
-                roots.add(curr)
-            else:
-                queue.extend(curr.parents)
-        return roots
+            node = queue.popleft()
+            node._clear_caches()
+            for child in node.children:
+                if child not in visited:
+                    visited.add(child)
+                    queue.append(child)
+
+
+    def _clear_caches(self):
+        '''Clears the cached results of this random variable only.
+        Subclasses with additional caches extend this'''
+
+        self.saved_sample = None
+        self.saved_mean = None
+        self.saved_variance = None
+        if self._covariances is not None:
+            for rv in self._covariances:
+                rv._covariances.pop(self, None)
+            self._covariances = None
+
+
+    def _add_parents(self, *rvs):
+        '''Records that this random variable is built from {rvs}. Called
+        once by the constructors of subclasses with all the parents, so
+        the tuple of parents is built a single time'''
+
+        # A parent may be passed twice, as in X * X, but is recorded once
+        parents = tuple(dict.fromkeys(rvs))
+        self._parents = parents if parents else None
+        for rv in parents:
+            if rv._children is None:
+                rv._children = []
+            rv._children.append(weakref.ref(self))
+            # Every time the list doubles in length, drop the references to
+            # children that were garbage collected, so adding stays O(1)
+            length = len(rv._children)
+            if length >= 8 and length & (length - 1) == 0:
+                rv._children[:] = [ref for ref in rv._children if ref() is not None]
+
+
+    def _save_covariance(self, rv, covariance):
+        # Covariance is symmetric: Cov[X, Y] = Cov[Y, X]
+        if self._covariances is None:
+            self._covariances = {}
+        if rv._covariances is None:
+            rv._covariances = {}
+        self._covariances[rv] = covariance
+        rv._covariances[self] = covariance
+
+
+    def _controls(self, samples):
+        '''Returns the control variates of a batch of samples of this root,
+        which have a known mean of zero. Roots whose samples are not
+        numbers, such as the paths of Markov chains, override this'''
+
+        return samples - self.mean()
+
+
+    def _calculation(self, method):
+        '''Returns the function that performs one of the uncached
+        calculations, such as _new_mean. Without a profile, it is the method
+        itself, which the caller calls so that evaluating a graph adds no
+        stack frames. Otherwise the calculation goes through _evaluate().
+        Subclasses with more hooks, such as a persistent cache, extend this'''
+
+        if profiling.current is None:
+            return getattr(self, method)
+        return functools.partial(self._evaluate, method)
+
+
+    def _evaluate(self, method, *args):
+        '''Performs one of the uncached calculations through the hooks that
+        are active, recording the call in the current profile'''
+
+        if profiling.current is None:
+            return getattr(self, method)(*args)
+        return profiling.current.call(self, method, *args)
 
 
     @abstractmethod
@@ -229,6 +682,28 @@ class RandVar(ABC):
         pass
 
 
+    def _new_sample_batch(self, size, batch):
+        '''Represents the calculation of a potentially recursive batch of
+        samples. By default, the batches of the parents are generated first,
+        and _new_sample() is called once per sample, with the samples of the
+        parents set to the matching entries of their batches. Subclasses
+        replace this with a vectorized calculation'''
+
+        parents = self.parents
+        batches = [parent.sample_batch(size, batch) for parent in parents]
+        saved = [parent.saved_sample for parent in parents]
+        samples = []
+        try:
+            for i in range(size):
+                for parent, samples_i in zip(parents, batches):
+                    parent.saved_sample = samples_i[i]
+                samples.append(self._new_sample())
+        finally:
+            for parent, sample in zip(parents, saved):
+                parent.saved_sample = sample
+        return np.asarray(samples)
+
+
     @abstractmethod
     def _new_mean(self, fixed_means):
         '''Implemented by subclasses, represents the calculation of the
@@ -271,3 +746,38 @@ class RandVar(ABC):
     def __sub__(self, obj):
         return self + (obj * -1)
 
+
+def _register_root(rv):
+    '''Gives a root the smallest id that is not in use'''
+
+    if len(_free_root_ids) > 0:
+        root_id = heapq.heappop(_free_root_ids)
+    else:
+        root_id = len(_root_registry)
+        _root_registry.append(None)
+    _root_registry[root_id] = weakref.ref(rv, lambda _ : _release_root(root_id))
+    return root_id
+
+
+def _release_root(root_id):
+    # Only roots that are no longer referenced are released, and every
+    # random variable holds on to its roots, so no live mask includes the id
+    _root_registry[root_id] = None
+    heapq.heappush(_free_root_ids, root_id)
+
+
+def _mask_roots(mask):
+    '''Returns the roots in a bitset, ordered by id'''
+
+    roots = []
+    while mask:
+        lowest = mask & -mask
+        roots.append(_root_registry[lowest.bit_length() - 1]())
+        mask ^= lowest
+    return roots
+
+
+def _shared_roots(rv1, rv2):
+    '''Returns the roots shared by two random variables, ordered by id'''
+
+    return _mask_roots(rv1.root_mask() & rv2.root_mask())
@@ -1,3 +1,5 @@
+from .estimate import iterate_estimates
+
 import numpy as np
 
 
@@ -47,7 +49,27 @@ class RandVec:
             x.resample()
 
 
-    def sample_mean(self, trials=10000):
+    def sample_batch(self, size, batch=None):
+        '''
+        Generates {size} independent samples of this random vector at once.
+        The random variables of the vector are sampled jointly, so that any
+        dependencies between them are preserved.
+
+        Args:
+            size: The number of samples to generate
+            batch: A dictionary mapping random variables to batches that
+            have already been generated, as in RandVar.sample_batch
+
+        Returns:
+            The samples as a {size}-by-k numpy array
+        '''
+
+        if batch is None:
+            batch = {}
+        return np.column_stack([x.sample_batch(size, batch) for x in self.randvars])
+
+
+    def sample_mean(self, trials=10000, method='plain'):
         '''
         For each random variable, a point estimate of the variable's
         mean is calculated. This produces a vector of sample means,
@@ -57,12 +79,66 @@ class RandVec:
         Args:
             trials: The number of samples to use in calculating
             each average
+            method: The sampling method, as in RandVar.estimate_mean
 
         Returns:
             An approximation of the mean as a k-length numpy array
         '''
 
-        return np.asarray([x.sample_mean(trials) for x in self.randvars])
+        return np.asarray([x.sample_mean(trials, method) for x in self.randvars])
+
+
+    def iter_sample_mean(self, trials=10000, chunk_size=10000, timeout=None, tolerance=None, executor=None):
+        '''
+        Estimates the mean vector by sampling in chunks without blocking an
+        asyncio event loop. The random variables are sampled jointly. This
+        is an async generator that yields the running estimate, whose mean
+        and standard error are k-length numpy arrays, after every chunk:
+
+            async for estimate in X.iter_sample_mean(trials=10 ** 7, timeout=0.5):
+                print(estimate.confidence_interval())
+
+        Chunks are sampled in an executor. Sampling stops after {trials}
+        samples, once the standard error falls below {tolerance}, once
+        {timeout} seconds have passed, or when the caller stops iterating
+        or is cancelled.
+
+        Args:
+            trials: The total number of samples, or None for no limit
+            chunk_size: The number of samples in every chunk
+            timeout: The number of seconds to sample for, or None
+            tolerance: The standard error to stop at, or None
+            executor: The executor to sample in, or None for the default
+
+        Returns:
+            An async iterator of Estimates of the mean vector
+        '''
+
+        return iterate_estimates(lambda size : self.sample_batch(size), trials, chunk_size,
+                                 timeout, tolerance, executor)
+
+
+    async def sample_mean_async(self, trials=10000, chunk_size=10000, timeout=None, tolerance=None, executor=None):
+        '''
+        Estimates the mean vector like iter_sample_mean(), but only returns the last
+        running estimate. With a {timeout}, this returns the best estimate
+        available at the deadline.
+
+        Args:
+            trials: The total number of samples, or None for no limit
+            chunk_size: The number of samples in every chunk
+            timeout: The number of seconds to sample for, or None
+            tolerance: The standard error to stop at, or None
+            executor: The executor to sample in, or None for the default
+
+        Returns:
+            The last Estimate of the mean vector, or None if no chunk finished
+        '''
+
+        estimate = None
+        async for estimate in self.iter_sample_mean(trials, chunk_size, timeout, tolerance, executor):
+            pass
+        return estimate
 
 
     def mean(self, fixed_means={}):
@@ -0,0 +1,75 @@
+import pytest
+import numpy as np
+
+from alea.discrete import UnaryDiscreteRandVar
+
+from conftest import make_roots, make_skewed_root, make_sum, make_deep
+
+
+ROOTS = [2, 4, 8]
+SUPPORTS = [2, 6, 12]
+DEPTHS = [4, 16, 64]
+
+
+@pytest.mark.parametrize('depth', DEPTHS)
+def test_resample(benchmark, depth):
+    X = make_deep(make_roots(4, 6), depth)
+    benchmark(X.resample)
+
+
+@pytest.mark.parametrize('support', SUPPORTS)
+@pytest.mark.parametrize('roots', ROOTS)
+def test_sample_mean(benchmark, roots, support):
+    X = make_sum(make_roots(roots, support))
+    benchmark.pedantic(X.sample_mean, args=(1000,), rounds=3)
+
+
+@pytest.mark.parametrize('depth', DEPTHS)
+def test_mean_deep(benchmark, depth):
+    def setup():
+        return (make_deep(make_roots(4, 6), depth),), {}
+    benchmark.pedantic(lambda X : X.mean(), setup=setup, rounds=5)
+
+
+@pytest.mark.parametrize('support', SUPPORTS)
+@pytest.mark.parametrize('roots', [1, 2, 3])
+def test_mean_dependent_product(benchmark, roots, support):
+    def setup():
+        rvs = make_roots(roots, support)
+        S = make_sum(rvs)
+        return (S * (S + make_skewed_root(support)),), {}
+    benchmark.pedantic(lambda X : X.mean(), setup=setup, rounds=5)
+
+
+@pytest.mark.parametrize('support', SUPPORTS)
+@pytest.mark.parametrize('roots', [1, 2, 3])
+def test_variance(benchmark, roots, support):
+    def setup():
+        return (make_sum(make_roots(roots, support)) * make_skewed_root(support),), {}
+    benchmark.pedantic(lambda X : X.variance(), setup=setup, rounds=5)
+
+
+@pytest.mark.parametrize('support', SUPPORTS)
+@pytest.mark.parametrize('roots', [1, 2, 3])
+def test_unary_mean(benchmark, roots, support):
+    def setup():
+        S = make_sum(make_roots(roots, support))
+        strike = S.mean()
+        return (UnaryDiscreteRandVar(S, lambda x : max(x - strike, 0)),), {}
+    benchmark.pedantic(lambda X : X.mean(), setup=setup, rounds=5)
+
+
+@pytest.mark.parametrize('support', SUPPORTS)
+@pytest.mark.parametrize('roots', [1, 2, 3])
+def test_unary_mean_vectorized(benchmark, roots, support):
+    def setup():
+        S = make_sum(make_roots(roots, support))
+        strike = S.mean()
+        return (UnaryDiscreteRandVar(S, lambda x : np.maximum(x - strike, 0), vectorized=True),), {}
+    benchmark.pedantic(lambda X : X.mean(), setup=setup, rounds=5)
+
+
+@pytest.mark.parametrize('depth', DEPTHS)
+def test_sample_batch(benchmark, depth):
+    X = make_deep(make_roots(4, 6), depth)
+    benchmark(X.sample_batch, 10000)
@@ -0,0 +1,35 @@
+import pytest
+import itertools
+
+from alea import RandVec
+from alea.discrete import DiscreteRandVec
+
+from conftest import make_roots, make_sum
+
+
+@pytest.mark.parametrize('support', [2, 6])
+@pytest.mark.parametrize('length', [2, 4, 8])
+def test_variance(benchmark, length, support):
+    def setup():
+        roots = make_roots(length + 1, support)
+        # Neighbouring components share a root, so the matrix is banded
+        rvs = [roots[i] + roots[i + 1] * 2 for i in range(length)]
+        return (RandVec(rvs),), {}
+    benchmark.pedantic(lambda X : X.variance(), setup=setup, rounds=5)
+
+
+@pytest.mark.parametrize('size', [10, 100, 1000])
+@pytest.mark.parametrize('length', [2, 8])
+def test_discrete_randvec_construction(benchmark, length, size):
+    support = set(itertools.islice(itertools.product(range(size), repeat=length), size))
+    pmf = lambda _ : 1.0 / size
+    benchmark(DiscreteRandVec, support, pmf)
+
+
+@pytest.mark.parametrize('size', [10, 100])
+def test_discrete_randvec_variance(benchmark, size):
+    support = {(x, x * x, -x) for x in range(size)}
+    pmf = lambda _ : 1.0 / size
+    def setup():
+        return (DiscreteRandVec(support, pmf),), {}
+    benchmark.pedantic(lambda X : X.variance(), setup=setup, rounds=3)
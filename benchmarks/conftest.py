@@ -0,0 +1,49 @@
+import pytest
+
+from alea.discrete import RootDiscreteRandVar, UniformDiscreteRandVar
+
+
+def pytest_collect_file(file_path, parent):
+    # Benchmarks are named bench_*.py so that they are skipped by the
+    # regular test run. They are only collected when this directory is
+    # passed on the command line; files passed explicitly are collected
+    # by pytest itself
+    if not parent.session.isinitpath(file_path.parent):
+        return None
+    if file_path.suffix == '.py' and file_path.name.startswith('bench_'):
+        return pytest.Module.from_parent(parent, path=file_path)
+
+
+def make_roots(count, support):
+    '''Builds {count} independent roots, each uniform over {support} values'''
+
+    return [UniformDiscreteRandVar(set(range(i, i + support))) for i in range(count)]
+
+
+def make_skewed_root(support):
+    '''Builds a root with a non-uniform mass function over {support} values'''
+
+    total = support * (support + 1) / 2
+    return RootDiscreteRandVar(set(range(1, support + 1)), lambda x : x / total)
+
+
+def make_sum(roots):
+    '''Sums the given roots into a linear chain of additions'''
+
+    total = roots[0]
+    for rv in roots[1:]:
+        total = total + rv
+    return total
+
+
+def make_deep(roots, depth):
+    '''
+    Builds a graph {depth} layers deep, where every layer mixes the
+    previous layer with one of the roots. Roots are reused once the
+    depth exceeds the number of roots, which makes the layers dependent.
+    '''
+
+    node = roots[0]
+    for i in range(depth):
+        node = node * 0.5 + roots[(i + 1) % len(roots)] * 2 - 1
+    return node
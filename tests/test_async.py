@@ -0,0 +1,65 @@
+import pytest
+import asyncio
+import numpy as np
+
+from alea.discrete import BinomialRandVar, DiscreteRandVec
+from alea.estimate import iterate_estimates
+
+
+def almost_equal(x, y, epsilon=1e-5):
+    return abs(x - y) <= epsilon
+
+
+class TestAsyncSampling:
+
+    def test_iter_sample_mean(self):
+        X = BinomialRandVar(10, 0.3)
+        async def collect():
+            return [estimate async for estimate in X.iter_sample_mean(10000, chunk_size=3000)]
+        estimates = asyncio.run(collect())
+        assert([estimate.trials for estimate in estimates] == [3000, 6000, 9000, 10000])
+        low, high = estimates[-1].confidence_interval(0.999)
+        assert(low <= 3 <= high)
+
+
+    def test_tolerance(self):
+        X = BinomialRandVar(10, 0.3)
+        estimate = asyncio.run(X.sample_mean_async(None, chunk_size=1000, tolerance=0.02))
+        assert(estimate.standard_error <= 0.02)
+        assert(estimate.trials < 100000)
+
+
+    def test_timeout(self):
+        X = BinomialRandVar(10, 0.3)
+        estimate = asyncio.run(X.sample_mean_async(None, chunk_size=1000, timeout=0.1))
+        assert(estimate is None or almost_equal(estimate.mean, 3, 0.5))
+
+
+    def test_cancellation(self):
+        X = BinomialRandVar(10, 0.3)
+        async def run():
+            task = asyncio.ensure_future(X.sample_mean_async(None, chunk_size=1000))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        asyncio.run(run())
+
+
+    def test_vector(self):
+        X = DiscreteRandVec({(1, 2), (3, 4)}, lambda _ : 0.5)
+        estimate = asyncio.run(X.sample_mean_async(5000, chunk_size=1000))
+        assert(estimate.trials == 5000)
+        assert(estimate.mean.shape == (2,))
+        np.testing.assert_allclose(estimate.mean[1] - estimate.mean[0], 1)
+
+
+    def test_large_mean(self):
+        # The variance must not cancel out when the mean dwarfs the spread
+        chunks = [1e9 + np.random.random(1000) for _ in range(5)]
+        async def collect():
+            return [estimate async for estimate in iterate_estimates(lambda size : chunks.pop(), 5000, 1000)]
+        samples = np.concatenate(chunks)
+        estimate = asyncio.run(collect())[-1]
+        assert(almost_equal(estimate.mean, samples.mean(), 1e-6))
+        assert(almost_equal(estimate.standard_error, samples.std(ddof=1) / np.sqrt(5000), 1e-9))
@@ -0,0 +1,148 @@
+import pytest
+
+from alea.discrete import RootDiscreteRandVar, BernoulliRandVar, BinomialRandVar, UnaryDiscreteRandVar, \
+    PersistentCache, persistent_cache, sweep
+from alea.discrete import cache
+from alea import profile
+
+import numpy as np
+import threading
+
+
+def almost_equal(x, y, epsilon=1e-5):
+    return abs(x - y) <= epsilon
+
+
+def build():
+    X = BinomialRandVar(6, 0.3)
+    Y = RootDiscreteRandVar({-1, 2}, lambda x : 0.25 if x == -1 else 0.75)
+    return UnaryDiscreteRandVar(X * Y, lambda x : x * x) + X
+
+
+class TestStructuralHash:
+
+    def test_equal_structures(self):
+        assert(build().structural_hash() == build().structural_hash())
+        assert(BinomialRandVar(6, 0.3).structural_hash() != BinomialRandVar(6, 0.4).structural_hash())
+
+
+    def test_shared_roots(self):
+        X = BernoulliRandVar(0.5)
+        Y = BernoulliRandVar(0.5)
+        # X * X and X * Y have different distributions, even though X and Y
+        # are structurally equal
+        assert((X * X).structural_hash() != (X * Y).structural_hash())
+        assert((X * Y).structural_hash() == (Y * X).structural_hash())
+
+
+    def test_invalidate(self):
+        X = BinomialRandVar(6, 0.3)
+        A = X * X
+        before = A.structural_hash()
+        X.success_rate = 0.4
+        assert(A.structural_hash() != before)
+
+
+    def test_shared_descendants(self):
+        X = BernoulliRandVar(0.5)
+        Y = BernoulliRandVar(0.5)
+        # The operands share a root in one and not in the other
+        A = UnaryDiscreteRandVar(X + Y, lambda x : x * x) * (X + 1)
+        B = UnaryDiscreteRandVar(X + Y, lambda x : x * x) * (Y + 1)
+        assert(A.structural_hash() != B.structural_hash())
+        # Renaming the roots does not change the structure
+        C = UnaryDiscreteRandVar(Y + X, lambda x : x * x) * (Y + 1)
+        assert(A.structural_hash() == C.structural_hash())
+
+
+    def test_long_chain(self):
+        # Hashes are built from the cached hashes of the parents, without recursion
+        S = RootDiscreteRandVar({0, 1}, lambda x : 0.5)
+        for _ in range(5000):
+            S = S + RootDiscreteRandVar({0, 1}, lambda x : 0.5)
+        assert(len(S.structural_hash()) == 64)
+
+
+class TestPersistentCache:
+
+    def test_across_instances(self, tmp_path):
+        path = str(tmp_path / 'cache.db')
+        A = build()
+        with persistent_cache(path) as cache:
+            mean, variance, pmf = A.mean(), A.variance(), A.pmf()
+            assert(len(cache) > 0)
+
+        B = build()
+        with persistent_cache(path):
+            with profile() as report:
+                assert(almost_equal(B.mean(), mean))
+                assert(almost_equal(B.variance(), variance))
+                assert(B.pmf() == pmf)
+        # Every result of the graph was read from the cache
+        assert(report.calls[('UnaryDiscreteRandVar', '_new_mean')] == 0)
+
+
+    def test_shared_submodel(self, tmp_path):
+        path = str(tmp_path / 'cache.db')
+        with persistent_cache(path):
+            mean = build().mean()
+
+        # The mean of the sub-model is loaded along with the rest of the graph
+        A = build() * 2 + BernoulliRandVar(0.5)
+        with persistent_cache(path) as cache:
+            with profile() as report:
+                assert(almost_equal(A.mean(), 2 * mean + 0.5))
+            assert(report.calls[('UnaryDiscreteRandVar', '_new_mean')] == 0)
+            # Access times of results that are only read are written on exit
+            build().mean()
+            assert(len(cache.accessed) > 0)
+        assert(len(cache.accessed) == 0)
+
+
+    def test_skipped(self, tmp_path):
+        X = BinomialRandVar(6, 0.3)
+        Y = BernoulliRandVar(0.5)
+        with persistent_cache(str(tmp_path / 'cache.db')) as cache:
+            # Roots are not cached
+            X.mean()
+            assert(len(cache) == 0)
+            (X * Y).mean({Y: 1})
+            assert(len(cache) == 0)
+            result = sweep(X * Y, {X: {'success_rate': np.linspace(0.1, 0.9, 5)}})
+            assert(almost_equal(result.mean[2], 1.5))
+            assert(len(cache) == 0)
+
+
+    def test_scoped(self, tmp_path):
+        with persistent_cache(str(tmp_path / 'outer.db')) as outer:
+            # Other threads do not see the cache
+            seen = []
+            thread = threading.Thread(target=lambda: seen.append(cache.active()))
+            thread.start()
+            thread.join()
+            assert(seen == [None])
+
+            with persistent_cache(str(tmp_path / 'inner.db')) as inner:
+                assert(cache.active() is inner)
+                build().mean()
+                assert(len(inner) > 0)
+            assert(cache.active() is outer)
+            assert(len(outer) == 0)
+        assert(cache.active() is None)
+
+
+    def test_eviction(self, tmp_path):
+        cache = PersistentCache(str(tmp_path / 'cache.db'), max_bytes=1000)
+        for i in range(10):
+            cache.put(str(i), 'pmf', {x: 0.1 for x in range(10)})
+        assert(cache.size() <= 1000)
+        assert(cache.get('0', 'pmf') is None)
+        assert(cache.get('9', 'pmf') == {x: 0.1 for x in range(10)})
+        cache.clear()
+        assert(len(cache) == 0)
+        cache.close()
+
+
+    def test_invalid_size(self, tmp_path):
+        with pytest.raises(ValueError):
+            PersistentCache(str(tmp_path / 'cache.db'), max_bytes=0)
@@ -0,0 +1,68 @@
+import pytest
+
+import alea
+from alea.discrete import RootDiscreteRandVar, BernoulliRandVar, BinomialRandVar, UniformDiscreteRandVar, \
+    UnaryDiscreteRandVar, MarkovChainRandVar, planner
+
+
+def almost_equal(x, y, epsilon=1e-5):
+    return abs(x - y) <= epsilon
+
+
+def build():
+    X = BinomialRandVar(4, 0.3)
+    Y = UniformDiscreteRandVar({-1, 1, 2})
+    Z = RootDiscreteRandVar({0, 3}, lambda x : 0.25 if x == 0 else 0.75)
+    A = X * Y + Z
+    B = UnaryDiscreteRandVar(A, lambda x : x * x) - X
+    C = (A * X).maximum(Z)
+    D = A // 2 + Y
+    return X, Y, Z, A, B, C, D
+
+
+class TestEvaluate:
+
+    def test_answers(self):
+        X, Y, Z, A, B, C, D = build()
+        E = BernoulliRandVar(0.4) * 3
+        queries = [A.mean, B.variance, (A, C), (B, D), C.mean, D.variance, E.mean, (X, E)]
+        answers = alea.evaluate(queries)
+
+        X, Y, Z, A, B, C, D = build()
+        E = BernoulliRandVar(0.4) * 3
+        expected = [A.mean(), B.variance(), A.covariance(C), B.covariance(D), C.mean(), D.variance(), E.mean(),
+                    X.covariance(E)]
+        assert(all(almost_equal(answer, value) for answer, value in zip(answers, expected)))
+
+
+    def test_single_pass(self):
+        X, Y, Z, A, B, C, D = build()
+        with alea.profile() as report:
+            alea.evaluate([A.mean, B.variance, (A, C), (B, D)])
+        # Only the mass functions of the roots were calculated, and no random
+        # variable enumerated its roots on its own
+        assert(set(method for _, method in report.calls) == {'_new_pmf'})
+        assert(len(report.calls) == 3)
+        # Answers are cached as if they had been queried one by one
+        assert(B.saved_variance is not None)
+        assert(A.saved_covariances.get(C) is not None)
+
+
+    def test_fallback(self, monkeypatch):
+        X, Y, Z, A, B, C, D = build()
+        monkeypatch.setattr(planner, 'MAX_CELLS', 10)
+        answers = alea.evaluate([A.mean, (B, D)])
+        assert(almost_equal(answers[0], build()[3].mean()))
+
+        # Markov chains cannot be evaluated on a grid
+        for steps in [10, 100]:
+            M = MarkovChainRandVar([0, 1], [0.5, 0.5], [[0.9, 0.1], [0.2, 0.8]], steps)
+            answers = alea.evaluate([M.sum().mean, (M.state(2), M.state(5))])
+            assert(almost_equal(answers[0], M.sum().mean()))
+            assert(almost_equal(answers[1], M.state(2).covariance(M.state(5))))
+
+
+    def test_invalid(self):
+        X = BernoulliRandVar(0.4)
+        with pytest.raises(ValueError):
+            alea.evaluate([X.pmf])
@@ -1,6 +1,15 @@
 import pytest
+import alea
+import gc
+import numpy as np
+import itertools
+import math
 
-from alea.discrete import RootDiscreteRandVar, BinomialRandVar, BernoulliRandVar, UniformDiscreteRandVar, UnaryDiscreteRandVar
+from alea.discrete import RootDiscreteRandVar, BinomialRandVar, BernoulliRandVar, UniformDiscreteRandVar, UnaryDiscreteRandVar, \
+    BinaryDiscreteRandVar, AffineDiscreteRandVar, BinomialSumDiscreteRandVar, PoissonRandVar, GeometricRandVar, NegativeBinomialRandVar, sweep
+from alea.discrete import MarkovChainRandVar, DiscreteRandVar
+from alea.discrete.randvar import _root_combinations
+from alea.estimate import normal_cdf, normal_quantile
 
 
 def almost_equal(x, y, epsilon=1e-5):
@@ -302,3 +311,980 @@ class TestUnaryTrivial:
         g = lambda x : 1
         gX = UnaryDiscreteRandVar(X, g)
         assert(almost_equal(gX.variance(), 0))
+
+
+class TestMassFunction:
+
+    def test_root(self):
+        X = UniformDiscreteRandVar({1, 2, 3, 4})
+        pmf = X.pmf()
+        assert(set(pmf) == {1, 2, 3, 4})
+        assert(almost_equal(pmf[3], 0.25))
+
+
+    def test_sum(self):
+        X = BinomialRandVar(2, 0.3)
+        Y = BinomialRandVar(3, 0.3)
+        Z = (X + Y).pmf()
+        A = BinomialRandVar(5, 0.3).pmf()
+        for x in A:
+            assert(almost_equal(Z[x], A[x]))
+
+
+    def test_dependent_product(self):
+        X = UniformDiscreteRandVar({-1, 1})
+        Y = UniformDiscreteRandVar({2, 3})
+        pmf = (X * (X + Y)).pmf()
+        assert(set(pmf) == {-2, -1, 3, 4})
+        for x in pmf:
+            assert(almost_equal(pmf[x], 0.25))
+
+
+class TestConditional:
+
+    def test_comparison(self):
+        X = UniformDiscreteRandVar({1, 2, 3, 4, 5, 6})
+        Y = UniformDiscreteRandVar({1, 2, 3, 4, 5, 6})
+        assert(almost_equal((X > 3).mean(), 0.5))
+        assert(almost_equal((X < Y).mean(), 15 / 36))
+        assert(almost_equal(((X > 3) & (Y > 3)).mean(), 0.25))
+        assert(almost_equal(((X > 3) | (Y > 3)).mean(), 0.75))
+        assert(almost_equal((~(X > 3)).mean(), 0.5))
+
+
+    def test_given(self):
+        X = UniformDiscreteRandVar({1, 2, 3, 4, 5, 6})
+        Y = UniformDiscreteRandVar({1, 2, 3, 4, 5, 6})
+        Z = (X + Y).given(X > 3)
+        assert(almost_equal(Z.mean(), 8.5))
+        assert(almost_equal(Z.variance(), 2 / 3 + 35 / 12))
+        W = X.given(X >= 5)
+        assert(W.pmf() == {5: 0.5, 6: 0.5})
+        assert(W.sample() in {5, 6})
+
+
+    def test_independent_event(self):
+        X = BinomialRandVar(4, 0.3)
+        Y = BinomialRandVar(4, 0.3)
+        Z = X.given(Y > 1)
+        assert(almost_equal(Z.mean(), X.mean()))
+        assert(almost_equal(Z.variance(), X.variance()))
+
+
+    def test_rare_event(self):
+        X = BinomialRandVar(10, 0.2)
+        Z = X.given(X >= 8)
+        tail = {x: X.mass_function(x) for x in range(8, 11)}
+        assert(almost_equal(Z.event_probability, sum(tail.values()), 1e-12))
+        assert(Z.event_probability < 1e-3)
+        mean = sum(x * p for x, p in tail.items()) / sum(tail.values())
+        assert(almost_equal(Z.mean(), mean))
+        assert(Z.sample_mean(100) >= 8)
+
+
+    def test_shared_event(self):
+        X = BinomialRandVar(4, 0.5)
+        Y = BinomialRandVar(4, 0.5)
+        event = X + Y > 5
+        A = X.given(event)
+        B = Y.given(event)
+        # Conditionals on the same event are dependent through it
+        outcomes = [(x, y, X.mass_function(x) * Y.mass_function(y)) for x in range(5) for y in range(5) if x + y > 5]
+        probability = sum(p for _, _, p in outcomes)
+        mean = sum(x * p for x, _, p in outcomes) / probability
+        covariance = sum(x * y * p for x, y, p in outcomes) / probability - mean * mean
+        assert(covariance < 0)
+        assert(almost_equal(A.covariance(B), covariance))
+        assert(almost_equal((A + B).variance(), 2 * A.variance() + 2 * covariance))
+        # Their batches are sampled jointly in the conditioned space
+        batch = {}
+        a = A.sample_batch(100000, batch)
+        b = B.sample_batch(100000, batch)
+        assert((a + b > 5).all())
+        assert(almost_equal(np.cov(a, b)[0][1], covariance, 0.02))
+
+
+    def test_changed_root(self):
+        X = BinomialRandVar(4, 0.5)
+        Y = BinomialRandVar(4, 0.5)
+        event = X + Y > 5
+        A = X.given(event)
+        assert(almost_equal(A.mean(), 3.135135))
+        X.success_rate = 0.1
+        assert(almost_equal(A.mean(), X.given(event).mean()))
+        assert(A.mean() < 2.5)
+
+
+    def test_not_an_event(self):
+        X = BinomialRandVar(4, 0.3)
+        Y = BinomialRandVar(4, 0.3)
+        with pytest.raises(ValueError):
+            X.given(Y)
+
+
+    def test_impossible_event(self):
+        X = UniformDiscreteRandVar({1, 2, 3})
+        with pytest.raises(ValueError):
+            X.given(X > 3)
+
+
+class TestVectorizedUnary:
+
+    def test_ufunc(self):
+        X = UniformDiscreteRandVar({-2, -1, 0, 1, 2})
+        gX = UnaryDiscreteRandVar(X, np.abs)
+        assert(gX.vectorized)
+        assert(almost_equal(gX.mean(), 1.2))
+        assert(gX.pmf() == {0: 0.2, 1: 0.4, 2: 0.4})
+
+
+    def test_payoff(self):
+        X = BinomialRandVar(50, 0.5)
+        Y = BinomialRandVar(50, 0.5)
+        S = X + Y
+        payoff = lambda s : np.maximum(s - 55, 0)
+        gS = UnaryDiscreteRandVar(S, payoff, vectorized=True)
+        gS2 = UnaryDiscreteRandVar(S, lambda s : max(s - 55, 0))
+        assert(almost_equal(gS.mean(), gS2.mean()))
+        assert(almost_equal(gS.variance(), gS2.variance()))
+        assert(len(gS.pmf()) == 46)
+
+
+    def test_dependent(self):
+        X = UniformDiscreteRandVar({1, 2, 3})
+        gX = UnaryDiscreteRandVar(X, np.square)
+        assert(almost_equal((gX * X).mean(), 12))
+        assert(almost_equal(gX.covariance(X), 12 - 14 / 3 * 2))
+
+
+class TestSampleBatch:
+
+    def test_consistent(self):
+        X = UniformDiscreteRandVar({1, 2, 3})
+        Y = BernoulliRandVar(0.5)
+        Z = X * Y + X
+        batch = {}
+        z = Z.sample_batch(1000, batch)
+        assert(len(z) == 1000)
+        np.testing.assert_array_equal(z, batch[X] * batch[Y] + batch[X])
+
+
+    def test_default(self):
+        # Subclasses that only implement _new_sample are sampled one at a time
+        class Decrement(DiscreteRandVar):
+            def __init__(self, rv):
+                DiscreteRandVar.__init__(self)
+                self.rv = rv
+                self._add_parents(rv)
+
+            def _new_sample(self):
+                return self.rv.sample() - 1
+
+            def _new_mean(self, fixed_means):
+                return self.rv.mean(fixed_means) - 1
+
+        X = UniformDiscreteRandVar({1, 2, 3})
+        Y = Decrement(X)
+        batch = {}
+        np.testing.assert_array_equal(Y.sample_batch(100, batch), batch[X] - 1)
+        assert(X.saved_sample is None)
+
+
+    def test_mean(self):
+        X = BinomialRandVar(10, 0.3)
+        Y = UniformDiscreteRandVar({-1, 1})
+        gX = UnaryDiscreteRandVar(X * Y, lambda x : max(x, 0))
+        assert(almost_equal(gX.sample_batch(100000).mean(), gX.mean(), 0.1))
+        assert(almost_equal(BernoulliRandVar(0.25).sample_batch(100000).mean(), 0.25, 0.02))
+
+
+class TestVarianceReduction:
+
+    def setup_method(self):
+        X = UniformDiscreteRandVar(set(range(10)))
+        Y = BinomialRandVar(10, 0.3)
+        self.Z = UnaryDiscreteRandVar(X + Y * 2, lambda x : max(x - 8, 0))
+
+
+    def test_plain(self):
+        estimate = self.Z.estimate_mean(10000)
+        assert(estimate.trials == 10000)
+        low, high = estimate.confidence_interval(0.999)
+        assert(low <= self.Z.mean() <= high)
+
+
+    def test_normal_quantile(self):
+        for p, z in [(0.5, 0), (0.975, 1.959963984540054), (0.0005, -3.2905267314918945), (1e-20, -9.262340089798408)]:
+            assert(almost_equal(normal_quantile(p), z, 1e-12))
+            assert(almost_equal(normal_cdf(z), p, 1e-12))
+        with pytest.raises(ValueError):
+            normal_quantile(1)
+
+
+    @pytest.mark.parametrize('method', ['control', 'antithetic', 'stratified'])
+    def test_methods(self, method):
+        estimate = self.Z.estimate_mean(10000, method)
+        assert(almost_equal(estimate.mean, self.Z.mean(), 6 * estimate.standard_error))
+        assert(estimate.variance_reduction > 1)
+        assert(almost_equal(self.Z.sample_mean(10000, method), self.Z.mean(), 0.2))
+
+
+    def test_linear_control(self):
+        X = UniformDiscreteRandVar(set(range(10)))
+        Y = BinomialRandVar(10, 0.3)
+        estimate = (X + Y * 2).estimate_mean(1000, 'control')
+        assert(almost_equal(estimate.mean, 10.5))
+
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            self.Z.estimate_mean(100, 'magic')
+
+
+class TestImportanceSampling:
+
+    def setup_method(self):
+        total = BinomialRandVar(10, 0.1)
+        for _ in range(9):
+            total = total + BinomialRandVar(10, 0.1)
+        self.X = total * 2 - 3
+        self.threshold = 60
+        pmf = self.X.pmf()
+        self.probability = sum(p for x, p in pmf.items() if x > self.threshold)
+        self.expectation = sum(p * x for x, p in pmf.items() if x > self.threshold) / self.probability
+
+
+    def test_tail_probability(self):
+        estimate = self.X.estimate_tail_probability(self.threshold, 20000)
+        assert(self.probability < 1e-6)
+        assert(almost_equal(estimate.mean, self.probability, 6 * estimate.standard_error))
+        assert(estimate.variance_reduction > 100)
+
+
+    def test_tail_expectation(self):
+        estimate = self.X.estimate_tail_expectation(self.threshold, 20000)
+        assert(almost_equal(estimate.mean, self.expectation, 6 * estimate.standard_error))
+
+
+    def test_tilt(self):
+        estimate = self.X.estimate_tail_probability(self.threshold, 20000, tilt=0)
+        assert(estimate.mean == 0)
+        roots = self.X.roots()
+        estimate = self.X.estimate_tail_probability(self.threshold, 20000, {rrv: 1.4 for rrv in roots})
+        assert(almost_equal(estimate.mean, self.probability, 6 * estimate.standard_error))
+
+
+class TestInvalidation:
+
+    def test_bernoulli(self):
+        X = BernoulliRandVar(0.4)
+        Y = BernoulliRandVar(0.5)
+        Z = X * 10 + Y
+        W = Y * 2
+        assert(almost_equal(Z.mean(), 4.5))
+        assert(almost_equal(W.variance(), 1))
+        X.success_rate = 0.6
+        assert(almost_equal(Z.mean(), 6.5))
+        assert(almost_equal(Z.variance(), 24 + 0.25))
+        # Random variables that do not depend on X keep their caches
+        assert(W.saved_variance is not None)
+        assert(Y.saved_mean is not None)
+
+
+    def test_covariance(self):
+        X = BinomialRandVar(4, 0.5)
+        Y = UniformDiscreteRandVar({1, 2, 3})
+        Z = X + Y
+        assert(almost_equal(Y.covariance(Z), 2 / 3))
+        assert(almost_equal(X.covariance(Z), 1))
+        Y.update(sample_space={1, 2, 3, 4, 5})
+        # Z depends on Y, so its cached covariance with X is dropped too
+        assert(Z not in X.saved_covariances)
+        assert(almost_equal(Y.covariance(Z), 2))
+        assert(almost_equal(X.covariance(Z), 1))
+
+
+    def test_binomial(self):
+        X = BinomialRandVar(4, 0.5)
+        Z = X ** 2
+        assert(almost_equal(Z.mean(), 5))
+        X.trials = 8
+        X.success_rate = 0.25
+        assert(almost_equal(Z.mean(), 1.5 + 4))
+        assert(max(Z.pmf()) == 64)
+
+
+    def test_root(self):
+        X = RootDiscreteRandVar({0, 1}, lambda x : 0.5)
+        Y = X + 1
+        assert(almost_equal(Y.mean(), 1.5))
+        X.update(mass_function=lambda x : 0.9 if x == 1 else 0.1)
+        assert(almost_equal(Y.mean(), 1.9))
+        assert(Y.sample_batch(1000).mean() > 1.8)
+
+
+class TestDistributionFunctions:
+
+    def test_cdf(self):
+        X = UniformDiscreteRandVar({1, 2, 3, 4})
+        assert(almost_equal(X.cdf(2), 0.5))
+        assert(almost_equal(X.cdf(0), 0))
+        assert(almost_equal(X.tail_probability(3.5), 0.25))
+
+
+    def test_quantile(self):
+        X = BinomialRandVar(10, 0.5)
+        assert(X.quantile(0.5) == 5)
+        assert(X.quantile(0) == 0)
+        assert(X.quantile(1) == 10)
+
+
+class TestRewrite:
+
+    def test_affine(self):
+        X = BinomialRandVar(4, 0.4)
+        Y = X * 1150 - 150
+        assert(type(Y) is AffineDiscreteRandVar)
+        assert(Y.rv is X)
+        assert(almost_equal(Y.mean(), 1690))
+        assert(almost_equal(Y.variance(), 1150 ** 2 * 0.96))
+        assert(almost_equal(((Y + 10) * 2).mean(), 3400))
+        assert(almost_equal(Y.pmf()[-150], 0.6 ** 4))
+
+
+    def test_binomial_sum(self):
+        Xs = [BernoulliRandVar(0.3) for _ in range(50)] + [BinomialRandVar(5, 0.3)]
+        total = Xs[0]
+        for X in Xs[1:]:
+            total = total + X
+        assert(type(total) is BinomialSumDiscreteRandVar)
+        assert(len(total.terms) == 51)
+        expected = BinomialRandVar(55, 0.3)
+        assert(almost_equal(total.mean(), expected.mean()))
+        assert(almost_equal(total.variance(), expected.variance()))
+        for k in [0, 10, 16, 55]:
+            assert(almost_equal(total.pmf()[k], expected.pmf()[k]))
+        # The sum is still dependent on its terms
+        assert(almost_equal(total.covariance(Xs[0]), 0.21))
+
+
+    def test_construction_scaling(self):
+        # Each addition has the two operands as parents and extends a shared
+        # list of terms, so building a sum of n terms takes O(n)
+        Xs = [BernoulliRandVar(0.3) for _ in range(20000)]
+        total = Xs[0]
+        for X in Xs[1:]:
+            previous, total = total, total + X
+        assert(total.parents == (previous, Xs[-1]))
+        assert(total._terms is previous._terms)
+        assert(len(previous.terms) == 19999)
+        assert(almost_equal(total.mean(), 6000))
+        assert(almost_equal(total.variance(), 4200))
+        # A sum that was already extended is copied rather than shared
+        other = previous + BernoulliRandVar(0.3)
+        assert(other._terms is not total._terms)
+        assert(len(total.terms) == len(other.terms) == 20000)
+        # Changing a term clears every sum that it feeds
+        Xs[0].success_rate = 0.8
+        assert(almost_equal(total.mean(), 6000.5))
+        assert(almost_equal(previous.mean(), 6000.2))
+
+
+    def test_uniform_affine(self):
+        # Affine maps of a uniform collapse into a single node over it
+        U = UniformDiscreteRandVar({1, 2, 3, 4})
+        Y = (U * 3 + 1) * 2
+        assert(type(Y) is AffineDiscreteRandVar)
+        assert(Y.rv is U)
+        assert(almost_equal(Y.mean(), 17))
+        assert(almost_equal(Y.variance(), 36 * 1.25))
+        assert(Y.pmf() == {8: 0.25, 14: 0.25, 20: 0.25, 26: 0.25})
+        batch = {}
+        assert((Y.sample_batch(100, batch) == batch[U] * 6 + 2).all())
+
+
+    def test_portfolio(self):
+        X1 = BinomialRandVar(4, 0.4)
+        X2 = BinomialRandVar(4, 0.4)
+        Z = (X1 * 1150 - 150) + (X2 * 1150 - 150)
+        assert(type(Z) is AffineDiscreteRandVar)
+        assert(type(Z.rv) is BinomialSumDiscreteRandVar)
+        assert(almost_equal(Z.mean(), 2 * 1690))
+        assert(almost_equal(Z.variance(), 2 * 1150 ** 2 * 0.96))
+        batch = {}
+        samples = Z.sample_batch(100, batch)
+        assert((samples == batch[X1] * 1150 + batch[X2] * 1150 - 300).all())
+
+
+    def test_no_rewrite(self):
+        X = BernoulliRandVar(0.3)
+        Y = BernoulliRandVar(0.4)
+        # Different success rates and dependent terms are not Binomial
+        assert(type(X + Y) is not BinomialSumDiscreteRandVar)
+        assert(type(X + X) is not BinomialSumDiscreteRandVar)
+        assert(almost_equal((X + X).variance(), 4 * 0.21))
+
+
+    def test_changed_rate(self):
+        X = BernoulliRandVar(0.5)
+        Y = BernoulliRandVar(0.5)
+        Z = X + Y
+        X.success_rate = 0.1
+        assert(almost_equal(Z.pmf()[2], 0.05))
+        assert(almost_equal(Z.mean(), 0.6))
+
+
+class TestTruncated:
+
+    def test_poisson(self):
+        X = PoissonRandVar(3)
+        assert(almost_equal(X.mean(), 3))
+        assert(almost_equal(X.variance(), 3))
+        assert(almost_equal(X.pmf()[2], 4.5 * np.exp(-3)))
+        assert(almost_equal(sum(X.pmf().values()), 1))
+        # The support only extends as far as the tolerance requires
+        assert(X.tail_probability(max(X.sample_space)) <= 1e-12)
+        assert(X.tail_probability(max(X.sample_space) - 1) > 1e-12)
+
+
+    def test_lazy(self):
+        X = PoissonRandVar(500)
+        assert(X.saved_log_pmf is None)
+        X.mean()
+        X.variance()
+        X.sample_batch(10, {})
+        assert(X.saved_log_pmf is None)
+        assert(X.cdf(10) < 1e-100)
+        assert(len(X.saved_log_pmf) < 500)
+        assert(X.quantile(0.5) == 500)
+        assert(X.log_pmf(2000) < -1000)
+
+
+    def test_far_values(self):
+        X = PoissonRandVar(3)
+        # Values outside the truncated support have no probability
+        assert(X.mass_function(-1) == 0)
+        assert(X.mass_function(10 ** 6) == 0)
+        assert(almost_equal(X.mass_function(2), 4.5 * np.exp(-3)))
+        # Far values are evaluated without extending the log probabilities to them
+        assert(X.cdf(10 ** 12) == 1)
+        assert(almost_equal(X.log_pmf(10 ** 9), 10 ** 9 * math.log(3) - 3 - math.lgamma(10 ** 9 + 1), 1e-3))
+        assert(len(X.saved_log_pmf) < 1000)
+        for Y in [GeometricRandVar(0.3), NegativeBinomialRandVar(2.5, 0.4)]:
+            direct = Y.log_pmf(5000)
+            Y._grow(5000)
+            assert(almost_equal(Y.log_pmf(5000), direct, 1e-6))
+
+
+    def test_tail_precision(self):
+        X = GeometricRandVar(0.5)
+        assert(almost_equal(X.tail_probability(60) / 0.5 ** 60, 1, 1e-9))
+        assert(almost_equal(X.cdf(2), 0.75))
+        assert(almost_equal(X.mean(), 2))
+        assert(almost_equal(X.variance(), 2))
+        assert(min(X.sample_space) == 1)
+
+
+    def test_far_tail(self):
+        # Tails beyond the calculated log probabilities are summed term by
+        # term rather than by extending the array up to x
+        X = PoissonRandVar(3)
+        assert(X.tail_probability(10 ** 8) == 0)
+        assert(X.tail_probability(10 ** 12) == 0)
+        assert(len(X.saved_log_pmf) < 1000)
+        expected = sum(math.exp(k * math.log(3) - 3 - math.lgamma(k + 1)) for k in range(151, 250))
+        assert(almost_equal(X.tail_probability(150) / expected, 1, 1e-9))
+        Y = GeometricRandVar(0.5)
+        assert(almost_equal(Y.tail_probability(1000) / 0.5 ** 1000, 1, 1e-9))
+        assert(len(Y.saved_log_pmf) < 1000)
+
+
+    def test_negative_binomial(self):
+        X = NegativeBinomialRandVar(2.5, 0.4)
+        values, probabilities = X.support()
+        assert(almost_equal(np.dot(values, probabilities), X.mean(), 1e-8))
+        assert(almost_equal(np.dot(values ** 2, probabilities) - X.mean() ** 2, X.variance(), 1e-6))
+        assert(almost_equal(X.pmf()[0], 0.4 ** 2.5))
+        samples = X.sample_batch(100000, {})
+        assert(almost_equal(samples.mean(), X.mean(), 0.1))
+
+
+    def test_parameters(self):
+        X = PoissonRandVar(2)
+        Y = X * 3 + 1
+        assert(almost_equal(Y.mean(), 7))
+        X.rate = 4
+        assert(almost_equal(Y.mean(), 13))
+        assert(almost_equal(Y.sensitivities()[X].mean_parameter('rate'), 3))
+        with pytest.raises(ValueError):
+            GeometricRandVar(1)
+        with pytest.raises(ValueError):
+            X.update(sample_space={1, 2})
+
+
+    def test_combination(self):
+        X = PoissonRandVar(2)
+        Y = GeometricRandVar(0.5)
+        Z = X.maximum(Y)
+        assert(almost_equal(sum(Z.pmf().values()), 1))
+        assert(almost_equal((X + Y).mean(), 4))
+
+
+class TestBinary:
+
+    def brute_force(self, Z, func, *rvs):
+        pmf = {}
+        for weight, fixes in _root_combinations(list(Z.roots()), {}):
+            value = func(*[rv.mean(fixes) for rv in rvs])
+            pmf[value] = pmf.get(value, 0) + weight
+        return pmf
+
+
+    def test_independent(self):
+        X = BinomialRandVar(4, 0.3) + 1
+        Y = UniformDiscreteRandVar({1, 2, 5})
+        Z = X / Y
+        expected = self.brute_force(X + Y, lambda x, y : x / y, X, Y)
+        assert(almost_equal(Z.mean(), sum(x * p for x, p in expected.items())))
+        for x, p in expected.items():
+            assert(almost_equal(Z.pmf()[x], p))
+        assert(almost_equal((X ** Y).mean(), sum(x * p for x, p in self.brute_force(X + Y, pow, X, Y).items())))
+
+
+    def test_dependent(self):
+        A = UniformDiscreteRandVar({1, 2, 3})
+        B = BernoulliRandVar(0.4)
+        X = A * 3 + B
+        Y = A + 1
+        Z = BinaryDiscreteRandVar(X, Y, lambda x, y : x % y)
+        expected = self.brute_force(X + Y, lambda x, y : x % y, X, Y)
+        for x, p in expected.items():
+            assert(almost_equal(Z.pmf()[x], p))
+        assert(almost_equal(Z.mean(), (X % Y).mean()))
+        assert(almost_equal(Z.variance(), (X % Y).variance()))
+        # The ratio of a random variable to itself is always one
+        assert(almost_equal((X / X).variance(), 0))
+
+
+    def test_constants(self):
+        X = UniformDiscreteRandVar({1, 2, 4})
+        assert(almost_equal((X / 2).mean(), 7 / 6))
+        assert(almost_equal((4 / X).mean(), 7 / 3))
+        assert(almost_equal((X // 2).mean(), 1))
+        assert(almost_equal((X % 2).mean(), 1 / 3))
+        assert(almost_equal((1 - X).mean(), -4 / 3))
+        assert(almost_equal((2 ** X).mean(), 22 / 3))
+
+
+    def test_sample_batch(self):
+        X = BinomialRandVar(4, 0.3) + 1
+        Y = UniformDiscreteRandVar({1, 2, 5})
+        Z = X / Y + BinaryDiscreteRandVar(X, Y, max)
+        batch = {}
+        samples = Z.sample_batch(1000, batch)
+        x = batch[X]
+        y = batch[Y]
+        assert(np.allclose(samples, x / y + np.maximum(x, y)))
+
+
+class TestOrder:
+
+    def brute_force(self, Z, func, *rvs):
+        # The mass function found by pairing up every value of every root
+        pmf = {}
+        for weight, fixes in _root_combinations(list(Z.roots()), {}):
+            value = func(*[rv.mean(fixes) for rv in rvs])
+            pmf[value] = pmf.get(value, 0) + weight
+        return pmf
+
+
+    def assert_pmf(self, pmf, expected):
+        for x in set(pmf) | set(expected):
+            assert(almost_equal(pmf.get(x, 0), expected.get(x, 0)))
+
+
+    def test_independent(self):
+        X = BinomialRandVar(6, 0.3)
+        Y = UniformDiscreteRandVar({-1, 2, 4, 9})
+        self.assert_pmf(X.maximum(Y).pmf(), self.brute_force(X + Y, max, X, Y))
+        self.assert_pmf(X.minimum(Y).pmf(), self.brute_force(X + Y, min, X, Y))
+        for Z, op in [(X < Y, lambda x, y : x < y), (X <= Y, lambda x, y : x <= y),
+                      (X > Y, lambda x, y : x > y), (X >= Y, lambda x, y : x >= y)]:
+            self.assert_pmf(Z.pmf(), self.brute_force(X + Y, lambda x, y : 1 if op(x, y) else 0, X, Y))
+        assert(almost_equal(X.maximum(Y).variance(), self.variance(self.brute_force(X + Y, max, X, Y))))
+
+
+    def variance(self, pmf):
+        mean = sum(x * p for x, p in pmf.items())
+        return sum((x - mean) ** 2 * p for x, p in pmf.items())
+
+
+    def test_dependent(self):
+        A = UniformDiscreteRandVar({1, 2, 3})
+        B = BernoulliRandVar(0.4)
+        X = A * 2 + B
+        Y = A * A - B * 3
+        self.assert_pmf(X.maximum(Y).pmf(), self.brute_force(X + Y, max, X, Y))
+        self.assert_pmf((X > Y).pmf(), self.brute_force(X + Y, lambda x, y : 1 if x > y else 0, X, Y))
+        # X and X are equal, so neither is ever larger
+        assert(almost_equal((X > X).mean(), 0))
+        assert(almost_equal((X >= X).mean(), 1))
+
+
+    def test_constants(self):
+        X = UniformDiscreteRandVar({1, 2, 3, 4})
+        self.assert_pmf(X.minimum(3).pmf(), {1: 0.25, 2: 0.25, 3: 0.5})
+        self.assert_pmf(X.maximum(2.5).pmf(), {2.5: 0.5, 3: 0.25, 4: 0.25})
+        assert(almost_equal((X > 2).mean(), 0.5))
+        assert(almost_equal(X.indicator({1, 4}).mean(), 0.5))
+        assert(almost_equal(X.indicator(lambda x : x % 2 == 0).mean(), 0.5))
+        with pytest.raises(ValueError):
+            X.maximum('a')
+
+
+    def test_sample_batch(self):
+        X = BinomialRandVar(6, 0.3)
+        Y = UniformDiscreteRandVar({-1, 2, 4, 9})
+        Z = X.maximum(Y) + (X < Y) + X.minimum(3)
+        batch = {}
+        samples = Z.sample_batch(1000, batch)
+        x = batch[X]
+        y = batch[Y]
+        assert((samples == np.maximum(x, y) + (x < y) + np.minimum(x, 3)).all())
+
+
+    def test_sweep(self):
+        rates = np.linspace(0.1, 0.9, 5)
+        X = BinomialRandVar(4, 0.4)
+        Y = UniformDiscreteRandVar({0, 2, 5})
+        result = sweep(X.maximum(Y) + (X > Y), {X: {'success_rate': rates}})
+        for i, rate in enumerate(rates):
+            X2 = BinomialRandVar(4, rate)
+            assert(almost_equal(result.mean[i], (X2.maximum(Y) + (X2 > Y)).mean()))
+
+
+class TestSweep:
+
+    def test_success_rate(self):
+        rates = np.linspace(0.1, 0.9, 50)
+        X = BinomialRandVar(4, 0.4)
+        L = UniformDiscreteRandVar({4, 5, 6})
+        Z = (L + 1) * (X * 1150 - 150) + X * X
+        result = sweep(Z, {X: {'success_rate': rates}}, quantiles=[0.1, 0.5])
+        assert(result.mean.shape == (50,))
+        for i in [0, 17, 49]:
+            X2 = BinomialRandVar(4, rates[i])
+            Z2 = (L + 1) * (X2 * 1150 - 150) + X2 * X2
+            assert(almost_equal(result.mean[i], Z2.mean(), 1e-6))
+            assert(almost_equal(result.variance[i], Z2.variance(), 1e-4))
+            assert(result.quantiles[0.1][i] == Z2.quantile(0.1))
+            assert(result.quantiles[0.5][i] == Z2.quantile(0.5))
+        # The original parameters are restored
+        assert(X.success_rate == 0.4)
+        assert(almost_equal(X.mean(), 1.6))
+
+
+    def test_probabilities(self):
+        A = RootDiscreteRandVar({1000, -150}, lambda x : 0.4 if x == 1000 else 0.6)
+        B = BernoulliRandVar(0.5)
+        Z = UnaryDiscreteRandVar(A + B, np.abs)
+        table = np.asarray([[1 - p, p] for p in np.linspace(0, 1, 11)])
+        result = sweep(Z, {A: {'probabilities': table}, B: {'success_rate': np.full(11, 0.2)}})
+        np.testing.assert_allclose(result.mean, 149.8 + (1000.2 - 149.8) * np.linspace(0, 1, 11))
+        assert(almost_equal(Z.mean(), 0.4 * 1000.5 + 0.6 * (149.5)))
+
+
+    def test_closed_form_root(self):
+        X = BernoulliRandVar(0.5)
+        with pytest.raises(ValueError):
+            sweep(X, {X: {'probabilities': [[0.5, 0.5]]}})
+        assert(almost_equal(X.mean(), 0.5))
+
+
+class TestSensitivity:
+
+    def finite_difference(self, build, rate, h=1e-6):
+        up = build(rate + h)
+        down = build(rate - h)
+        return (up.mean() - down.mean()) / (2 * h), (up.variance() - down.variance()) / (2 * h)
+
+
+    def test_probabilities(self):
+        A = RootDiscreteRandVar({1, 2, 3}, lambda x : x / 6)
+        Z = A * A + A * 2
+        gradient = Z.mean_gradient()
+        # The derivative with respect to P(A = x) is E[Z | A = x]
+        np.testing.assert_allclose(gradient[A], [3, 8, 15])
+
+
+    def test_success_rate(self):
+        L = UniformDiscreteRandVar({4, 5, 6})
+
+        def build(rate):
+            X = BinomialRandVar(4, rate)
+            B = BernoulliRandVar(rate)
+            return (L + 1) * (X * 1150 - 150) + X * X + UnaryDiscreteRandVar(X + B, lambda x : x ** 3)
+
+        for rate in [0.3, 0.5]:
+            Z = build(rate)
+            sensitivities = Z.sensitivities()
+            X, B = [rrv for rrv in Z.roots() if rrv is not L and type(rrv) is BinomialRandVar][0], \
+                   [rrv for rrv in Z.roots() if type(rrv) is BernoulliRandVar][0]
+            total_mean = sensitivities[X].mean_parameter('success_rate') + sensitivities[B].mean_parameter('success_rate')
+            total_variance = sensitivities[X].variance_parameter('success_rate') + \
+                             sensitivities[B].variance_parameter('success_rate')
+            expected_mean, expected_variance = self.finite_difference(build, rate)
+            assert(almost_equal(total_mean, expected_mean, 1e-3))
+            assert(almost_equal(total_variance, expected_variance, 1e-1))
+
+
+    def test_dependent_product(self):
+        A = RootDiscreteRandVar({1, 2}, lambda x : 0.5)
+        B = RootDiscreteRandVar({0, 1}, lambda x : 0.5)
+        Z = (A + B) * (A - B)
+        gradient = Z.mean_gradient()
+        # E[Z | A = a] = a^2 - E[B^2] and E[Z | B = b] = E[A^2] - b^2
+        np.testing.assert_allclose(gradient[A], [0.5, 3.5])
+        np.testing.assert_allclose(gradient[B], [2.5, 1.5])
+
+
+    def test_decomposition(self):
+        # Sums and transformations of sums propagate derivatives through the
+        # decomposition of the variance, without enumerating the roots
+        uniforms = [UniformDiscreteRandVar({0, 1, 2}) for _ in range(6)]
+
+        def build_sum(rate):
+            S = BinomialRandVar(3, rate)
+            for U in uniforms:
+                S = S + U
+            return S * 2 + 1
+
+        def build_unary(rate):
+            return UnaryDiscreteRandVar(build_sum(rate), lambda x : x * x)
+
+        for build in [build_sum, build_unary]:
+            Z = build(0.3)
+            X = [rrv for rrv in Z.roots() if type(rrv) is BinomialRandVar][0]
+            with alea.profile() as report:
+                sensitivities = Z.sensitivities()
+            assert(sum(report.combinations.values()) < 1000)
+            expected_mean, expected_variance = self.finite_difference(build, 0.3)
+            assert(almost_equal(sensitivities[X].mean_parameter('success_rate'), expected_mean, 1e-3))
+            assert(almost_equal(sensitivities[X].variance_parameter('success_rate'), expected_variance, 1e-2))
+
+
+    def test_unknown_parameter(self):
+        X = BernoulliRandVar(0.5)
+        with pytest.raises(ValueError):
+            (X * 2).sensitivities()[X].mean_parameter('trials')
+
+
+class TestRootMask:
+
+    def test_masks(self):
+        X = BinomialRandVar(3, 0.5)
+        Y = BernoulliRandVar(0.5)
+        Z = UniformDiscreteRandVar({1, 2})
+        A = X * Y + 1
+        B = Y + Z
+        assert(bin(X.root_mask()).count('1') == 1)
+        assert(A.root_mask() == X.root_mask() | Y.root_mask())
+        assert(A.root_mask() & B.root_mask() == Y.root_mask())
+        assert(A.roots() == {X, Y})
+        # Random variables with a single parent share its mask
+        assert(UnaryDiscreteRandVar(A, abs).root_mask() is A.root_mask())
+
+
+    def test_ids_reused(self):
+        X = BernoulliRandVar(0.5)
+        Y = BernoulliRandVar(0.5)
+        mask = Y.root_mask()
+        del Y
+        gc.collect()
+        Z = BernoulliRandVar(0.5)
+        # The smallest free id is reused
+        assert(Z.root_mask() <= mask)
+        assert((X + Z).roots() == {X, Z})
+
+
+class TestMarkovChain:
+
+    states = [-1, 0, 2]
+    initial = [0.5, 0.3, 0.2]
+    transitions = [[0.7, 0.2, 0.1], [0.3, 0.4, 0.3], [0.1, 0.3, 0.6]]
+
+
+    def paths(self, steps):
+        # Enumerates every path along with its probability
+        paths = {}
+        for path in itertools.product(range(3), repeat=steps):
+            p = self.initial[path[0]]
+            for i, j in zip(path, path[1:]):
+                p *= self.transitions[i][j]
+            paths[tuple(self.states[i] for i in path)] = p
+        return paths
+
+
+    def test_states(self):
+        C = MarkovChainRandVar(self.states, self.initial, self.transitions, 4)
+        paths = self.paths(4)
+        X1, X3 = C.state(1), C.state(3)
+        mean = sum(p * path[3] for path, p in paths.items())
+        product = sum(p * path[1] * path[3] for path, p in paths.items())
+        assert(almost_equal(X3.mean(), mean))
+        assert(almost_equal(X1.covariance(X3), product - X1.mean() * mean))
+        # Products of states enumerate the paths, and agree with the closed form
+        assert(almost_equal((X1 * X3).mean(), product))
+        np.testing.assert_allclose(C.marginals()[3], C.marginal(3))
+        assert(len(C.path()) == 4)
+
+
+    def test_sum(self):
+        C = MarkovChainRandVar(self.states, self.initial, self.transitions, 4)
+        S = C.sum()
+        pmf = {}
+        for path, p in self.paths(4).items():
+            pmf[sum(path)] = pmf.get(sum(path), 0) + p
+        mean = sum(x * p for x, p in pmf.items())
+        assert(almost_equal(S.mean(), mean))
+        assert(almost_equal(S.variance(), sum(x * x * p for x, p in pmf.items()) - mean * mean))
+        assert(pmf.keys() == S.pmf().keys())
+        assert(all(almost_equal(S.pmf()[x], p) for x, p in pmf.items()))
+
+
+    def test_sample_paths(self):
+        C = MarkovChainRandVar(self.states, self.initial, self.transitions, 250)
+        paths = C.sample_paths(4000)
+        assert(paths.shape == (4000, 250))
+        S = C.sum()
+        assert(almost_equal(paths.sum(axis=1).mean(), S.mean(), 6 * math.sqrt(S.variance() / 4000)))
+        batch = {}
+        sums = S.sample_batch(100, batch)
+        # The chain is sampled as a matrix of the indices of its states
+        assert(batch[C].shape == (100, 250))
+        np.testing.assert_array_equal(C.state(7).sample_batch(100, batch), np.asarray(self.states)[batch[C][:, 7]])
+        np.testing.assert_array_equal(sums, np.asarray(self.states)[batch[C]].sum(axis=1))
+        # A path has no mean or variance of its own
+        with pytest.raises(ValueError):
+            C.mean()
+        with pytest.raises(ValueError):
+            C.variance()
+
+
+    def test_root(self):
+        C = MarkovChainRandVar(self.states, self.initial, self.transitions, 4)
+        paths = self.paths(4)
+        # Path indices enumerate the paths in order
+        values, probabilities = C.support()
+        np.testing.assert_allclose(probabilities, list(paths.values()))
+        assert(C.sample().shape == (4,))
+        assert(C.sample_batch(100).shape == (100, 4))
+        X = C.state(2)
+        for method in ['control', 'antithetic', 'stratified', 'qmc']:
+            estimate = X.estimate_mean(4000, method=method)
+            assert(almost_equal(estimate.mean, X.mean(), 6 * estimate.standard_error + 1e-9))
+        # The mean of the sum changes by the sum of a path for every unit of its probability
+        sensitivity = C.sum().sensitivities()[C]
+        sums = np.asarray([sum(path) for path in paths])
+        np.testing.assert_allclose(sensitivity.mean - sums, sensitivity.mean[0] - sums[0], atol=1e-9)
+        assert(alea.discrete.serialize([C]).build()[0].structural_hash() == C.structural_hash())
+        with pytest.raises(ValueError):
+            alea.discrete.serialize([X])
+        # Long chains cannot be enumerated
+        C = MarkovChainRandVar(self.states, self.initial, self.transitions, 250)
+        with pytest.raises(ValueError):
+            C.support()
+        with pytest.raises(ValueError):
+            C.state(1).estimate_mean(100, method='antithetic')
+
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            MarkovChainRandVar(self.states, [0.5, 0.5], self.transitions, 4)
+        with pytest.raises(ValueError):
+            MarkovChainRandVar(self.states, self.initial, [[1, 0, 0]] * 2 + [[0.5, 0.6, 0]], 4)
+        C = MarkovChainRandVar(self.states, self.initial, self.transitions, 250)
+        with pytest.raises(ValueError):
+            C.state(250)
+        with pytest.raises(ValueError):
+            (C.state(1) * C.state(2)).mean()
+
+
+class TestApproximation:
+
+    def build(self):
+        terms = [BinomialRandVar(3, 0.05 + 0.02 * (i % 4)) for i in range(32)]
+        while len(terms) > 1:
+            terms = [terms[i] + terms[i + 1] for i in range(0, len(terms), 2)]
+        return terms[0] * 2 + UniformDiscreteRandVar({0, 1, 2}) + 1
+
+
+    def test_accuracy(self):
+        X = self.build()
+        for method in ['normal', 'edgeworth']:
+            approximation = X.approximation(method)
+            assert(almost_equal(approximation.mean, X.mean()))
+            assert(almost_equal(approximation.standard_deviation ** 2, X.variance()))
+            for x in [10, 16, 24, 32]:
+                # Halfway between consecutive values of the lattice
+                assert(abs(X.cdf(x + 0.5, approx=method) - X.cdf(x)) <= approximation.error_bound)
+        # Edgeworth corrects the skewness of the sum
+        errors = {method: max(abs(X.cdf(x + 0.5, method) - X.cdf(x)) for x in range(40))
+                  for method in ['normal', 'edgeworth']}
+        assert(errors['edgeworth'] < errors['normal'] / 2)
+        for x in [10, 16, 24, 32]:
+            assert(almost_equal(X.cdf(x + 0.5, 'edgeworth') + X.tail_probability(x + 0.5, 'edgeworth'), 1))
+        assert(abs(X.quantile(0.95, 'edgeworth') - X.quantile(0.95)) < 1)
+
+
+    def test_lattice(self):
+        # The continuity correction evaluates the approximations halfway to the next value
+        X = PoissonRandVar(3.0)
+        assert(abs(X.cdf(3, approx='normal') - X.cdf(3)) < 0.05)
+        assert(abs(X.cdf(3, approx='edgeworth') - X.cdf(3)) < 0.005)
+        S = BernoulliRandVar(0.1)
+        for _ in range(199):
+            S = S + BernoulliRandVar(0.1)
+        for x in [15, 20, 25, 30]:
+            errors = {method: abs(S.cdf(x, method) - S.cdf(x)) for method in ['normal', 'edgeworth']}
+            assert(errors['edgeworth'] < min(errors['normal'], 0.001))
+            assert(S.cdf(x + 0.7, 'edgeworth') == S.cdf(x, 'edgeworth'))
+        assert(S.quantile(0.9, 'edgeworth') == S.quantile(0.9))
+        # Scales and shifts move the lattice
+        A = (S * 0.5 + 3).approximation('edgeworth')
+        assert(A.lattice_span == 0.5 and A.lattice_offset == 3)
+        assert(almost_equal(A.cdf(15.5), S.cdf(25, 'edgeworth')))
+        assert((S + RootDiscreteRandVar({0, 0.3}, lambda x : 0.5)).approximation().lattice_span is None)
+
+
+    def test_moments(self):
+        X = BinomialRandVar(10, 0.2)
+        A = X.approximation('edgeworth')
+        Y = RootDiscreteRandVar(set(range(11)), lambda k : X.pmf()[k])
+        B = Y.approximation('edgeworth')
+        assert(almost_equal(A.skewness, B.skewness))
+        assert(almost_equal(A.excess_kurtosis, B.excess_kurtosis))
+        # Splitting the Binomial random variable into its trials tightens the bound
+        assert(A.error_bound < B.error_bound)
+        assert(almost_equal(PoissonRandVar(4).approximation('edgeworth').skewness, 0.5))
+
+
+    def test_deep_sum(self):
+        rates = [0.1 + 0.8 * i / 1500 for i in range(1500)]
+        S = BernoulliRandVar(rates[0])
+        for p in rates[1:]:
+            S = S + BernoulliRandVar(p)
+        A = (S * 2 + 1).approximation('edgeworth')
+        assert(almost_equal(A.mean, 2 * sum(rates) + 1))
+        assert(almost_equal(A.standard_deviation ** 2, 4 * sum(p * (1 - p) for p in rates)))
+        assert(A.lattice_span == 2)
+        assert(almost_equal(S.cdf(sum(rates) - 0.5, approx='normal'), 0.5, 0.05))
+
+
+    def test_invalid(self):
+        X = BernoulliRandVar(0.5)
+        with pytest.raises(ValueError):
+            X.cdf(0, approx='poisson')
+        with pytest.raises(ValueError):
+            X.quantile(1, approx='normal')
+        assert((X * 0 + 1).cdf(1, approx='normal') == 1)
@@ -1,7 +1,8 @@
 import pytest
 
-from alea import RandVec
-from alea.discrete import DiscreteRandVec, RootDiscreteRandVar
+from alea import RandVec, profile
+from alea.discrete import DiscreteRandVec, RootDiscreteRandVar, ArrayDiscreteRandVec, serialize, persistent_cache
+from alea.discrete import array_randvar
 
 import numpy as np
 
@@ -54,3 +55,91 @@ class TestDependentVector:
         X = DiscreteRandVec(support, pmf)
 
         np.testing.assert_allclose(X.variance(), np.ones((3, 3)) * 6)
+
+
+class TestVectorBatch:
+
+    def test_sample_batch(self):
+        support = {(1, 2, 3), (4, 5, 6), (7, 8, 9)}
+        pmf = lambda _ : 1.0/3
+        X = DiscreteRandVec(support, pmf)
+        samples = X.sample_batch(1000)
+        assert(samples.shape == (1000, 3))
+        np.testing.assert_array_equal(samples[:, 1], samples[:, 0] + 1)
+        np.testing.assert_allclose(samples.mean(axis=0), [4, 5, 6], atol=0.5)
+
+
+class TestArrayVector:
+
+    def build(self):
+        values = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 10]], dtype=np.float64)
+        probabilities = np.array([0.2, 0.3, 0.5])
+        return values, probabilities, DiscreteRandVec({tuple(row) for row in values.tolist()},
+                                                      lambda x : probabilities[int(x[0]) // 3])
+
+
+    def test_moments(self, monkeypatch):
+        values, probabilities, expected = self.build()
+        # Small chunks exercise the chunked calculations
+        monkeypatch.setattr(array_randvar, 'CHUNK_BYTES', 16)
+        X = ArrayDiscreteRandVec(values, probabilities)
+        assert(len(X) == 3)
+        np.testing.assert_allclose(X.mean(), expected.mean())
+        np.testing.assert_allclose(X.variance(), expected.variance())
+        # Columns answer the same as the vector
+        Y = ArrayDiscreteRandVec(values, probabilities)
+        assert(almost_equal(Y.randvars[2].variance(), X.variance()[2][2]))
+        assert(almost_equal(Y.randvars[0].covariance(Y.randvars[2]), X.variance()[0][2]))
+        assert(Y.randvars[1].pmf() == {2.0: 0.2, 5.0: 0.3, 8.0: 0.5})
+
+
+    def test_memmap(self, tmp_path):
+        values, probabilities, expected = self.build()
+        np.save(str(tmp_path / 'values.npy'), values)
+        np.save(str(tmp_path / 'probabilities.npy'), probabilities)
+        X = DiscreteRandVec.from_arrays(str(tmp_path / 'values.npy'), str(tmp_path / 'probabilities.npy'))
+        assert(isinstance(X.values, np.memmap))
+        np.testing.assert_allclose(X.mean(), expected.mean())
+        # Columns combine with other random variables like any other
+        A = X.randvars[0] * X.randvars[1] + X.randvars[2]
+        assert(almost_equal(A.mean(), 0.2 * 5 + 0.3 * 26 + 0.5 * 66))
+        assert(almost_equal(serialize([A]).build()[0].mean(), A.mean()))
+
+
+    def test_evaluation(self, monkeypatch, tmp_path):
+        values, probabilities, _ = self.build()
+        X = ArrayDiscreteRandVec(values, probabilities)
+        with profile() as report:
+            X.variance()
+        assert(report.calls[('ArrayDiscreteRandVec', '_new_mean')] == 1)
+        assert(report.calls[('ArrayDiscreteRandVec', '_new_covariance')] == 1)
+
+        # Hashes and serialization read the arrays, never the mass function
+        # of the root or the function of a column
+        def fail(*args):
+            raise AssertionError("The arrays were converted to Python objects")
+        monkeypatch.setattr(array_randvar.ArrayRootDiscreteRandVar, '_new_pmf', fail)
+        monkeypatch.setattr(array_randvar.ColumnDiscreteRandVar, '_column_values', fail)
+        Y = ArrayDiscreteRandVec(values, probabilities)
+        A = Y.randvars[0] + Y.randvars[2]
+        assert(serialize([A]).build()[0].structural_hash() == A.structural_hash())
+        with persistent_cache(str(tmp_path / 'cache.db')) as cache:
+            np.testing.assert_allclose(Y.mean(), X.mean())
+            assert(len(cache) == 3)
+
+
+    def test_sample_batch(self):
+        values, probabilities, _ = self.build()
+        X = ArrayDiscreteRandVec(values, probabilities)
+        samples = X.sample_batch(10000)
+        assert(samples.shape == (10000, 3))
+        np.testing.assert_array_equal(samples[:, 1], samples[:, 0] + 1)
+        np.testing.assert_allclose(samples.mean(axis=0), X.mean(), atol=0.2)
+        assert(X.randvars[0].sample() in {1, 4, 7})
+
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            ArrayDiscreteRandVec(np.zeros(3), np.ones(3) / 3)
+        with pytest.raises(ValueError):
+            ArrayDiscreteRandVec(np.zeros((3, 2)), np.ones(2) / 2)
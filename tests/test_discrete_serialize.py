@@ -0,0 +1,103 @@
+import pytest
+import pickle
+
+from alea import RandVec
+from alea.discrete import PoissonRandVar, NegativeBinomialRandVar, RootDiscreteRandVar, BernoulliRandVar, BinomialRandVar, UniformDiscreteRandVar, \
+    UnaryDiscreteRandVar, BinaryDiscreteRandVar, DiscreteRandVec, serialize, save, load
+
+
+def almost_equal(x, y, epsilon=1e-5):
+    return abs(x - y) <= epsilon
+
+
+class TestSerialize:
+
+    def test_round_trip(self):
+        X = RootDiscreteRandVar({-1, 2}, lambda x : 0.25 if x == -1 else 0.75)
+        Y = BinomialRandVar(4, 0.3)
+        Z = UniformDiscreteRandVar({1, 2, 3})
+        A = UnaryDiscreteRandVar(X * Y + Z, lambda x : max(x - 2, 0))
+        B = (X + 1) * Y
+        model = pickle.loads(pickle.dumps(serialize([A, B])))
+        A2, B2 = model.build()
+        assert(almost_equal(A2.mean(), A.mean()))
+        assert(almost_equal(A2.variance(), A.variance()))
+        assert(almost_equal(B2.variance(), B.variance()))
+        # Dependence between variables serialized together is preserved
+        assert(almost_equal(A2.covariance(B2), A.covariance(B)))
+
+
+    def test_special_roots(self):
+        X = BernoulliRandVar(0.3)
+        Y = BinomialRandVar(5, 0.2)
+        X2, Y2 = serialize([X, Y]).build()
+        assert(type(X2) is BernoulliRandVar)
+        assert(type(Y2) is BinomialRandVar)
+        assert(Y2.trials == 5)
+        assert(almost_equal(X2.mean(), 0.3))
+
+
+    def test_caches(self):
+        X = UniformDiscreteRandVar({1, 2, 3})
+        Y = X * X + X
+        Y.variance()
+        Y.pmf()
+        X.covariance(Y)
+        X2, Y2 = serialize([X, Y]).build()
+        assert(Y2.saved_mean == Y.saved_mean)
+        assert(Y2.saved_variance == Y.saved_variance)
+        assert(Y2.saved_pmf == Y.saved_pmf)
+        assert(X2.saved_covariances[Y2] == X.saved_covariances[Y])
+
+
+    def test_vector(self, tmp_path):
+        V = DiscreteRandVec({(1, 2), (3, 5), (4, 4)}, lambda x : 1 / 3)
+        W = RandVec([V.randvars[0] + 1])
+        path = str(tmp_path / 'model.npz')
+        save(path, [V, W])
+        V2, W2 = load(path)
+        assert(len(V2) == 2)
+        assert(almost_equal(V2.variance()[0][1], V.variance()[0][1]))
+        assert(almost_equal(V2.randvars[0].covariance(W2.randvars[0]), V.randvars[0].variance()))
+
+
+    def test_order(self):
+        X = BinomialRandVar(4, 0.3)
+        Y = UniformDiscreteRandVar({0, 2, 5})
+        A = X.maximum(Y) + X.minimum(Y) * (X <= Y) + X.minimum(2) + (X > 1)
+        A2, = serialize([A]).build()
+        assert(almost_equal(A2.mean(), A.mean()))
+        assert(almost_equal(A2.variance(), A.variance()))
+
+
+    def test_binary(self, tmp_path):
+        X = BinomialRandVar(4, 0.3) + 1
+        Y = UniformDiscreteRandVar({1, 2, 5})
+        A = X / Y + (X % Y) * Y
+        B = UnaryDiscreteRandVar(X, lambda x : x * x) + BinaryDiscreteRandVar(X, Y, lambda x, y : min(x, y))
+        path = str(tmp_path / 'model.npz')
+        save(path, [A, B])
+        A2, B2 = load(path)
+        assert(almost_equal(A2.mean(), A.mean()))
+        assert(almost_equal(A2.variance(), A.variance()))
+        assert(almost_equal(A2.covariance(B2), A.covariance(B)))
+
+
+    def test_truncated(self):
+        X = PoissonRandVar(3, 1e-9)
+        Y = NegativeBinomialRandVar(2.5, 0.4)
+        X2, Y2 = serialize([X, Y]).build()
+        assert(type(X2) is PoissonRandVar)
+        assert(X2.tolerance == 1e-9)
+        assert(Y2.successes == 2.5)
+        assert(almost_equal(Y2.variance(), Y.variance()))
+
+
+    def test_rewritten(self):
+        X1 = BinomialRandVar(4, 0.4)
+        X2 = BinomialRandVar(4, 0.4)
+        Z = (X1 * 1150 - 150) + (X2 * 1150 - 150)
+        Z2, X12 = serialize([Z, X1]).build()
+        assert(type(Z2) is type(Z))
+        assert(almost_equal(Z2.variance(), Z.variance()))
+        assert(almost_equal(Z2.covariance(X12), Z.covariance(X1)))
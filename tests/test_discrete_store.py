@@ -0,0 +1,72 @@
+import pytest
+import gc
+
+from alea.discrete import RootDiscreteRandVar, BernoulliRandVar, BinomialRandVar, UniformDiscreteRandVar, \
+    UnaryDiscreteRandVar, PoissonRandVar, GraphStore, serialize
+
+
+def almost_equal(x, y, epsilon=1e-5):
+    return abs(x - y) <= epsilon
+
+
+class TestGraphStore:
+
+    def test_closed_forms(self):
+        X = BinomialRandVar(4, 0.3)
+        Y = UniformDiscreteRandVar({1, 2, 3})
+        Z = RootDiscreteRandVar({-1, 2}, lambda x : 0.25 if x == -1 else 0.75)
+        A = (X * 2 + 1) * 3 + Y + Z + PoissonRandVar(2)
+        store = GraphStore(serialize([A]))
+        handle, = store.outputs()
+        assert(almost_equal(handle.mean(), A.mean()))
+        # Means of sums and affine maps never build any random variables
+        assert(len(store.nodes) == 0)
+        assert(almost_equal(store.handle(0).variance(), X.variance()))
+        assert(almost_equal(handle.variance(), A.variance()))
+
+
+    def test_build_on_demand(self, tmp_path):
+        X = BinomialRandVar(4, 0.3)
+        Y = BernoulliRandVar(0.5)
+        A = UnaryDiscreteRandVar(X * Y, lambda x : x * x) + X
+        B = X + 1
+        path = str(tmp_path / 'model.npz')
+        serialize([A, B]).save(path)
+        store = GraphStore.load(path)
+        handleA, handleB = store.outputs()
+        assert(almost_equal(handleB.mean(), 2.2))
+        assert(almost_equal(handleA.mean(), A.mean()))
+        assert(almost_equal(handleA.variance(), A.variance()))
+        assert(almost_equal(handleA.node().covariance(handleB.node()), A.covariance(B)))
+        # Results are written back into the arrays
+        assert(almost_equal(store.model.means[handleA.index], A.mean()))
+
+
+class TestSlots:
+
+    def test_no_dict(self):
+        X = BinomialRandVar(4, 0.3)
+        for rv in [X, X + 1, X * X, X.maximum(X), UnaryDiscreteRandVar(X, abs), PoissonRandVar(2)]:
+            assert(not hasattr(rv, '__dict__'))
+
+
+    def test_children(self):
+        X = BernoulliRandVar(0.5)
+        Y = X + X
+        assert(Y.parents == (X,))
+        assert(X.children == [Y])
+        del Y
+        gc.collect()
+        assert(X.children == [])
+        assert(len(X.saved_covariances) == 0)
+
+
+    def test_read_only_covariances(self):
+        X = BernoulliRandVar(0.5)
+        Y = BernoulliRandVar(0.5)
+        # The cache is read-only whether or not it holds anything
+        for _ in range(2):
+            with pytest.raises(TypeError):
+                X.saved_covariances[Y] = 0
+            X.covariance(Y)
+        assert(X.saved_covariances[Y] == 0)
@@ -0,0 +1,59 @@
+import pytest
+
+import alea
+from alea import export_samples, SampleWriter
+from alea.discrete import BinomialRandVar, BernoulliRandVar, DiscreteRandVec
+
+import numpy as np
+
+
+class TestExport:
+
+    def test_joint_samples(self, tmp_path):
+        path = str(tmp_path / 'samples.npy')
+        X = BinomialRandVar(5, 0.5)
+        V = DiscreteRandVec({(1, 2), (3, 4)}, lambda _ : 0.5)
+        assert(export_samples(path, [X, X + 1, V], 2500, batch_size=1000) == 2500)
+        samples = np.load(path, mmap_mode='r')
+        assert(samples.shape == (2500, 4))
+        np.testing.assert_array_equal(samples[:, 1], samples[:, 0] + 1)
+        np.testing.assert_array_equal(samples[:, 3], samples[:, 2] + 1)
+        assert(abs(samples[:, 0].mean() - 2.5) < 0.2)
+
+
+    def test_threaded_append(self, tmp_path):
+        path = str(tmp_path / 'samples.npy')
+        X = BernoulliRandVar(0.5)
+        export_samples(path, [X], 1000, batch_size=64, dtype=np.int8, threaded=True)
+        assert(export_samples(path, [X], 500, batch_size=64, dtype=np.int8, append=True, threaded=True) == 1500)
+        samples = np.load(path)
+        assert(samples.shape == (1500, 1))
+        assert(samples.dtype == np.int8)
+        assert(set(np.unique(samples).tolist()) <= {0, 1})
+
+
+    def test_writer(self, tmp_path):
+        path = str(tmp_path / 'samples.npy')
+        with SampleWriter(path, 2) as writer:
+            writer.write(np.array([[1, 2], [3, 4]]))
+            with pytest.raises(ValueError):
+                writer.write(np.zeros((1, 3)))
+        with SampleWriter(path, 2, append=True) as writer:
+            writer.write(np.array([[5, 6]]))
+        np.testing.assert_array_equal(np.load(path), [[1, 2], [3, 4], [5, 6]])
+        with pytest.raises(ValueError):
+            SampleWriter(path, 3, append=True)
+
+
+    def test_errors(self, tmp_path, monkeypatch):
+        X = BernoulliRandVar(0.5)
+        path = str(tmp_path / 'samples.npy')
+        with pytest.raises(ValueError):
+            export_samples(path, [X], 1000, batch_size=0)
+
+        def fail(writer, samples):
+            raise IOError("Disk full")
+        # Failures in the writing thread are raised by the sampling thread
+        monkeypatch.setattr(SampleWriter, 'write', fail)
+        with pytest.raises(IOError):
+            export_samples(path, [X], 1000, batch_size=10, threaded=True, queue_size=1)
@@ -0,0 +1,62 @@
+import pytest
+
+import alea
+from alea.discrete import BinomialRandVar, UniformDiscreteRandVar, UnaryDiscreteRandVar
+
+
+class TestProfile:
+
+    def test_disabled(self):
+        X = BinomialRandVar(3, 0.5)
+        with alea.profile() as report:
+            pass
+        X.mean()
+        assert(len(report.calls) == 0)
+        assert(alea.profiling.current is None)
+
+
+    def test_deep_graph(self):
+        # Without a profile, evaluating a node only adds the frames of its
+        # own calculation to the stack
+        X = BinomialRandVar(3, 0.5)
+        S = X
+        for _ in range(400):
+            S = S + BinomialRandVar(3, 0.5) * 2
+        assert(S.mean() == 1.5 * 801)
+
+
+    def test_calls_and_caches(self):
+        X = BinomialRandVar(3, 0.5)
+        Y = X + 1
+        with alea.profile() as report:
+            Y.mean()
+            Y.mean()
+        assert(report.calls[('ConstantPlusDiscreteRandVar', '_new_mean')] == 1)
+        assert(report.calls[('BinomialRandVar', '_new_mean')] == 1)
+        assert(report.cache_misses['mean'] == 2)
+        assert(report.cache_hits['mean'] == 1)
+        assert(report.wall_time > 0)
+        assert(report.self_time[('BinomialRandVar', '_new_mean')] <= report.total_time[('ConstantPlusDiscreteRandVar', '_new_mean')])
+
+
+    def test_combinations(self):
+        X = UniformDiscreteRandVar({1, 2, 3})
+        Y = UniformDiscreteRandVar({1, 2})
+        with alea.profile() as report:
+            (X * (X + Y)).mean()
+            UnaryDiscreteRandVar(X * (X + Y), lambda x : x * x).mean()
+        assert(report.combinations[('DiscreteTimesDiscreteRandVar', '_new_mean')] == 3)
+        assert(report.combinations[('DiscreteTimesDiscreteRandVar', '_new_pmf')] == 3)
+
+
+    def test_covariance_and_report(self):
+        X = BinomialRandVar(3, 0.5)
+        Y = X * 2
+        with alea.profile() as report:
+            X.covariance(Y)
+            Y.covariance(X)
+        assert(report.calls[('BinomialRandVar', '_new_covariance')] == 1)
+        assert(report.cache_hits['covariance'] == 1)
+        hottest = report.hottest(1)
+        assert(len(hottest) == 1)
+        assert('covariance' in str(report))
@@ -0,0 +1,50 @@
+import pytest
+import numpy as np
+
+from alea.qmc import primes, halton, latin_hypercube
+from alea.discrete import BinomialRandVar, UniformDiscreteRandVar
+
+
+class TestSequences:
+
+    def test_primes(self):
+        assert(primes(6) == [2, 3, 5, 7, 11, 13])
+
+
+    def test_halton(self):
+        points = halton(4, 2, scramble=False)
+        np.testing.assert_allclose(points[:, 0], [0, 0.5, 0.25, 0.75])
+        np.testing.assert_allclose(points[:, 1], [0, 1 / 3, 2 / 3, 1 / 9])
+
+
+    def test_scrambled_halton(self):
+        points = halton(1000, 30)
+        assert(points.shape == (1000, 30))
+        assert(np.all((points >= 0) & (points < 1)))
+        # Every coordinate should still fill [0, 1) evenly
+        for j in range(30):
+            counts = np.histogram(points[:, j], bins=10, range=(0, 1))[0]
+            assert(np.all(np.abs(counts - 100) < 30))
+
+
+    def test_latin_hypercube(self):
+        points = latin_hypercube(100, 3)
+        for j in range(3):
+            np.testing.assert_array_equal(np.sort(np.floor(points[:, j] * 100)), np.arange(100))
+
+
+class TestQuasiMonteCarlo:
+
+    def test_estimate_mean(self):
+        total = UniformDiscreteRandVar(set(range(10)))
+        for _ in range(9):
+            total = total + BinomialRandVar(10, 0.4) * 0.5
+        estimate = total.estimate_mean(10000, 'qmc')
+        assert(abs(estimate.mean - total.mean()) <= 6 * estimate.standard_error)
+        assert(estimate.variance_reduction > 1)
+
+
+    def test_replicates(self):
+        X = BinomialRandVar(10, 0.4)
+        estimate = X.estimate_mean(1000, 'qmc', replicates=5)
+        assert(estimate.trials == 1000)